@@ -1,21 +1,54 @@
 import asyncio
-from typing import AsyncGenerator, Dict, List, Optional, Set
+import re
+from functools import partial
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Set, Tuple
 
 import aiohttp
-from aiohttp_retry import ExponentialRetry, RetryClient
+from aiohttp_retry import RetryClient
 
+from validator.concurrency import (
+    AdaptiveLimiter,
+    PeerTimings,
+    RequestDeadlines,
+    schedule_by_size,
+)
+from validator.crawlstate import CrawlState
+from validator.httpcache import HTTPCache
 from validator.status import RouteEntry
-from validator.utils import aio_get_json, route_tasks_to_route_entries
+from validator.utils import (
+    DEFAULT_MAX_BUFFERED_RESPONSES,
+    DecodedRoutes,
+    aio_get_json,
+    aio_get_routes,
+    aio_stream_json,
+    client_or_new,
+    create_client,
+    route_source,
+    route_streams_to_route_entries,
+    route_tasks_to_route_entries,
+)
 
+# Routes of a part of a streamed page, and the request metadata
+RoutesPage = Tuple[List[Dict[str, Any]], Dict[str, Any]]
 
-async def query_rpki_invalid_community(base_url: str, ssl_verify: bool) -> Set[str]:
+# Initial number of concurrent requests
+DEFAULT_CONCURRENCY = 5
+
+NEIGHBOR_ROUTES_URL_RE = re.compile(r"/routeservers/([^/]+)/neighbors/([^/]+)/routes/received")
+
+
+async def query_rpki_invalid_community(
+    base_url: str, ssl_verify: bool, client: Optional[aiohttp.ClientSession] = None
+) -> Set[str]:
     """
     Retrieve the RPKI invalid communities from an Alice LG instance.
     Older only have one community, newer instances may have multiple.
-    Returns empty set if not found.
+    Returns empty set if not found. If client is given, it is used for
+    the request, otherwise a new client is created.
     """
-    async with RetryClient(raise_for_status=False) as client:
-        json, _ = await aio_get_json(client, base_url + "/config", ssl_verify=ssl_verify)
+    create = partial(RetryClient, raise_for_status=False)
+    async with client_or_new(client, create) as session:
+        json, _ = await aio_get_json(session, base_url + "/config", ssl_verify=ssl_verify)
         invalid = json.get("rpki", {}).get("invalid")
         if invalid:
             if isinstance(invalid[0], list):
@@ -27,30 +60,73 @@ async def query_rpki_invalid_community(base_url: str, ssl_verify: bool) -> Set[s
 
 # noinspection PyTypeChecker
 async def get_routes(
-    base_url: str, group: Optional[str] = None, ssl_verify: bool = True
+    base_url: str,
+    group: Optional[str] = None,
+    ssl_verify: bool = True,
+    limiter: Optional[AdaptiveLimiter] = None,
+    stream_json: bool = False,
+    max_buffered_responses: int = DEFAULT_MAX_BUFFERED_RESPONSES,
+    cache: Optional[HTTPCache] = None,
+    crawl_state: Optional[CrawlState] = None,
+    timings: Optional[PeerTimings] = None,
+    deadlines: Optional[RequestDeadlines] = None,
+    client: Optional[aiohttp.ClientSession] = None,
 ) -> AsyncGenerator[RouteEntry, None]:
     """
     Get the routes from an Alice LG instance, given a base URL.
     Optionally filters for a particular group. Returns a RouteEntry
-    generator.
+    generator. Paginated neighbor routes are requested concurrently,
+    and each page is processed as soon as it is received.
+    The number of concurrent requests is adjusted by limiter.
+    With stream_json, routes are decoded while responses are received.
+    Requests pause while max_buffered_responses responses, or parts of
+    responses when streaming, are waiting to be processed.
+    If cache is given, responses are cached, and reused while unchanged.
+    If crawl_state is given, neighbors that are unchanged since the
+    previous crawl are skipped, as their previous results are reused.
+    Neighbors are requested largest first, based on their number of
+    received routes. If timings is given, the time taken per neighbor
+    is recorded. If deadlines is given, neighbor requests that miss their
+    deadline are left out, and reported by deadlines.
+    If client is given, it is used for all requests, so that it can be
+    shared with other looking glasses, otherwise a new client is created.
     """
-    connector = aiohttp.TCPConnector(limit=5)
-    options = ExponentialRetry(
-        attempts=5, start_timeout=2, exceptions=[aiohttp.client_exceptions.ContentTypeError]
-    )
-    timeout = aiohttp.ClientTimeout(total=60000)
-    async with RetryClient(
-        retry_options=options, connector=connector, raise_for_status=False, timeout=timeout
-    ) as client:
+    if limiter is None:
+        limiter = AdaptiveLimiter(DEFAULT_CONCURRENCY)
+    async with client_or_new(client, partial(create_client, limiter.ceiling)) as session:
         route_servers, _ = await aio_get_json(
-            client, base_url + "/routeservers", key=["routeservers"], ssl_verify=ssl_verify
+            session,
+            base_url + "/routeservers",
+            key=["routeservers"],
+            ssl_verify=ssl_verify,
+            limiter=limiter,
+            cache=cache,
+            deadlines=deadlines,
         )
         if group:
             route_servers = [r for r in route_servers if r["group"] == group]
 
-        rs_neighbors = await _query_rs_neighbors(base_url, client, route_servers, ssl_verify)
+        rs_neighbors = await _query_rs_neighbors(
+            base_url, session, route_servers, ssl_verify, limiter, cache, deadlines
+        )
+
+        # Pages are either requested as a whole, or streamed
+        request_page = _stream_routes_page if stream_json else _get_routes_page
+
+        def next_pages(metadata: Dict[str, Any]) -> List[Any]:
+            # Remaining pages are requested once the first page has
+            # reported the number of pages.
+            if metadata["page"] != 0 or "total_pages" not in metadata:
+                return []
+            return [
+                request_page(
+                    session, metadata["url"], page, metadata, ssl_verify, limiter, cache, deadlines
+                )
+                for page in range(1, metadata["total_pages"])
+            ]
 
-        tasks = []
+        requests: List[Any] = []
+        sizes: List[Optional[int]] = []
         for peers, metadata in rs_neighbors:
             for peer in peers:
                 if peer["state"] != "up":
@@ -62,24 +138,123 @@ async def get_routes(
                     "peer_name": peer["id"],
                     "route_server": metadata["route_server"],
                 }
-                task = aio_get_json(
-                    client,
-                    url,
-                    key=["imported"],
-                    metadata=peer_request_metadata,
-                    ssl_verify=ssl_verify,
+                if crawl_state is not None and crawl_state.check_neighbor(
+                    route_source("Alice LG", peer_request_metadata), peer
+                ):
+                    continue
+                requests.append(
+                    request_page(
+                        session,
+                        url,
+                        0,
+                        peer_request_metadata,
+                        ssl_verify,
+                        limiter,
+                        cache,
+                        deadlines,
+                    )
                 )
-                tasks.append(asyncio.ensure_future(task))
+                sizes.append(peer.get("routes_received"))
 
-        async for entry in route_tasks_to_route_entries(tasks, "Alice LG"):
+        requests = [requests[index] for index in schedule_by_size(sizes)]
+        if stream_json:
+            entries = route_streams_to_route_entries(
+                requests, "Alice LG", next_pages, max_buffered_responses, timings
+            )
+        else:
+            entries = route_tasks_to_route_entries(
+                requests, "Alice LG", next_pages, max_buffered_responses, limiter.ceiling, timings
+            )
+        async for entry in entries:
             yield entry
 
 
+def neighbor_source(url: str) -> Optional[str]:
+    """
+    Determine the source of the routes of a neighbor from the URL of one of
+    its routes pages, or None if the URL is not of a routes page.
+    """
+    match = NEIGHBOR_ROUTES_URL_RE.search(url)
+    if match is None:
+        return None
+    metadata = {"route_server": match.group(1), "peer_name": match.group(2)}
+    return route_source("Alice LG", metadata)
+
+
+async def _get_routes_page(
+    client: aiohttp.ClientSession,
+    url: str,
+    page: int,
+    metadata: Dict[str, Any],
+    ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter],
+    cache: Optional[HTTPCache],
+    deadlines: Optional[RequestDeadlines],
+) -> Tuple[DecodedRoutes, Dict[str, Any]]:
+    """
+    Query one page of the received routes of a neighbor. Alice LG paginates
+    routes server side, and reports the number of pages with every page.
+    The returned metadata includes the page and the total number of pages.
+    """
+    page_url = f"{url}?page={page}" if page else url
+    other: Dict[str, Any] = {}
+    routes, _ = await aio_get_routes(
+        client,
+        page_url,
+        ["imported"],
+        ssl_verify=ssl_verify,
+        limiter=limiter,
+        other=other,
+        cache=cache,
+        deadlines=deadlines,
+    )
+    pagination = other.get("pagination") or {}
+    page_metadata = dict(metadata, url=url, page=page, total_pages=pagination.get("total_pages", 1))
+    return routes, page_metadata
+
+
+async def _stream_routes_page(
+    client: aiohttp.ClientSession,
+    url: str,
+    page: int,
+    metadata: Dict[str, Any],
+    ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter],
+    cache: Optional[HTTPCache],
+    deadlines: Optional[RequestDeadlines],
+) -> AsyncIterator[RoutesPage]:
+    """
+    Stream one page of the received routes of a neighbor, yielding the routes
+    while they are decoded. As the pagination details may follow the routes
+    in the response, the total number of pages is only included in the
+    metadata of the last, possibly empty, part.
+    """
+    page_url = f"{url}?page={page}" if page else url
+    page_metadata = dict(metadata, url=url, page=page)
+    other: Dict[str, Any] = {}
+    async for routes in aio_stream_json(
+        client,
+        page_url,
+        ["imported"],
+        ssl_verify=ssl_verify,
+        limiter=limiter,
+        other=other,
+        cache=cache,
+        deadlines=deadlines,
+    ):
+        yield routes, page_metadata
+    pagination = other.get("pagination") or {}
+    yield [], dict(page_metadata, total_pages=pagination.get("total_pages", 1))
+
+
 async def _query_rs_neighbors(
     base_url: str,
     client: aiohttp.ClientSession,
     route_servers: List[Dict[str, str]],
     ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter],
+    cache: Optional[HTTPCache],
+    deadlines: Optional[RequestDeadlines],
 ):
     """
     Query the neighbors of a list of route servers, as returned by Alice LG.
@@ -93,6 +268,9 @@ async def _query_rs_neighbors(
             key=["neighbors", "neighbours"],
             metadata={"route_server": route_server["id"]},
             ssl_verify=ssl_verify,
+            limiter=limiter,
+            cache=cache,
+            deadlines=deadlines,
         )
         tasks.append(asyncio.ensure_future(task))
     return await asyncio.gather(*tasks)
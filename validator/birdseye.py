@@ -1,27 +1,75 @@
-import asyncio
-from typing import AsyncGenerator
+from functools import partial
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
 
 import aiohttp
 from aiohttp_retry import RetryClient
 
+from validator.concurrency import (
+    AdaptiveLimiter,
+    PeerTimings,
+    RequestDeadlines,
+    schedule_by_size,
+)
+from validator.httpcache import HTTPCache
 from validator.status import RouteEntry
-from validator.utils import aio_get_json, route_tasks_to_route_entries
+from validator.utils import (
+    DEFAULT_MAX_BUFFERED_RESPONSES,
+    aio_get_json,
+    aio_get_routes,
+    aio_stream_json,
+    client_or_new,
+    route_streams_to_route_entries,
+    route_tasks_to_route_entries,
+)
+
+# Initial number of concurrent requests
+DEFAULT_CONCURRENCY = 10
 
 
 # noinspection PyTypeChecker
-async def get_routes(base_url: str, ssl_verify: bool) -> AsyncGenerator[RouteEntry, None]:
+async def get_routes(
+    base_url: str,
+    ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter] = None,
+    stream_json: bool = False,
+    max_buffered_responses: int = DEFAULT_MAX_BUFFERED_RESPONSES,
+    cache: Optional[HTTPCache] = None,
+    timings: Optional[PeerTimings] = None,
+    deadlines: Optional[RequestDeadlines] = None,
+    client: Optional[aiohttp.ClientSession] = None,
+) -> AsyncGenerator[RouteEntry, None]:
     """
     Get the routes from a Bird's Eye LG instance, given a base URL.
-    Returns a RouteEntry generator.
+    Returns a RouteEntry generator. The number of concurrent requests
+    is adjusted by limiter. With stream_json, routes are decoded while
+    responses are received. Requests pause while max_buffered_responses
+    responses, or parts of responses when streaming, are waiting to be
+    processed. If cache is given, responses are cached, and reused while
+    unchanged. Protocols are requested largest first, based on their number
+    of imported routes. If timings is given, the time taken per protocol
+    is recorded. If deadlines is given, protocol requests that miss their
+    deadline are left out, and reported by deadlines.
+    If client is given, it is used for all requests, so that it can be
+    shared with other looking glasses, otherwise a new client is created.
     """
     base_url = base_url.strip("/")
-    connector = aiohttp.TCPConnector(limit=10)
-    async with RetryClient(connector=connector, raise_for_status=False) as client:
+    if limiter is None:
+        limiter = AdaptiveLimiter(DEFAULT_CONCURRENCY)
+    async with client_or_new(client, partial(_create_client, limiter.ceiling)) as session:
         # Following BIRD terminology, peers are referred to as protocols in Bird's Eye
         url = f"{base_url}/protocols/bgp/"
-        protocols, _ = await aio_get_json(client, url, key=["protocols"], ssl_verify=ssl_verify)
+        protocols, _ = await aio_get_json(
+            session,
+            url,
+            key=["protocols"],
+            ssl_verify=ssl_verify,
+            limiter=limiter,
+            cache=cache,
+            deadlines=deadlines,
+        )
 
-        tasks = []
+        requests: List[Any] = []
+        sizes: List[Optional[int]] = []
         for name, details in protocols.items():
             if details["state"] != "up":
                 continue
@@ -31,10 +79,68 @@ async def get_routes(base_url: str, ssl_verify: bool) -> AsyncGenerator[RouteEnt
                 "peer_as": details["neighbor_as"],
                 "peer_name": name,
             }
-            task = aio_get_json(
-                client, url, key=["routes"], metadata=peer_request_metadata, ssl_verify=ssl_verify
+            sizes.append((details.get("routes") or {}).get("imported"))
+            if stream_json:
+                requests.append(
+                    _stream_routes(
+                        session, url, peer_request_metadata, ssl_verify, limiter, cache, deadlines
+                    )
+                )
+                continue
+            requests.append(
+                aio_get_routes(
+                    session,
+                    url,
+                    ["routes"],
+                    metadata=peer_request_metadata,
+                    ssl_verify=ssl_verify,
+                    limiter=limiter,
+                    cache=cache,
+                    deadlines=deadlines,
+                )
             )
-            tasks.append(asyncio.ensure_future(task))
 
-        async for entry in route_tasks_to_route_entries(tasks, "Bird's Eye"):
+        requests = [requests[index] for index in schedule_by_size(sizes)]
+        if stream_json:
+            entries = route_streams_to_route_entries(
+                requests, "Bird's Eye", max_buffered=max_buffered_responses, timings=timings
+            )
+        else:
+            entries = route_tasks_to_route_entries(
+                requests,
+                "Bird's Eye",
+                max_buffered=max_buffered_responses,
+                workers=limiter.ceiling,
+                timings=timings,
+            )
+        async for entry in entries:
             yield entry
+
+
+async def _stream_routes(
+    client: aiohttp.ClientSession,
+    url: str,
+    metadata: Dict[str, Any],
+    ssl_verify: bool,
+    limiter: AdaptiveLimiter,
+    cache: Optional[HTTPCache],
+    deadlines: Optional[RequestDeadlines],
+) -> AsyncIterator[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    """
+    Stream the routes of a protocol, yielding them while they are decoded.
+    """
+    async for routes in aio_stream_json(
+        client,
+        url,
+        ["routes"],
+        ssl_verify=ssl_verify,
+        limiter=limiter,
+        cache=cache,
+        deadlines=deadlines,
+    ):
+        yield routes, metadata
+
+
+def _create_client(connection_limit: int) -> RetryClient:
+    connector = aiohttp.TCPConnector(limit=connection_limit)
+    return RetryClient(connector=connector, raise_for_status=False)
@@ -0,0 +1,346 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+from urllib.parse import urlsplit
+
+DEFAULT_CONCURRENCY_FLOOR = 2
+DEFAULT_CONCURRENCY_CEILING = 32
+# A request counts as congested when its latency is this many times
+# the smoothed latency, and also at least LATENCY_THRESHOLD seconds,
+# as differences between fast responses are mostly noise.
+LATENCY_TOLERANCE = 3
+LATENCY_THRESHOLD = 0.5
+LATENCY_SMOOTHING = 0.2
+# Latencies of responses larger than LATENCY_SIZE_UNIT bytes are compared
+# per LATENCY_SIZE_UNIT bytes, as large responses take longer to transfer
+# even if the looking glass is not congested.
+LATENCY_SIZE_UNIT = 1024 * 1024
+DECREASE_FACTOR = 0.5
+# Ceiling of the deadline of a single looking glass request, in seconds
+DEFAULT_REQUEST_TIMEOUT = 600
+# Deadlines are DEADLINE_FACTOR times the DEADLINE_PERCENTILE of recent
+# latencies, but at least DEADLINE_FLOOR seconds. Requests still running at
+# the HEDGE_PERCENTILE of latencies are duplicated, for at most HEDGE_BUDGET
+# of all requests. Before LATENCY_MIN_SAMPLES requests completed, the
+# ceiling is the deadline and requests are not duplicated.
+DEADLINE_PERCENTILE = 0.99
+DEADLINE_FACTOR = 10
+DEADLINE_FLOOR = 60
+HEDGE_PERCENTILE = 0.95
+HEDGE_BUDGET = 0.05
+LATENCY_MIN_SAMPLES = 20
+LATENCY_WINDOW = 1000
+# In largest first order, every SMALL_PEER_INTERVAL-th request is
+# for the smallest remaining peer instead
+SMALL_PEER_INTERVAL = 4
+
+T = TypeVar("T")
+
+
+class RequestTimeout(asyncio.TimeoutError):
+    """
+    A looking glass request did not complete before its deadline.
+    """
+
+    def __init__(self, url: str, deadline: float):
+        super().__init__(f"Request for {url} timed out after {deadline:.1f}s")
+        self.url = url
+        self.deadline = deadline
+
+
+class RequestOutcome:
+    """
+    Outcome of a single request made through AdaptiveLimiter.request().
+    The caller sets error for responses that indicate an overloaded
+    server, e.g. HTTP 429 or 5xx. Exceptions always count as errors.
+    The caller adds the number of bytes received to size, and the time it
+    paused reading the response, e.g. for a slow consumer, to paused, which
+    is not counted as latency.
+    """
+
+    def __init__(self):
+        self.error = False
+        self.size = 0
+        self.paused = 0.0
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive limit on the number of concurrent requests to a looking glass,
+    using additive increase, multiplicative decrease (AIMD).
+
+    Every successful request increases the limit by 1/limit, i.e. by one
+    for every limit requests. An error, or a latency far above the smoothed
+    latency, halves the limit. Latencies of large responses are compared
+    relative to their size. Requests that were already in flight at that
+    time do not decrease it again. The limit stays between floor and ceiling.
+    Optionally, the number of requests started per second is capped per host.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        floor: int = DEFAULT_CONCURRENCY_FLOOR,
+        ceiling: int = DEFAULT_CONCURRENCY_CEILING,
+        requests_per_second: Optional[float] = None,
+    ):
+        if floor < 1 or ceiling < floor:
+            raise ValueError(
+                f"Invalid concurrency range {floor}-{ceiling}: the floor must be at least 1, "
+                f"and not above the ceiling"
+            )
+        self.floor = floor
+        self.ceiling = ceiling
+        self.requests_per_second = requests_per_second
+        self.limit = float(min(ceiling, max(floor, initial)))
+        self.peak = int(self.limit)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.decreases = 0
+        self._latency: Optional[float] = None
+        # Incremented on every decrease, to recognise requests started before it
+        self._epoch = 0
+        self._condition = asyncio.Condition()
+        self._next_start: Dict[str, float] = {}
+
+    @contextlib.asynccontextmanager
+    async def request(self, url: str) -> AsyncIterator[RequestOutcome]:
+        """
+        Wait for a free slot and the rate limit of the host of url,
+        and measure the request made inside the context.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            await self._wait_for_rate(url)
+            loop = asyncio.get_event_loop()
+            epoch = self._epoch
+            start = loop.time()
+            outcome = RequestOutcome()
+            try:
+                yield outcome
+            except Exception:
+                self._record(loop.time() - start - outcome.paused, True, epoch)
+                raise
+            self._record(loop.time() - start - outcome.paused, outcome.error, epoch, outcome.size)
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def stats_str(self) -> str:
+        return (
+            f"Looking glass concurrency: {int(self.limit)} at the end of the run "
+            f"(peak {self.peak}, range {self.floor}-{self.ceiling}), {self.requests} requests, "
+            f"{self.errors} errors, {self.decreases} decreases"
+        )
+
+    def _record(self, latency: float, error: bool, epoch: int, size: int = 0) -> None:
+        self.requests += 1
+        congested = error
+        if error:
+            self.errors += 1
+        else:
+            latency /= max(1, size / LATENCY_SIZE_UNIT)
+            if self._latency is not None:
+                congested = latency > max(LATENCY_THRESHOLD, self._latency * LATENCY_TOLERANCE)
+                latency = (1 - LATENCY_SMOOTHING) * self._latency + LATENCY_SMOOTHING * latency
+            self._latency = latency
+
+        if not congested:
+            self.limit = min(float(self.ceiling), self.limit + 1 / self.limit)
+            self.peak = max(self.peak, int(self.limit))
+        elif epoch == self._epoch:
+            self._epoch += 1
+            self.decreases += 1
+            self.limit = max(float(self.floor), self.limit * DECREASE_FACTOR)
+
+    async def _wait_for_rate(self, url: str) -> None:
+        if not self.requests_per_second:
+            return
+        host = urlsplit(url).netloc
+        now = asyncio.get_event_loop().time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + 1 / self.requests_per_second
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+@dataclass
+class PeerTiming:
+    start: float
+    end: float
+    requests: int
+    routes: int
+
+
+class PeerTimings:
+    """
+    Timing of a looking glass crawl per peer: when the first request for
+    the peer started and the last one completed, and the number of requests
+    and routes. Times include waiting for a free request slot.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self._peers: Dict[str, PeerTiming] = {}
+
+    def record(self, source: str, start: float, routes: int, requests: int = 1) -> None:
+        """
+        Record a response, or part of a response, for the peer with the given
+        route source, for a request started at start, from time.monotonic().
+        """
+        end = time.monotonic()
+        timing = self._peers.get(source)
+        if timing is None:
+            self._peers[source] = PeerTiming(start, end, requests, routes)
+            return
+        timing.start = min(timing.start, start)
+        timing.end = max(timing.end, end)
+        timing.requests += requests
+        timing.routes += routes
+
+    def stats_str(self) -> str:
+        lines = ["Peer timings, slowest first, in seconds since the start of the crawl:"]
+        for source, timing in sorted(
+            self._peers.items(), key=lambda item: item[1].start - item[1].end
+        ):
+            lines.append(
+                f"    {source}: {timing.routes} routes in {timing.requests} requests, "
+                f"{timing.start - self.start:.2f}-{timing.end - self.start:.2f} "
+                f"({timing.end - timing.start:.2f})"
+            )
+        return "\n".join(lines)
+
+
+def schedule_by_size(sizes: Sequence[Optional[int]]) -> List[int]:
+    """
+    Determine the order in which to request peers, given the expected size of
+    each peer, e.g. its number of routes, or None if unknown. Returns indexes
+    into sizes, largest first, so that the largest peers, which take longest,
+    start early instead of defining the end of the crawl. Every
+    SMALL_PEER_INTERVAL-th position is the smallest remaining peer, so that
+    small peers keep progressing while the largest are fetched.
+    """
+    by_size = deque(sorted(range(len(sizes)), key=lambda index: -(sizes[index] or 0)))
+    order: List[int] = []
+    while by_size:
+        if len(order) % SMALL_PEER_INTERVAL == SMALL_PEER_INTERVAL - 1:
+            order.append(by_size.pop())
+        else:
+            order.append(by_size.popleft())
+    return order
+
+
+class RequestDeadlines:
+    """
+    Deadlines for looking glass requests, derived from the latencies of recent
+    requests, so that a stuck endpoint does not hold up the whole run. A
+    request still running at a high percentile of latencies is hedged: a
+    duplicate request is made, and the first response is used. Requests that
+    miss their deadline raise RequestTimeout, and their URLs are kept, so that
+    the peers left out can be reported. The deadline is never above timeout.
+    """
+
+    def __init__(self, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timed_out: List[str] = []
+        self._latencies: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+
+    def deadline(self) -> float:
+        percentile = self._percentile(DEADLINE_PERCENTILE)
+        if percentile is None:
+            return self.timeout
+        return min(self.timeout, max(DEADLINE_FLOOR, percentile * DEADLINE_FACTOR))
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Return after how long a request is hedged, or None if it is not.
+        """
+        if self.hedges >= self.requests * HEDGE_BUDGET:
+            return None
+        return self._percentile(HEDGE_PERCENTILE)
+
+    async def run(
+        self,
+        url: str,
+        attempt: Callable[[], Awaitable[T]],
+        hedge: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """
+        Run attempt, which makes the request for url, within the deadline,
+        and hedge it with a second attempt if it is slow. The second attempt
+        is made by hedge, if given, e.g. so that it waits for its own slot of
+        an AdaptiveLimiter, as it is an additional request. If an attempt
+        fails while another is running, the other may still succeed.
+        """
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        deadline = self.deadline()
+        hedge_delay = self.hedge_delay()
+        self.requests += 1
+        tasks = [asyncio.ensure_future(attempt())]
+        pending = set(tasks)
+        try:
+            if hedge_delay is not None and hedge_delay < deadline:
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future((hedge or attempt)()))
+                    pending.add(tasks[-1])
+            while pending:
+                remaining = start + deadline - loop.time()
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.timed_out.append(url)
+                    raise RequestTimeout(url, deadline)
+                successful = [task for task in done if task.exception() is None]
+                if successful:
+                    if successful[0] is not tasks[0]:
+                        self.hedge_wins += 1
+                    self.record(loop.time() - start)
+                    return successful[0].result()
+            # The request completed before it could be hedged, or all attempts
+            # failed, in which case timeouts of the client count as missed deadlines
+            exc = tasks[-1].exception()
+            if isinstance(exc, asyncio.TimeoutError):
+                self.timed_out.append(url)
+                raise RequestTimeout(url, deadline) from exc
+            result = tasks[-1].result()
+            self.record(loop.time() - start)
+            return result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def record(self, latency: float) -> None:
+        """
+        Record the latency of a successful request.
+        """
+        self._latencies.append(latency)
+
+    def stats_str(self) -> str:
+        output = (
+            f"Looking glass deadlines: {self.hedges} hedged requests ({self.hedge_wins} faster "
+            f"than the original), {len(self.timed_out)} timed out"
+        )
+        for url in self.timed_out:
+            output += f"\n    Timed out, routes missing or incomplete: {url}"
+        return output
+
+    def _percentile(self, percentile: float) -> Optional[float]:
+        if len(self._latencies) < LATENCY_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[int(percentile * (len(latencies) - 1))]
@@ -0,0 +1,87 @@
+import json
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# Options of a source that are paths, relative to the config file
+PATH_OPTIONS = ["mrt_file", "mrt_updates", "alice_crawl_state"]
+# Options of a source that determine where its routes are read from
+ROUTE_SOURCE_OPTIONS = ["alice_url", "birdseye_url", "mrt_file", "mrt_updates"]
+
+
+@dataclass
+class SourceConfig:
+    """
+    A single source of routes in a config file, i.e. a looking glass
+    or a set of MRT files, with the options that apply to that source.
+    """
+
+    name: str
+    alice_url: Optional[str] = None
+    alice_rs_group: Optional[str] = None
+    birdseye_url: Optional[str] = None
+    mrt_file: List[str] = field(default_factory=list)
+    mrt_updates: List[str] = field(default_factory=list)
+    communities_expected_invalid: Set[str] = field(default_factory=set)
+    alice_crawl_state: Optional[str] = None
+
+
+def load_sources(path: str) -> List[SourceConfig]:
+    """
+    Load the sources from a JSON config file, which has a list of sources,
+    each with exactly one of alice_url, birdseye_url, mrt_file or mrt_updates,
+    and optionally a name and other options, e.g.:
+
+        {"sources": [
+            {"name": "ix-1", "alice_url": "https://lg.ix-1.example/api/v1/"},
+            {"birdseye_url": "https://lg.ix-2.example/rs1/api/"},
+            {"name": "ix-3", "mrt_file": ["dumps/ix-3/*.mrt"]}
+        ]}
+
+    Paths are relative to the directory of the config file. Sources without
+    a name are named after their URL or first MRT file, as in the config.
+    Raises ValueError if the config file is invalid.
+    """
+    with open(path, "rb") as f:
+        config = json.load(f)
+    if not isinstance(config, dict) or not isinstance(config.get("sources"), list):
+        raise ValueError(f"Config file {path} should have a list of sources")
+    base_dir = Path(path).parent
+    sources = [_load_source(source, base_dir) for source in config["sources"]]
+    if not sources:
+        raise ValueError(f"Config file {path} has no sources")
+    names = [source.name for source in sources]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Config file {path} has duplicate source names: {', '.join(duplicates)}")
+    return sources
+
+
+def _load_source(source: Dict[str, Any], base_dir: Path) -> SourceConfig:
+    if not isinstance(source, dict):
+        raise ValueError(f"Invalid source in config file: {source!r}")
+    known = {option.name for option in fields(SourceConfig)}
+    unknown = sorted(set(source) - known)
+    if unknown:
+        raise ValueError(f"Unknown options in config file source: {', '.join(unknown)}")
+    route_sources = [option for option in ROUTE_SOURCE_OPTIONS if source.get(option)]
+    if len(route_sources) != 1:
+        raise ValueError(
+            f"Config file source should have exactly one of {', '.join(ROUTE_SOURCE_OPTIONS)}: "
+            f"{source!r}"
+        )
+
+    options = dict(source)
+    for option in ["mrt_file", "mrt_updates", "communities_expected_invalid"]:
+        if isinstance(options.get(option), str):
+            options[option] = [options[option]]
+    for option in PATH_OPTIONS:
+        if isinstance(options.get(option), list):
+            options[option] = [str(base_dir / path) for path in options[option]]
+        elif options.get(option):
+            options[option] = str(base_dir / options[option])
+    options["communities_expected_invalid"] = set(options.get("communities_expected_invalid", []))
+    if not options.get("name"):
+        route_source = source[route_sources[0]]
+        options["name"] = route_source[0] if isinstance(route_source, list) else route_source
+    return SourceConfig(**options)
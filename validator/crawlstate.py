@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Set
+
+from .status import RouteEntry, RPKIStatus
+from .validate import ValidationResult
+
+CRAWL_STATE_VERSION = 1
+
+
+class CrawlState:
+    """
+    State of an incremental Alice LG crawl, persisted between runs. For every
+    neighbor, this has the neighbor details reported by Alice LG, the number
+    of routes, and the validation results of those routes, i.e. the invalid
+    routes, or all routes in verbose mode. Neighbors are keyed by the source
+    of their routes, which is unique per route server and neighbor.
+
+    A neighbor whose route counts and BGP session did not change since the
+    previous run is not fetched again, and its previous results are reused.
+    All previous results are discarded if the context changed, i.e. the ROAs
+    or settings that affect validation results.
+    """
+
+    def __init__(self, path: str, context: str):
+        self.path = Path(path)
+        self.context = context
+        self.reused: List[str] = []
+        self.fetched = 0
+        self._previous: Dict[str, Dict[str, Any]] = {}
+        self._neighbors: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path, "rb") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            print(f"Ignoring unusable crawl state {self.path}: {exc}")
+            return
+        if (
+            isinstance(state, dict)
+            and state.get("version") == CRAWL_STATE_VERSION
+            and state.get("context") == context
+        ):
+            self._previous = state["neighbors"]
+
+    def check_neighbor(self, source: str, neighbor: Dict[str, Any]) -> bool:
+        """
+        Record the current details of a neighbor, as returned by Alice LG.
+        Returns True if the neighbor is unchanged since the previous run,
+        so that its previous results are reused, or False if its routes
+        need to be fetched and validated.
+        """
+        details = _neighbor_details(neighbor)
+        previous = self._previous.get(source)
+        if previous is not None and _neighbor_unchanged(previous["details"], details):
+            self._neighbors[source] = dict(previous, details=details)
+            self.reused.append(source)
+            return True
+        self._neighbors[source] = {"details": details, "route_count": 0, "results": []}
+        self.fetched += 1
+        return False
+
+    async def count_routes(self, routes: AsyncIterator[RouteEntry]) -> AsyncIterator[RouteEntry]:
+        """
+        Count the fetched routes per neighbor, passing the routes through.
+        """
+        neighbors = self._neighbors
+        async for route in routes:
+            neighbor = neighbors.get(route.source)  # type: ignore
+            if neighbor is not None:
+                neighbor["route_count"] += 1
+            yield route
+
+    def add_result(self, result: ValidationResult) -> None:
+        """
+        Record the validation result of a fetched route.
+        """
+        route = result["route"]
+        neighbor = self._neighbors.get(route["source"])  # type: ignore
+        if neighbor is not None:
+            neighbor["results"].append(_dump_result(result))
+
+    def discard(self, source: str) -> None:
+        """
+        Leave a neighbor out of the saved state, e.g. because its routes were
+        not completely fetched, so that it is fetched again in the next run.
+        """
+        self._neighbors.pop(source, None)
+
+    def reused_route_count(self) -> int:
+        return sum(self._neighbors[source]["route_count"] for source in self.reused)
+
+    def reused_results(self) -> Iterator[ValidationResult]:
+        for source in self.reused:
+            for result in self._neighbors[source]["results"]:
+                yield _load_result(result)
+
+    def save(self) -> None:
+        """
+        Write the state of all neighbors seen in this run, atomically,
+        so that an interrupted run leaves the previous state intact.
+        """
+        state = {
+            "version": CRAWL_STATE_VERSION,
+            "context": self.context,
+            "neighbors": self._neighbors,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(temp_name, self.path)
+        except BaseException:  # pragma: no cover
+            os.unlink(temp_name)
+            raise
+
+    def stats_str(self) -> str:
+        return (
+            f"Alice LG crawl state: {len(self.reused)} neighbors unchanged, "
+            f"{self.fetched} neighbors fetched"
+        )
+
+
+def crawl_context(roa_digest: str, communities_expected_invalid: Set[str], verbose: bool) -> str:
+    """
+    Determine the context of validation results, which changes whenever
+    the same routes could have different results.
+    """
+    context = json.dumps([roa_digest, sorted(communities_expected_invalid), verbose])
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+
+def _neighbor_details(neighbor: Dict[str, Any]) -> Dict[str, Any]:
+    # Route counts, like routes_received and routes_filtered
+    details = {key: value for key, value in neighbor.items() if key.startswith("routes_")}
+    details["last_changed"] = neighbor.get("last_changed")
+    details["uptime"] = neighbor.get("uptime")
+    return details
+
+
+def _neighbor_unchanged(previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+    """
+    Determine whether a neighbor is unchanged. This requires a route count
+    to be known, equal route counts and last change time, and the session
+    not to have been reset, i.e. the uptime not to have decreased.
+    The uptime is compared without assuming a unit, as this differs
+    between Alice LG versions.
+    """
+    if current.get("routes_received") is None:
+        return False
+    previous_uptime = previous.get("uptime")
+    uptime = current.get("uptime")
+    if isinstance(previous_uptime, (int, float)) and isinstance(uptime, (int, float)):
+        if uptime < previous_uptime:
+            return False
+        previous = dict(previous, uptime=None)
+        current = dict(current, uptime=None)
+    return previous == current
+
+
+def _dump_result(result: ValidationResult) -> Dict[str, Any]:
+    route: Dict[str, Any] = dict(result["route"])  # type: ignore
+    route["communities"] = sorted(route["communities"])
+    return {"status": result["status"].value, "route": route, "roas": result["roas"]}  # type: ignore
+
+
+def _load_result(data: Dict[str, Any]) -> ValidationResult:
+    route = dict(data["route"], communities=set(data["route"]["communities"]))
+    return {"status": RPKIStatus(data["status"]), "route": route, "roas": data["roas"]}
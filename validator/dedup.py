@@ -0,0 +1,190 @@
+import hashlib
+from array import array
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    cast,
+)
+
+from .status import RIBEntry, RouteEntry
+from .validate import ValidationResult
+
+# Size of route digests, in bytes
+DIGEST_SIZE = 8
+# Initial number of slots of a DigestSet, a power of two
+DIGEST_SET_CAPACITY = 1024
+
+
+class DigestSet:
+    """
+    Set of 64 bit route digests, kept in an open addressing hash table in an
+    array of 8 bytes per slot, where a set of Python objects takes about 100
+    bytes per digest. The table is doubled once it is half full, so it takes
+    at most 32 bytes per digest, and briefly 48 while it is being doubled.
+    Digests must not be zero, which marks an empty slot.
+    """
+
+    def __init__(self, capacity: int = DIGEST_SET_CAPACITY):
+        self._table = array("Q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, digest: int) -> bool:
+        """
+        Add digest to the set. Returns True if it was not in the set yet.
+        """
+        table = self._table
+        mask = self._mask
+        index = digest & mask
+        while True:
+            slot = table[index]
+            if slot == digest:
+                return False
+            if not slot:
+                break
+            index = (index + 1) & mask
+        table[index] = digest
+        self._count += 1
+        if self._count * 2 > len(table):
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old_table = self._table
+        self._table = array("Q", bytes(16 * len(old_table)))
+        self._mask = len(self._table) - 1
+        table = self._table
+        mask = self._mask
+        for digest in old_table:
+            if digest:
+                index = digest & mask
+                while table[index]:
+                    index = (index + 1) & mask
+                table[index] = digest
+
+
+class RouteDeduplicator:
+    """
+    Skip routes that were already seen from another source, so that each
+    unique path is validated once. This is common with Alice LG, where the
+    routes of a neighbor are fetched from every route server of a group.
+    Routes are identical if they have the same peer, prefix and AS path.
+    Only a digest of these is kept per route, in a DigestSet, which takes
+    at most 32 bytes per unique route. Other state is only kept for routes
+    whose results are not known yet, which are bounded by the chunks in
+    flight, and for reported routes, which are printed at the end anyway.
+
+    Validation results are passed back with add_results(), in the order in
+    which routes were passed on. The sources of all identical routes are
+    kept for the reported results, i.e. invalid routes, or all routes in
+    verbose mode.
+    """
+
+    def __init__(self):
+        self.unique = 0
+        self.duplicates = 0
+        self._seen = DigestSet()
+        # Routes passed on, whose results are not known yet, in order
+        self._pending: Deque[int] = deque()
+        # Sources of duplicates of pending routes, if any
+        self._pending_sources: Dict[int, Optional[List[str]]] = {}
+        # Reported results, with the sources of all identical routes
+        self._reported: Dict[int, Tuple[ValidationResult, List[str]]] = {}
+
+    async def filter(self, items: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        Pass on the RouteEntry's or RIBEntry's in items, leaving out routes
+        that were seen before. RIB entries without unique routes are left out.
+        """
+        async for item in items:
+            if isinstance(item, RIBEntry):
+                routes = [route for route in item.routes if self._check(route)]
+                if routes:
+                    yield RIBEntry(item.prefix, routes)
+            elif self._check(item):
+                yield item
+
+    def add_results(self, results: Sequence[Optional[ValidationResult]]) -> None:
+        """
+        Record the validation results of the next routes that were passed on,
+        with a result or None for each route.
+        """
+        for result in results:
+            digest = self._pending.popleft()
+            duplicate_sources = self._pending_sources.pop(digest)
+            if result:
+                source = cast(Dict[str, Any], result["route"])["source"]
+                sources: List[str] = [source] if source else []
+                self._reported[digest] = (result, sources + (duplicate_sources or []))
+
+    def add_reported(self, result: ValidationResult) -> bool:
+        """
+        Record a reported result of a route that was not passed on, e.g. a result
+        reused from a previous run. Returns True if no identical route was reported
+        before, or False if only its source was added to the existing result.
+        """
+        route = cast(Dict[str, Any], result["route"])
+        digest = _digest(route["peer_as"], route["peer_ip"], route["prefix"], route["aspath"])
+        sources = [route["source"]] if route["source"] else []
+        reported = self._reported.get(digest)
+        if reported is not None:
+            reported[1].extend(sources)
+            return False
+        self._reported[digest] = (result, sources)
+        return True
+
+    def reported_results(self) -> Iterator[Tuple[ValidationResult, List[str]]]:
+        """
+        Yield the reported results, with the sources of all identical routes.
+        """
+        return iter(self._reported.values())
+
+    def stats_str(self) -> str:
+        return (
+            f"Route deduplication: {self.unique} unique routes validated, "
+            f"{self.duplicates} duplicate routes skipped"
+        )
+
+    def _check(self, route: RouteEntry) -> bool:
+        """
+        Check whether a route is new, or otherwise record its source.
+        """
+        digest = route_digest(route)
+        if self._seen.add(digest):
+            self._pending.append(digest)
+            self._pending_sources[digest] = None
+            self.unique += 1
+            return True
+        self.duplicates += 1
+        if route.source:
+            reported = self._reported.get(digest)
+            if reported is not None:
+                reported[1].append(route.source)
+            elif digest in self._pending_sources:
+                duplicate_sources = self._pending_sources[digest]
+                if duplicate_sources is None:
+                    duplicate_sources = self._pending_sources[digest] = []
+                duplicate_sources.append(route.source)
+        return False
+
+
+def route_digest(route: RouteEntry) -> int:
+    return _digest(route.peer_as, route.peer_ip, route.prefix, route.aspath)
+
+
+def _digest(peer_as: int, peer_ip: str, prefix: str, aspath: str) -> int:
+    key = f"{peer_as} {peer_ip} {prefix} {aspath}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+    # Zero marks an empty slot of a DigestSet
+    return int.from_bytes(digest, "little") or 1
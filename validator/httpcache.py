@@ -0,0 +1,206 @@
+import datetime
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional
+
+CACHE_BODY_SUFFIX = ".body"
+CACHE_META_SUFFIX = ".meta"
+# Python before 3.11 only parses fractions of exactly 3 or 6 digits,
+# Alice LG may use any number of digits, up to nanoseconds
+FRACTION_DIGITS_RE = re.compile(r"\.(\d+)")
+
+
+class HTTPCache:
+    """
+    Persistent cache of looking glass responses, keyed by URL. For every URL,
+    the body is stored along with the ETag and Last-Modified headers, which
+    are used to make conditional requests. A server that answers 304 Not
+    Modified lets the cached body be used instead of downloading it again.
+
+    Alice LG reports until when its own cache of a response is valid, in the
+    api.ttl field. Until then, the cached body is used without any request.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.fresh_hits = 0
+        self.not_modified_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def fresh_body(self, url: str) -> Optional[bytes]:
+        """
+        Return the cached body for url if it is still valid according
+        to the looking glass, without any request. Counts a hit if found.
+        """
+        meta = self._read_meta(url)
+        if meta is None or meta.get("expires") is None or meta["expires"] <= time.time():
+            return None
+        body = self._read_body(url, meta)
+        if body is not None:
+            self.fresh_hits += 1
+            self.bytes_saved += len(body)
+        return body
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Return the headers for a conditional request for url,
+        which are empty if there is no usable cache entry.
+        """
+        meta = self._read_meta(url)
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def not_modified_body(self, url: str) -> Optional[bytes]:
+        """
+        Return the cached body for url after a 304 Not Modified response.
+        Counts a hit if found.
+        """
+        meta = self._read_meta(url)
+        body = self._read_body(url, meta) if meta is not None else None
+        if body is not None:
+            self.not_modified_hits += 1
+            self.bytes_saved += len(body)
+        return body
+
+    def writer(self, url: str, headers: Mapping[str, str]) -> "HTTPCacheWriter":
+        """
+        Start storing a new response for url, with the given response headers.
+        """
+        self.misses += 1
+        return HTTPCacheWriter(self, url, headers)
+
+    def store(self, url: str, headers: Mapping[str, str], body: bytes, json_data: Any) -> None:
+        """
+        Store a complete response for url, with its decoded JSON data.
+        """
+        writer = self.writer(url, headers)
+        writer.write(body)
+        writer.commit(json_data)
+
+    def stats_str(self) -> str:
+        hits = self.fresh_hits + self.not_modified_hits
+        return (
+            f"Looking glass cache: {hits} hits ({self.fresh_hits} fresh, "
+            f"{self.not_modified_hits} not modified), {self.misses} misses, "
+            f"{self.bytes_saved / 1024 / 1024:.1f} MiB not downloaded"
+        )
+
+    def _path(self, url: str, suffix: str) -> Path:
+        return self.cache_dir / (hashlib.sha256(url.encode("utf-8")).hexdigest() + suffix)
+
+    def _read_meta(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(url, CACHE_META_SUFFIX), "rb") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get("url") != url:
+            return None
+        return meta
+
+    def _read_body(self, url: str, meta: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            with open(self._path(url, CACHE_BODY_SUFFIX), "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        # The body may have been replaced by a concurrent run after reading meta
+        return body if len(body) == meta.get("size") else None
+
+
+class HTTPCacheWriter:
+    """
+    Writes a response body to a temporary file while it is received. The
+    cache entry is only replaced on commit(), so an interrupted download
+    never replaces a valid entry.
+    """
+
+    def __init__(self, cache: HTTPCache, url: str, headers: Mapping[str, str]):
+        self.cache = cache
+        self.url = url
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        self.size = 0
+        fd, self._temp_name = tempfile.mkstemp(dir=cache.cache_dir, prefix=".tmp-")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self, json_data: Any) -> None:
+        """
+        Store the response in the cache. json_data is the decoded response,
+        or its top level keys other than the streamed array, from which the
+        Alice LG cache expiry is read.
+        """
+        self._file.close()
+        meta = {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "expires": alice_cache_expiry(json_data),
+            "size": self.size,
+        }
+        os.replace(self._temp_name, self.cache._path(self.url, CACHE_BODY_SUFFIX))
+        fd, temp_meta_name = tempfile.mkstemp(dir=self.cache.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(meta, f)
+            os.replace(temp_meta_name, self.cache._path(self.url, CACHE_META_SUFFIX))
+        except BaseException:  # pragma: no cover
+            os.unlink(temp_meta_name)
+            raise
+
+    def discard(self) -> None:
+        self._file.close()
+        os.unlink(self._temp_name)
+
+
+def alice_cache_expiry(json_data: Any) -> Optional[float]:
+    """
+    Determine until when an Alice LG response is valid, as a timestamp.
+    Alice LG reports this in api.ttl, older versions only report when the
+    response was cached in api.cache_status.cached_at, with the TTL in
+    seconds in orig_ttl. Returns None for other responses.
+    """
+    api = json_data.get("api") if isinstance(json_data, dict) else None
+    if not isinstance(api, dict):
+        return None
+    expires = _parse_time(api.get("ttl"))
+    if expires is None:
+        cache_status = api.get("cache_status") or {}
+        cached_at = _parse_time(cache_status.get("cached_at"))
+        ttl = cache_status.get("orig_ttl")
+        if cached_at is not None and isinstance(ttl, (int, float)) and ttl > 0:
+            expires = cached_at + ttl
+    return expires
+
+
+def _parse_time(value: Any) -> Optional[float]:
+    if not isinstance(value, str):
+        return None
+    value = FRACTION_DIGITS_RE.sub(_microseconds, value.replace("Z", "+00:00"), count=1)
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def _microseconds(match: "re.Match[str]") -> str:
+    return "." + match.group(1)[:6].ljust(6, "0")
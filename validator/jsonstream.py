@@ -0,0 +1,229 @@
+import codecs
+from json.decoder import JSONDecodeError, JSONDecoder
+from typing import IO, Any, Dict, Iterator, List
+
+# Parser states, tracking where in the top level JSON object we are
+_OBJECT_START = "object_start"
+_KEY = "key"
+_COLON = "colon"
+_VALUE = "value"
+_KEY_SEPARATOR = "key_separator"
+_ITEM = "item"
+_ITEM_SEPARATOR = "item_separator"
+_DONE = "done"
+
+_WHITESPACE = " \t\n\r"
+# Characters that may continue a number
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+# Marker for values that can not be decoded yet from the buffered data
+_INCOMPLETE = object()
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class JSONArrayParser:
+    """
+    Incremental parser for a JSON object that contains a (large) array,
+    stored under one of the top level keys in keys. Data is provided in
+    arbitrarily sized pieces with feed(), which returns the array items
+    that were completed by that piece. Only a single array item is
+    decoded in memory at a time.
+
+    Values of other top level keys are decoded as a whole, and available
+    in the other attribute. If multiple keys are given, the first key that
+    is found in the data with an array value is used.
+
+    Decoding item by item takes about twice as long as decoding the
+    complete data at once. Positions in errors are counted from the start
+    of all data fed.
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = keys
+        self.found = False
+        self.other: Dict[str, Any] = {}
+        self._decoder = JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        # Number of characters fed, but discarded from the buffer
+        self._offset = 0
+        self._state = _OBJECT_START
+        self._current_key = ""
+
+    def feed(self, data: str) -> List[Any]:
+        """
+        Feed a piece of JSON text into the parser. Returns a list of
+        array items completed by this piece, which may be empty.
+        """
+        remaining = self._buffer[self._pos :]  # noqa: E203
+        self._buffer = remaining + data
+        self._offset += self._pos
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> List[Any]:
+        """
+        Signal that all data has been fed. Returns any remaining items,
+        and raises ValueError if the JSON data was incomplete, or followed
+        by anything other than whitespace.
+        """
+        items = self._parse(final=True)
+        if self._state != _DONE:
+            raise ValueError("Unexpected end of JSON data")
+        pos = self._pos
+        buffer = self._buffer
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos < len(buffer):
+            raise ValueError(f"Unexpected trailing data at JSON position {self._offset + pos}")
+        return items
+
+    def _parse(self, final: bool) -> List[Any]:
+        items: List[Any] = []
+        buffer = self._buffer
+        while self._state != _DONE:
+            pos = self._pos
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+
+            if self._state == _OBJECT_START:
+                self._expect(char, "{")
+                self._state = _KEY
+            elif self._state == _KEY:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                key = self._decode(final)
+                if key is _INCOMPLETE:
+                    break
+                self._current_key = key
+                self._state = _COLON
+            elif self._state == _COLON:
+                self._expect(char, ":")
+                self._state = _VALUE
+            elif self._state == _VALUE:
+                if char == "[" and not self.found and self._current_key in self.keys:
+                    self._pos += 1
+                    self.found = True
+                    self._state = _ITEM
+                    continue
+                value = self._decode(final)
+                if value is _INCOMPLETE:
+                    break
+                self.other[self._current_key] = value
+                self._state = _KEY_SEPARATOR
+            elif self._state == _KEY_SEPARATOR:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                self._expect(char, ",")
+                self._state = _KEY
+            elif self._state == _ITEM:
+                if char == "]":
+                    self._pos += 1
+                    self._state = _KEY_SEPARATOR
+                    continue
+                item = self._decode(final)
+                if item is _INCOMPLETE:
+                    break
+                items.append(item)
+                self._state = _ITEM_SEPARATOR
+                self._pos = self._scan_items(buffer, self._pos, items)
+            elif self._state == _ITEM_SEPARATOR:
+                if char == "]":
+                    self._pos += 1
+                    self._state = _KEY_SEPARATOR
+                    continue
+                self._expect(char, ",")
+                self._state = _ITEM
+        return items
+
+    def _scan_items(self, buffer: str, pos: int, items: List[Any]) -> int:
+        """
+        Fast path for decoding consecutive array items, starting at pos
+        right after a completed item. Returns the position after the last
+        item decoded, leaving anything else for the generic state handling.
+        """
+        raw_decode = self._decoder.raw_decode
+        buffer_length = len(buffer)
+        while pos < buffer_length and buffer[pos] == ",":
+            item_pos = pos + 1
+            while item_pos < buffer_length and buffer[item_pos] in _WHITESPACE:
+                item_pos += 1
+            try:
+                item, end = raw_decode(buffer, item_pos)
+            except JSONDecodeError:
+                break
+            # Most items are followed by a character that can not continue a number
+            if end >= buffer_length or buffer[end] in _NUMBER_CHARS:
+                if _may_continue(buffer, end):
+                    break
+            items.append(item)
+            pos = end
+        return pos
+
+    def _expect(self, char: str, expected: str) -> None:
+        if char != expected:
+            raise ValueError(
+                f"Expected {expected!r} at JSON position {self._offset + self._pos}, found {char!r}"
+            )
+        self._pos += 1
+
+    def _decode(self, final: bool) -> Any:
+        """
+        Decode a single JSON value at the current position. Returns
+        _INCOMPLETE if more data is needed. A value that ends at the end
+        of the buffer, or is only followed by characters that may be part
+        of a number, is only accepted when final is set, as a number may
+        continue in the next piece, e.g. "1." followed by "5".
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except JSONDecodeError as exc:
+            if final:
+                raise ValueError(f"{exc.msg} at JSON position {self._offset + exc.pos}") from exc
+            return _INCOMPLETE
+        if not final and _may_continue(self._buffer, end):
+            return _INCOMPLETE
+        self._pos = end
+        return value
+
+
+def _may_continue(buffer: str, end: int) -> bool:
+    """
+    Determine whether a value decoded up to end may continue in data that
+    is not in the buffer yet, i.e. whether the rest of the buffer could
+    still be part of a number.
+    """
+    for pos in range(end, len(buffer)):
+        if buffer[pos] not in _NUMBER_CHARS:
+            return False
+    return True
+
+
+def iter_json_array(
+    json_file: IO[bytes], keys: List[str], chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[Any]:
+    """
+    Iterate over the items of the array under one of keys in the JSON
+    object in json_file, which should be a binary file handle. Raises
+    ValueError if none of the keys contain an array.
+    """
+    parser = JSONArrayParser(keys)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        chunk = json_file.read(chunk_size)
+        if not chunk:
+            break
+        yield from parser.feed(decoder.decode(chunk))
+    yield from parser.feed(decoder.decode(b"", final=True))
+    yield from parser.close()
+    if not parser.found:
+        raise ValueError(f"No array found in JSON under keys {', '.join(keys)}")
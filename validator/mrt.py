@@ -1,92 +1,336 @@
-import subprocess
-from typing import AsyncGenerator, Optional
+import asyncio
+import glob
+import sys
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional, Sequence, Union
 
-from .status import RouteEntry
+from .mrtreader import STDIN_PATH, is_streamed, open_mrt_stream, read_mrt
+from .replay import UpdateReplayer, replay_updates
+from .ribcache import RIBCacheWriter, load_rib_cache, rib_cache_path
+from .status import RIBEntry, RouteEntry, intern_communities
+from .utils import merge_async_iterators
 
+# Maximum length of a single line of bgpdump output
+BGPDUMP_LINE_LIMIT = 1024 * 1024
+# Number of MRT records the native parser reads between yielding to the event loop
+NATIVE_RECORDS_PER_YIELD = 1000
+# Size of chunks of decompressed or stdin MRT data fed into bgpdump
+BGPDUMP_STDIN_CHUNK_SIZE = 1024 * 1024
+# Number of RIB entries buffered when reading multiple MRT files concurrently
+MULTIPLE_FILES_QUEUE_SIZE = 1000
+# Number of RIB entries loaded from a RIB cache between yielding to the event loop
+CACHED_RIB_ENTRIES_PER_YIELD = 1000
 
-async def parse_mrt(
-    mrt_file, path_bgpdump: Optional[str] = None
+
+def parse_mrt(
+    mrt_file, path_bgpdump: Optional[str] = None, native: bool = False
 ) -> AsyncGenerator[RouteEntry, None]:
     """
     Parse an MRT file and return a generator of RouteEntry's with
     details of all routes in the file.
+    By default, this runs bgpdump. If native is set, the file is parsed
+    in this process by the MRTReader, which does not require bgpdump.
+    mrt_file may be gzip or bzip2 compressed, or "-" to read from stdin.
+    Such input is decompressed while it is parsed, without a temporary file.
+    """
+    if native:
+        return _parse_mrt_native(mrt_file)
+    return _parse_mrt_bgpdump(mrt_file, path_bgpdump)
+
+
+async def parse_mrt_rib_entries(
+    mrt_file,
+    path_bgpdump: Optional[str] = None,
+    native: bool = False,
+    cache_dir: Optional[str] = None,
+) -> AsyncGenerator[RIBEntry, None]:
+    """
+    Parse an MRT file like parse_mrt(), but return a generator of
+    RIBEntry's, each with all the routes for one prefix. In table dump v2,
+    all routes for a prefix are in a single record. In v1, there is a record
+    per route, but routes for the same prefix are consecutive.
+
+    If cache_dir is set, the parsed routes are stored in a columnar RIB
+    cache in that directory, keyed by the hash of the MRT file. Later calls
+    for the same MRT file load the cache, instead of parsing the file.
+    This does not apply to stdin.
+    """
+    cache_path = None
+    if cache_dir and str(mrt_file) != STDIN_PATH:
+        cache_path = rib_cache_path(mrt_file, cache_dir)
+        if cache_path.exists():
+            try:
+                cached_rib_entries = load_rib_cache(cache_path)
+            except ValueError as exc:
+                print(f"Ignoring unusable MRT cache {cache_path}: {exc}")
+            else:
+                for count, rib_entry in enumerate(cached_rib_entries, 1):
+                    yield rib_entry
+                    if count % CACHED_RIB_ENTRIES_PER_YIELD == 0:
+                        await asyncio.sleep(0)
+                return
+
+    cache_writer = RIBCacheWriter() if cache_path else None
+    async for rib_entry in _group_rib_entries(parse_mrt(mrt_file, path_bgpdump, native)):
+        if cache_writer:
+            cache_writer.add(rib_entry)
+        yield rib_entry
+    if cache_path and cache_writer:
+        cache_writer.write(cache_path)
+
+
+def expand_mrt_files(mrt_files: Union[str, Path, Sequence[Union[str, Path]]]) -> List[str]:
+    """
+    Expand a path, or list of paths, to MRT files into a list of paths.
+    Paths may be glob patterns, which must match at least one file.
+    """
+    if isinstance(mrt_files, (str, Path)):
+        mrt_files = [mrt_files]
+    paths = []
+    for mrt_file in mrt_files:
+        mrt_file = str(mrt_file)
+        if any(character in mrt_file for character in "*?["):
+            matches = sorted(glob.glob(mrt_file))
+            if not matches:
+                raise Exception(f"No MRT files found matching {mrt_file}")
+            paths += matches
+        else:
+            paths.append(mrt_file)
+    return paths
+
+
+async def parse_mrt_files_rib_entries(
+    mrt_files: Sequence[str],
+    path_bgpdump: Optional[str] = None,
+    native: bool = False,
+    route_counts: Optional[Dict[str, int]] = None,
+    cache_dir: Optional[str] = None,
+) -> AsyncGenerator[RIBEntry, None]:
+    """
+    Parse multiple MRT files concurrently, like parse_mrt_rib_entries().
+    With bgpdump, a bgpdump process runs for each file in parallel.
+    RIB entries are yielded as they are parsed, so entries from different
+    files are interleaved. If there is more than one file, the source of
+    each route is set to its file path.
+    If route_counts is provided, it is updated with the number of routes
+    yielded per file. cache_dir is used as in parse_mrt_rib_entries().
+    """
+    counts: Dict[str, int] = route_counts if route_counts is not None else {}
+
+    async def parse_file(mrt_file: str) -> AsyncGenerator[RIBEntry, None]:
+        counts[mrt_file] = 0
+        async for rib_entry in parse_mrt_rib_entries(mrt_file, path_bgpdump, native, cache_dir):
+            if len(mrt_files) > 1:
+                for route_entry in rib_entry.routes:
+                    route_entry.source = mrt_file
+            counts[mrt_file] += len(rib_entry.routes)
+            yield rib_entry
+
+    if len(mrt_files) == 1:
+        rib_entries: AsyncIterator[RIBEntry] = parse_file(mrt_files[0])
+    else:
+        rib_entries = merge_async_iterators(
+            [parse_file(mrt_file) for mrt_file in mrt_files], MULTIPLE_FILES_QUEUE_SIZE
+        )
+    async for rib_entry in rib_entries:
+        yield rib_entry
+
+
+async def parse_mrt_updates(
+    mrt_files: Sequence[str], replayer: Optional[UpdateReplayer] = None
+) -> AsyncGenerator[RouteEntry, None]:
+    """
+    Replay BGP4MP update dumps in mrt_files, in the given order, and return
+    a generator of the RouteEntry's that are announced, or changed, in an
+    Adj-RIB-In. The state of all Adj-RIB-Ins is kept across the files,
+    in replayer if provided.
+    """
+    if replayer is None:
+        replayer = UpdateReplayer()
+    for mrt_file in mrt_files:
+        for record_count, route_entries in enumerate(replay_updates(mrt_file, replayer), 1):
+            for route_entry in route_entries:
+                yield route_entry
+            if record_count % NATIVE_RECORDS_PER_YIELD == 0:
+                await asyncio.sleep(0)
+
+
+async def _group_rib_entries(
+    route_entries: AsyncIterator[RouteEntry],
+) -> AsyncGenerator[RIBEntry, None]:
+    """
+    Group consecutive routes with the same prefix into RIBEntry's.
+    """
+    rib_entry: Optional[RIBEntry] = None
+    async for route_entry in route_entries:
+        if rib_entry is not None and rib_entry.prefix == route_entry.prefix:
+            rib_entry.routes.append(route_entry)
+            continue
+        if rib_entry is not None:
+            yield rib_entry
+        rib_entry = RIBEntry(prefix=route_entry.prefix, routes=[route_entry])
+    if rib_entry is not None:
+        yield rib_entry
+
+
+async def _parse_mrt_native(mrt_file) -> AsyncGenerator[RouteEntry, None]:
+    for record_count, route_entries in enumerate(read_mrt(mrt_file), 1):
+        for route_entry in route_entries:
+            yield route_entry
+        if record_count % NATIVE_RECORDS_PER_YIELD == 0:
+            # Parsing is CPU bound, allow other tasks to run in between
+            await asyncio.sleep(0)
+
+
+async def _parse_mrt_bgpdump(
+    mrt_file, path_bgpdump: Optional[str]
+) -> AsyncGenerator[RouteEntry, None]:
+    """
+    bgpdump output is read line by line while it runs, so routes are
+    yielded as soon as they are parsed, without buffering the output.
     """
     if not path_bgpdump:
         path_bgpdump = "bgpdump"
+    # bgpdump only detects compression from the file name, so compressed
+    # data and stdin are decompressed here, and fed to bgpdump's stdin
+    streamed = is_streamed(mrt_file)
 
-    bgpdump = subprocess.run(
-        [path_bgpdump, "-m", "-l", "-v", mrt_file],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
+    bgpdump = await asyncio.create_subprocess_exec(
+        path_bgpdump,
+        "-m",
+        "-l",
+        "-v",
+        STDIN_PATH if streamed else str(mrt_file),
+        stdin=asyncio.subprocess.PIPE if streamed else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=BGPDUMP_LINE_LIMIT,
     )
-    if bgpdump.returncode:  # pragma: no cover
-        raise Exception(f'Failed to parse MRT file with bgpdump: {bgpdump.stderr.decode("ascii")}')
-
-    for rib_entry_bytes in bgpdump.stdout.splitlines():
-        rib_entry = rib_entry_bytes.decode("ascii").split("|")
-        if len(rib_entry) == 16:
-            # Normal case
-            (
-                dump_type,
-                timestamp,
-                entry_type,
-                peer_ip,
-                peer_as_str,
-                prefix,
-                aspath,
-                bgp_origin,
-                next_hop,
-                local_pref,
-                med,
-                communities,
-                extended_communities,
-                _,
-                _,
-                _,
-            ) = rib_entry
-        elif len(rib_entry) == 17:  # pragma: no cover
-            # BGP ADDPATH path id included
-            (
-                dump_type,
-                timestamp,
-                entry_type,
-                peer_ip,
-                peer_as_str,
-                prefix,
-                path_id,
-                aspath,
-                bgp_origin,
-                next_hop,
-                local_pref,
-                med,
-                communities,
-                extended_communities,
-                _,
-                _,
-                _,
-            ) = rib_entry
-        else:  # pragma: no cover
-            print(f"Ignoring unexpected bgpdump output with {len(rib_entry)} fields: {rib_entry}")
-            continue
+    assert bgpdump.stdout and bgpdump.stderr
+    # stderr is drained concurrently, so that bgpdump never blocks on a full stderr pipe
+    stderr_task = asyncio.ensure_future(bgpdump.stderr.read())
+    feed_task = None
+    if streamed:
+        assert bgpdump.stdin
+        feed_task = asyncio.ensure_future(_feed_bgpdump(mrt_file, bgpdump.stdin))
+    completed = False
+    try:
+        async for rib_entry_bytes in bgpdump.stdout:
+            route_entry = _parse_bgpdump_line(rib_entry_bytes)
+            if route_entry:
+                yield route_entry
+        completed = True
+    finally:
+        if not completed and bgpdump.returncode is None:
+            # The generator was closed before all output was read
+            try:
+                bgpdump.kill()
+            except ProcessLookupError:  # pragma: no cover
+                pass
+        if feed_task and not completed:
+            feed_task.cancel()
+        returncode = await bgpdump.wait()
+        stderr = await stderr_task
+        if feed_task and not completed:
+            await asyncio.gather(feed_task, return_exceptions=True)
 
-        peer_as = int(peer_as_str)
-        communities_set = set()
-        if communities:
-            communities_set |= set(communities.split(" "))
-        if extended_communities:
-            communities_set |= set(extended_communities.split(" "))
-        try:
-            origin: Optional[int] = int(aspath.split(" ")[-1])
-        except ValueError:
-            origin = None
-
-        yield RouteEntry(
-            origin=origin,
-            aspath=aspath,
-            prefix=prefix,
-            peer_ip=peer_ip,
-            peer_as=peer_as,
-            communities=communities_set,
-        )
-    if bgpdump.stderr:  # pragma: no cover
-        print(f'Unparsed stderr output from bgpdump:\n{bgpdump.stderr.decode("ascii")}')
+    if feed_task:
+        # Raises any error from reading or decompressing the input
+        await feed_task
+    if returncode:
+        raise Exception(f'Failed to parse MRT file with bgpdump: {stderr.decode("ascii")}')
+    if stderr:  # pragma: no cover
+        print(f'Unparsed stderr output from bgpdump:\n{stderr.decode("ascii")}')
+
+
+async def _feed_bgpdump(mrt_file, stdin: asyncio.StreamWriter) -> None:
+    """
+    Write the (decompressed) contents of mrt_file to bgpdump's stdin.
+    Blocking reads and decompression run in the default executor.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        with open_mrt_stream(mrt_file) as stream:
+            while True:
+                data = await loop.run_in_executor(None, stream.read, BGPDUMP_STDIN_CHUNK_SIZE)
+                if not data:
+                    break
+                stdin.write(data)
+                await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):  # pragma: no cover
+        # bgpdump exited before reading all input, which is reported by its return code
+        pass
+    finally:
+        stdin.close()
+
+
+def _parse_bgpdump_line(rib_entry_bytes: bytes) -> Optional[RouteEntry]:
+    """
+    Parse a single line of bgpdump -m output into a RouteEntry.
+    Returns None for unexpected lines.
+    """
+    rib_entry = rib_entry_bytes.decode("ascii").rstrip("\r\n").split("|")
+    if len(rib_entry) == 16:
+        # Normal case
+        (
+            dump_type,
+            timestamp,
+            entry_type,
+            peer_ip,
+            peer_as_str,
+            prefix,
+            aspath,
+            bgp_origin,
+            next_hop,
+            local_pref,
+            med,
+            communities,
+            extended_communities,
+            _,
+            _,
+            _,
+        ) = rib_entry
+    elif len(rib_entry) == 17:  # pragma: no cover
+        # BGP ADDPATH path id included
+        (
+            dump_type,
+            timestamp,
+            entry_type,
+            peer_ip,
+            peer_as_str,
+            prefix,
+            path_id,
+            aspath,
+            bgp_origin,
+            next_hop,
+            local_pref,
+            med,
+            communities,
+            extended_communities,
+            _,
+            _,
+            _,
+        ) = rib_entry
+    else:  # pragma: no cover
+        print(f"Ignoring unexpected bgpdump output with {len(rib_entry)} fields: {rib_entry}")
+        return None
+
+    peer_as = int(peer_as_str)
+    communities_set = set()
+    if communities:
+        communities_set |= set(communities.split(" "))
+    if extended_communities:
+        communities_set |= set(extended_communities.split(" "))
+    try:
+        origin: Optional[int] = int(aspath.split(" ")[-1])
+    except ValueError:
+        origin = None
+
+    return RouteEntry(
+        origin=origin,
+        aspath=sys.intern(aspath),
+        prefix=prefix,
+        peer_ip=peer_ip,
+        peer_as=peer_as,
+        communities=intern_communities(communities_set),
+    )
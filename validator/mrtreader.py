@@ -0,0 +1,444 @@
+import bz2
+import contextlib
+import gzip
+import mmap
+import socket
+import struct
+import sys
+from typing import IO, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple, cast
+
+from .status import RouteEntry, intern_communities
+
+# MRT types and subtypes, RFC 6396
+MRT_TABLE_DUMP = 12
+MRT_TABLE_DUMP_V2 = 13
+
+TABLE_DUMP_AFI_IPV4 = 1
+TABLE_DUMP_AFI_IPV6 = 2
+
+TABLE_DUMP_V2_PEER_INDEX_TABLE = 1
+# Subtype: (address family, ADD-PATH), RFC 6396 and RFC 8050
+TABLE_DUMP_V2_RIB_SUBTYPES = {
+    2: (socket.AF_INET, False),  # RIB_IPV4_UNICAST
+    4: (socket.AF_INET6, False),  # RIB_IPV6_UNICAST
+    8: (socket.AF_INET, True),  # RIB_IPV4_UNICAST_ADDPATH
+    10: (socket.AF_INET6, True),  # RIB_IPV6_UNICAST_ADDPATH
+}
+
+# BGP path attributes
+ATTR_FLAG_EXTENDED_LENGTH = 0x10
+ATTR_AS_PATH = 2
+ATTR_COMMUNITIES = 8
+ATTR_AS4_PATH = 17
+ATTR_LARGE_COMMUNITIES = 32
+
+AS_SET = 1
+AS_SEQUENCE = 2
+AS_CONFED_SEQUENCE = 3
+AS_CONFED_SET = 4
+# Start and end characters and separator, as used by bgpdump
+AS_SEGMENT_FORMAT = {
+    AS_SET: ("{", "}", ","),
+    AS_SEQUENCE: ("", "", " "),
+    AS_CONFED_SEQUENCE: ("(", ")", " "),
+    AS_CONFED_SET: ("[", "]", ","),
+}
+
+WELL_KNOWN_COMMUNITIES = {
+    0xFFFFFF01: "no-export",
+    0xFFFFFF02: "no-advertise",
+    0xFFFFFF03: "local-AS",
+}
+
+MRT_HEADER = struct.Struct(">IHHI")
+
+# Path to read MRT data from stdin
+STDIN_PATH = "-"
+GZIP_MAGIC = b"\x1f\x8b"
+BZIP2_MAGIC = b"BZh"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+ASPathSegments = List[Tuple[int, Tuple[int, ...]]]
+
+
+class MRTReader:
+    """
+    Decoder for MRT RIB dumps in TABLE_DUMP and TABLE_DUMP_V2 format,
+    including ADD-PATH RIB entries. Only the attributes needed for
+    validation are decoded: AS_PATH (merged with AS4_PATH where needed),
+    COMMUNITIES and LARGE_COMMUNITIES. Output is formatted the same way
+    as the bgpdump based parser in the mrt module.
+
+    A reader keeps the state of the last PEER_INDEX_TABLE, so records
+    must be fed in file order, with routes_from_record().
+    """
+
+    def __init__(self):
+        self.peers: List[Tuple[str, int]] = []
+
+    def routes_from_record(self, mrt_type: int, subtype: int, body) -> List[RouteEntry]:
+        """
+        Decode one MRT record body, a bytes-like object, into RouteEntry's.
+        A TABLE_DUMP_V2 RIB record returns all routes for its prefix.
+        Other record types return an empty list.
+        """
+        if mrt_type == MRT_TABLE_DUMP_V2:
+            if subtype == TABLE_DUMP_V2_PEER_INDEX_TABLE:
+                self.peers = _parse_peer_index_table(body)
+            elif subtype in TABLE_DUMP_V2_RIB_SUBTYPES:
+                family, add_path = TABLE_DUMP_V2_RIB_SUBTYPES[subtype]
+                return self._parse_rib(body, family, add_path)
+        elif mrt_type == MRT_TABLE_DUMP and subtype in (TABLE_DUMP_AFI_IPV4, TABLE_DUMP_AFI_IPV6):
+            family = socket.AF_INET if subtype == TABLE_DUMP_AFI_IPV4 else socket.AF_INET6
+            return [_parse_table_dump(body, family)]
+        return []
+
+    def _parse_rib(self, body, family: int, add_path: bool) -> List[RouteEntry]:
+        (prefix_length,) = struct.unpack_from(">B", body, 4)
+        pos = 5
+        prefix_bytes = (prefix_length + 7) // 8
+        prefix = _format_prefix(family, _read_bytes(body, pos, prefix_bytes), prefix_length)
+        pos += prefix_bytes
+        (entry_count,) = struct.unpack_from(">H", body, pos)
+        pos += 2
+
+        routes = []
+        for _ in range(entry_count):
+            peer_index, _originated_time = struct.unpack_from(">HI", body, pos)
+            pos += 6
+            if add_path:
+                pos += 4  # Path identifier
+            (attribute_length,) = struct.unpack_from(">H", body, pos)
+            pos += 2
+            # AS_PATH in TABLE_DUMP_V2 is always encoded with 4 byte ASNs
+            aspath, origin, communities = _parse_attributes(body, pos, pos + attribute_length, 4)
+            pos += attribute_length
+
+            peer_ip, peer_as = self.peers[peer_index]
+            routes.append(
+                RouteEntry(
+                    origin=origin,
+                    aspath=aspath,
+                    prefix=prefix,
+                    peer_ip=peer_ip,
+                    peer_as=peer_as,
+                    communities=communities,
+                )
+            )
+        return routes
+
+
+def read_mrt(mrt_file) -> Iterator[List[RouteEntry]]:
+    """
+    Read an MRT RIB dump from the path mrt_file, by memory-mapping it.
+    Compressed files and stdin (STDIN_PATH) are read as a stream instead.
+    Yields a list of RouteEntry's per MRT record.
+    """
+    reader = MRTReader()
+    for _timestamp, mrt_type, subtype, body in iter_mrt_file_records(mrt_file):
+        yield reader.routes_from_record(mrt_type, subtype, body)
+
+
+def iter_mrt_file_records(mrt_file) -> Iterator[Tuple[int, int, int, memoryview]]:
+    """
+    Iterate over the records in the MRT file at path mrt_file, which is
+    memory-mapped, or read as a stream if compressed or stdin.
+    Yields tuples of timestamp, type, subtype and the record body.
+    A body is only valid until the next record is requested.
+    """
+    if is_streamed(mrt_file):
+        with open_mrt_stream(mrt_file) as stream:
+            yield from iter_mrt_stream_records(stream)
+        return
+
+    with open(mrt_file, "rb") as f:
+        if not f.seek(0, 2):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as data:
+                for timestamp, mrt_type, subtype, body in iter_mrt_records(data):
+                    with body:
+                        yield timestamp, mrt_type, subtype, body
+
+
+def iter_mrt_records(data) -> Iterator[Tuple[int, int, int, memoryview]]:
+    """
+    Iterate over the records in data, a memoryview on MRT data.
+    Yields tuples of timestamp, type, subtype and the record body.
+    """
+    pos = 0
+    while pos + MRT_HEADER.size <= len(data):
+        timestamp, mrt_type, subtype, length = MRT_HEADER.unpack_from(data, pos)
+        pos += MRT_HEADER.size
+        if pos + length > len(data):
+            raise ValueError(f"Truncated MRT record at offset {pos - MRT_HEADER.size}")
+        end = pos + length
+        yield timestamp, mrt_type, subtype, data[pos:end]
+        pos = end
+    if pos != len(data):
+        raise ValueError(f"Truncated MRT record header at offset {pos}")
+
+
+def iter_mrt_stream_records(stream: IO[bytes]) -> Iterator[Tuple[int, int, int, memoryview]]:
+    """
+    Iterate over the records in a binary stream of MRT data.
+    The stream is read in chunks of STREAM_CHUNK_SIZE, as many small reads
+    are slow on decompressing streams.
+    Yields tuples of timestamp, type, subtype and the record body.
+    """
+    offset = 0
+    remaining = b""
+    while True:
+        chunk = stream.read(STREAM_CHUNK_SIZE)
+        data = memoryview(remaining + chunk if remaining else chunk)
+        pos = 0
+        while pos + MRT_HEADER.size <= len(data):
+            timestamp, mrt_type, subtype, length = MRT_HEADER.unpack_from(data, pos)
+            start = pos + MRT_HEADER.size
+            end = start + length
+            if end > len(data):
+                break
+            yield timestamp, mrt_type, subtype, data[start:end]
+            pos = end
+        offset += pos
+        remaining = bytes(data[pos:])
+        if not chunk:
+            break
+    if len(remaining) >= MRT_HEADER.size:
+        raise ValueError(f"Truncated MRT record at offset {offset}")
+    if remaining:
+        raise ValueError(f"Truncated MRT record header at offset {offset}")
+
+
+def is_streamed(mrt_file) -> bool:
+    """
+    Whether mrt_file must be read as a stream, rather than from a path:
+    if it is stdin, or a gzip or bzip2 compressed file.
+    """
+    if str(mrt_file) == STDIN_PATH:
+        return True
+    with open(mrt_file, "rb") as f:
+        magic = f.read(len(BZIP2_MAGIC))
+    return magic.startswith(GZIP_MAGIC) or magic.startswith(BZIP2_MAGIC)
+
+
+@contextlib.contextmanager
+def open_mrt_stream(mrt_file) -> Iterator[IO[bytes]]:
+    """
+    Open the path mrt_file, or stdin for STDIN_PATH, as a binary stream.
+    gzip and bzip2 compressed data is detected from its magic bytes,
+    and decompressed while reading. stdin is not closed afterwards.
+    """
+    with contextlib.ExitStack() as stack:
+        if str(mrt_file) == STDIN_PATH:
+            raw: IO[bytes] = sys.stdin.buffer
+            magic = raw.peek(len(BZIP2_MAGIC))  # type: ignore
+        else:
+            raw = stack.enter_context(open(mrt_file, "rb"))
+            magic = raw.read(len(BZIP2_MAGIC))
+            raw.seek(0)
+
+        if magic.startswith(GZIP_MAGIC):
+            yield cast(IO[bytes], stack.enter_context(gzip.GzipFile(fileobj=raw, mode="rb")))
+        elif magic.startswith(BZIP2_MAGIC):
+            yield cast(IO[bytes], stack.enter_context(bz2.BZ2File(raw, mode="rb")))
+        else:
+            yield raw
+
+
+def _parse_peer_index_table(body) -> List[Tuple[str, int]]:
+    (view_name_length,) = struct.unpack_from(">H", body, 4)
+    pos = 6 + view_name_length
+    (peer_count,) = struct.unpack_from(">H", body, pos)
+    pos += 2
+
+    peers = []
+    for _ in range(peer_count):
+        peer_type = body[pos]
+        pos += 5  # Peer type and BGP ID
+        if peer_type & 0x01:
+            peer_ip = socket.inet_ntop(socket.AF_INET6, _read_bytes(body, pos, 16))
+            pos += 16
+        else:
+            peer_ip = socket.inet_ntop(socket.AF_INET, _read_bytes(body, pos, 4))
+            pos += 4
+        if peer_type & 0x02:
+            (peer_as,) = struct.unpack_from(">I", body, pos)
+            pos += 4
+        else:
+            (peer_as,) = struct.unpack_from(">H", body, pos)
+            pos += 2
+        peers.append((peer_ip, peer_as))
+    return peers
+
+
+def _parse_table_dump(body, family: int) -> RouteEntry:
+    address_length = 4 if family == socket.AF_INET else 16
+    pos = 4  # View number and sequence number
+    prefix_packed = _read_bytes(body, pos, address_length)
+    pos += address_length
+    (prefix_length,) = struct.unpack_from(">B", body, pos)
+    pos += 6  # Prefix length, status and originated time
+    peer_ip = socket.inet_ntop(family, _read_bytes(body, pos, address_length))
+    pos += address_length
+    peer_as, attribute_length = struct.unpack_from(">HH", body, pos)
+    pos += 4
+    # TABLE_DUMP uses 2 byte ASNs, possibly with an AS4_PATH
+    aspath, origin, communities = _parse_attributes(body, pos, pos + attribute_length, 2)
+    return RouteEntry(
+        origin=origin,
+        aspath=aspath,
+        prefix=_format_prefix(family, prefix_packed, prefix_length),
+        peer_ip=peer_ip,
+        peer_as=peer_as,
+        communities=communities,
+    )
+
+
+def _parse_attributes(
+    body,
+    start: int,
+    end: int,
+    asn_size: int,
+    other_attributes: Optional[Dict[int, Tuple[int, int]]] = None,
+) -> Tuple[str, Optional[int], FrozenSet[str]]:
+    """
+    Parse the path attributes in body between start and end.
+    Returns a tuple of the AS path string, origin AS, and communities,
+    which are shared with other routes with the same attributes.
+    If other_attributes is provided, the start and end offsets of all
+    other attributes are added to it, keyed by attribute type.
+    """
+    as_path: ASPathSegments = []
+    as4_path: Optional[ASPathSegments] = None
+    communities: Set[str] = set()
+
+    pos = start
+    while pos < end:
+        flags = body[pos]
+        attribute_type = body[pos + 1]
+        if flags & ATTR_FLAG_EXTENDED_LENGTH:
+            (length,) = struct.unpack_from(">H", body, pos + 2)
+            pos += 4
+        else:
+            length = body[pos + 2]
+            pos += 3
+
+        if attribute_type == ATTR_AS_PATH:
+            as_path = _parse_as_path(body, pos, pos + length, asn_size)
+        elif attribute_type == ATTR_AS4_PATH:
+            as4_path = _parse_as_path(body, pos, pos + length, 4)
+        elif attribute_type == ATTR_COMMUNITIES:
+            for value in struct.unpack_from(f">{length // 4}I", body, pos):
+                community = WELL_KNOWN_COMMUNITIES.get(value)
+                communities.add(community or f"{value >> 16}:{value & 0xFFFF}")
+        elif attribute_type == ATTR_LARGE_COMMUNITIES:
+            values = struct.unpack_from(f">{length // 4}I", body, pos)
+            for index in range(0, len(values) - 2, 3):
+                communities.add(f"{values[index]}:{values[index + 1]}:{values[index + 2]}")
+        elif other_attributes is not None:
+            other_attributes[attribute_type] = (pos, pos + length)
+        pos += length
+
+    if as4_path is not None and asn_size == 2:
+        as_path = _merge_as4_path(as_path, as4_path)
+    aspath = sys.intern(_format_as_path(as_path))
+    return aspath, _origin(as_path), intern_communities(communities)
+
+
+def _parse_as_path(body, start: int, end: int, asn_size: int) -> ASPathSegments:
+    segments = []
+    asn_format = "H" if asn_size == 2 else "I"
+    pos = start
+    while pos < end:
+        segment_type = body[pos]
+        segment_length = body[pos + 1]
+        pos += 2
+        asns = struct.unpack_from(f">{segment_length}{asn_format}", body, pos)
+        pos += segment_length * asn_size
+        segments.append((segment_type, asns))
+    return segments
+
+
+def _merge_as4_path(as_path: ASPathSegments, as4_path: ASPathSegments) -> ASPathSegments:
+    """
+    Reconstruct the AS path from an AS_PATH with 2 byte ASNs and an
+    AS4_PATH, per RFC 6793 section 4.2.3: the leading ASNs of AS_PATH
+    that are not in AS4_PATH are kept, followed by AS4_PATH.
+    AS4_PATH is ignored if it is longer than AS_PATH.
+    """
+    keep = _path_length(as_path) - _path_length(as4_path)
+    if keep < 0:
+        return as_path
+
+    merged: ASPathSegments = []
+    for segment_type, asns in as_path:
+        if keep <= 0 and segment_type in (AS_SEQUENCE, AS_SET):
+            break
+        if segment_type == AS_SEQUENCE:
+            merged.append((segment_type, asns[:keep]))
+            keep -= min(keep, len(asns))
+        elif segment_type == AS_SET:
+            merged.append((segment_type, asns))
+            keep -= 1
+        else:
+            merged.append((segment_type, asns))
+    return merged + as4_path
+
+
+def _path_length(as_path: ASPathSegments) -> int:
+    """
+    Path length as defined for AS4_PATH reconstruction: a set counts as one,
+    confederation segments are not counted.
+    """
+    length = 0
+    for segment_type, asns in as_path:
+        if segment_type == AS_SEQUENCE:
+            length += len(asns)
+        elif segment_type == AS_SET:
+            length += 1
+    return length
+
+
+def _format_as_path(as_path: ASPathSegments) -> str:
+    """
+    Format an AS path like bgpdump: sequences space separated, sets as
+    {1,2}, confederation sequences as (1 2), and confederation sets as [1,2].
+    Consecutive segments of the same type are merged.
+    """
+    merged: List[Tuple[int, List[int]]] = []
+    for segment_type, asns in as_path:
+        if merged and merged[-1][0] == segment_type:
+            merged[-1][1].extend(asns)
+        else:
+            merged.append((segment_type, list(asns)))
+
+    parts = []
+    for segment_type, merged_asns in merged:
+        start, end, separator = AS_SEGMENT_FORMAT.get(segment_type, ("", "", " "))
+        parts.append(start + separator.join(str(asn) for asn in merged_asns) + end)
+    return " ".join(parts)
+
+
+def _origin(as_path: ASPathSegments) -> Optional[int]:
+    """
+    Origin AS of an AS path, or None if the path is empty, or ends in
+    a set or confederation segment.
+    """
+    if not as_path:
+        return None
+    segment_type, asns = as_path[-1]
+    if segment_type != AS_SEQUENCE or not asns:
+        return None
+    return asns[-1]
+
+
+def _read_bytes(body, start: int, length: int) -> bytes:
+    end = start + length
+    return bytes(body[start:end])
+
+
+def _format_prefix(family: int, packed: bytes, prefix_length: int) -> str:
+    address_length = 4 if family == socket.AF_INET else 16
+    address = socket.inet_ntop(family, packed.ljust(address_length, b"\0"))
+    return f"{address}/{prefix_length}"
@@ -0,0 +1,164 @@
+import asyncio
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    AbstractSet,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .roaindex import ROAStore
+from .validate import ValidationCache, ValidationResult, validate_many
+
+# State of a worker process, set by _init_worker. As the workers are
+# forked, the ROA data passed to it is inherited copy-on-write, instead
+# of being pickled and sent to every worker.
+_worker_roa_tree: Optional[ROAStore] = None
+_worker_cache: Optional[ValidationCache] = None
+
+ChunkResult = Tuple[List[Optional[ValidationResult]], int, int]
+# validate_many() or validate_rib_entries()
+ValidateFunction = Callable[..., List[Optional[ValidationResult]]]
+
+
+class ProcessPoolValidator:
+    """
+    Validate chunks of routes in a pool of forked worker processes.
+    The ROA data is shared with the workers read-only through fork,
+    which works best with a ROAIndex, as its packed arrays are never
+    written to, and therefore never copied into each worker.
+
+    Results are returned in the same order as the chunks are provided,
+    so the output is identical to validating in a single process.
+    Each worker has its own validation cache, the statistics of which
+    are merged in hits and misses.
+
+    All workers are forked when the pool is created, so it should be
+    created before any other threads are started.
+    A pool can validate routes of several sources concurrently, which
+    each may have their own expected invalid communities and verbosity.
+    The pool is shut down with close().
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        roa_tree: ROAStore,
+        communities_expected_invalid: Set[str],
+        verbose: bool,
+        validation_cache_size: int,
+    ):
+        self.workers = workers
+        self.communities_expected_invalid = communities_expected_invalid
+        self.verbose = verbose
+        self.hits = 0
+        self.misses = 0
+        # Limits the number of chunks in flight, and therefore memory use,
+        # while keeping all workers busy
+        self.max_pending = workers * 2
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(roa_tree, validation_cache_size),
+        )
+        # Fork all workers now, rather than lazily on the first chunk, when the
+        # event loop may be running other threads
+        for future in [self._executor.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+    async def validate_chunks(
+        self,
+        chunks: AsyncIterator[Sequence[Any]],
+        validate_function: ValidateFunction = validate_many,
+        communities_expected_invalid: Optional[AbstractSet[str]] = None,
+        verbose: Optional[bool] = None,
+    ) -> AsyncIterator[List[Optional[ValidationResult]]]:
+        """
+        Validate each chunk of routes from chunks in the worker pool,
+        yielding a list of results per chunk, in order.
+        validate_function is validate_many for chunks of RouteEntry's, or
+        validate_rib_entries for chunks of RIBEntry's.
+        communities_expected_invalid and verbose default to those of the pool.
+        """
+        if communities_expected_invalid is None:
+            communities_expected_invalid = self.communities_expected_invalid
+        if verbose is None:
+            verbose = self.verbose
+        loop = asyncio.get_running_loop()
+        pending: Deque[asyncio.Future] = deque()
+        try:
+            async for chunk in chunks:
+                pending.append(
+                    loop.run_in_executor(
+                        self._executor,
+                        _validate_chunk,
+                        validate_function,
+                        chunk,
+                        communities_expected_invalid,
+                        verbose,
+                    )
+                )
+                while len(pending) >= self.max_pending or (pending and pending[0].done()):
+                    yield self._merge(await pending.popleft())
+            while pending:
+                yield self._merge(await pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def stats_str(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        return (
+            f"Validation cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1f}% hit rate), in {self.workers} worker processes"
+        )
+
+    def _merge(self, chunk_result: ChunkResult) -> List[Optional[ValidationResult]]:
+        results, hits, misses = chunk_result
+        self.hits += hits
+        self.misses += misses
+        return results
+
+
+def _init_worker(roa_tree: ROAStore, validation_cache_size: int) -> None:
+    global _worker_roa_tree, _worker_cache
+    _worker_roa_tree = roa_tree
+    if validation_cache_size > 0:
+        _worker_cache = ValidationCache(validation_cache_size)
+
+
+def _validate_chunk(
+    validate_function: ValidateFunction,
+    chunk: Sequence[Any],
+    communities_expected_invalid: AbstractSet[str],
+    verbose: bool,
+) -> ChunkResult:
+    """
+    Validate a chunk of routes or RIB entries in a worker process.
+    Returns the results, and the cache hits and misses of this chunk.
+    """
+    assert _worker_roa_tree is not None
+    cache = _worker_cache
+    results = validate_function(
+        chunk, _worker_roa_tree, communities_expected_invalid, verbose=verbose, cache=cache
+    )
+    if cache is None:
+        return results, 0, 0
+    hits, misses = cache.hits, cache.misses
+    # Counters are reset per chunk, as the totals are kept by the parent process
+    cache.hits = cache.misses = 0
+    return results, hits, misses
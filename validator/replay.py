@@ -0,0 +1,217 @@
+import socket
+import struct
+from typing import Dict, FrozenSet, Iterator, List, Tuple
+
+from .mrtreader import (
+    _format_prefix,
+    _parse_attributes,
+    _read_bytes,
+    iter_mrt_file_records,
+)
+from .status import RouteEntry
+
+# MRT types and subtypes, RFC 6396 and RFC 8050
+MRT_BGP4MP = 16
+MRT_BGP4MP_ET = 17
+
+BGP4MP_STATE_CHANGE = 0
+BGP4MP_STATE_CHANGE_AS4 = 5
+# Subtype: (ASN size, ADD-PATH). Messages sent by the local side
+# (BGP4MP_MESSAGE_LOCAL and variants) are not part of the Adj-RIB-In.
+BGP4MP_MESSAGE_SUBTYPES = {
+    1: (2, False),  # BGP4MP_MESSAGE
+    4: (4, False),  # BGP4MP_MESSAGE_AS4
+    8: (2, True),  # BGP4MP_MESSAGE_ADDPATH
+    9: (4, True),  # BGP4MP_MESSAGE_AS4_ADDPATH
+}
+
+BGP_STATE_ESTABLISHED = 6
+BGP_MESSAGE_UPDATE = 2
+# Marker, length and type
+BGP_HEADER_SIZE = 19
+
+ATTR_MP_REACH_NLRI = 14
+ATTR_MP_UNREACH_NLRI = 15
+AFI_FAMILIES = {1: socket.AF_INET, 2: socket.AF_INET6}
+SAFI_UNICAST = 1
+
+# (peer IP, peer AS)
+Peer = Tuple[str, int]
+# (prefix, ADD-PATH path identifier)
+NLRI = Tuple[str, int]
+# (AS path, communities) of a route
+RouteAttributes = Tuple[str, FrozenSet[str]]
+
+
+class UpdateReplayer:
+    """
+    Replays BGP4MP UPDATE messages from MRT update dumps, keeping an
+    Adj-RIB-In per peer. Only announcements that add a route, or change
+    the AS path or communities of a known route, are returned for
+    validation. Withdrawals only update the Adj-RIB-In, and a session
+    leaving the established state clears the Adj-RIB-In of that peer.
+
+    Records must be fed in file order, with routes_from_record(). One
+    replayer can be used for several consecutive update dumps, keeping
+    its state between them.
+    """
+
+    def __init__(self):
+        self.adj_ribs_in: Dict[Peer, Dict[NLRI, RouteAttributes]] = {}
+        self.updates = 0
+        self.announcements = 0
+        self.unchanged = 0
+        self.withdrawals = 0
+        self.peer_resets = 0
+
+    def routes_from_record(
+        self, timestamp: int, mrt_type: int, subtype: int, body
+    ) -> List[RouteEntry]:
+        """
+        Process one MRT record, returning a list of new or changed routes.
+        Records other than BGP4MP updates and state changes are ignored.
+        """
+        if mrt_type not in (MRT_BGP4MP, MRT_BGP4MP_ET):
+            return []
+        pos = 0
+        time = float(timestamp)
+        if mrt_type == MRT_BGP4MP_ET:
+            (microseconds,) = struct.unpack_from(">I", body, 0)
+            time += microseconds / 1000000
+            pos = 4
+
+        if subtype in (BGP4MP_STATE_CHANGE, BGP4MP_STATE_CHANGE_AS4):
+            asn_size = 4 if subtype == BGP4MP_STATE_CHANGE_AS4 else 2
+            peer, pos = _parse_bgp4mp_header(body, pos, asn_size)
+            _old_state, new_state = struct.unpack_from(">HH", body, pos)
+            if new_state != BGP_STATE_ESTABLISHED and self.adj_ribs_in.pop(peer, None):
+                self.peer_resets += 1
+        elif subtype in BGP4MP_MESSAGE_SUBTYPES:
+            asn_size, add_path = BGP4MP_MESSAGE_SUBTYPES[subtype]
+            peer, pos = _parse_bgp4mp_header(body, pos, asn_size)
+            (length,) = struct.unpack_from(">H", body, pos + 16)
+            if body[pos + 18] == BGP_MESSAGE_UPDATE:
+                self.updates += 1
+                return self._update(
+                    time, peer, body, pos + BGP_HEADER_SIZE, pos + length, asn_size, add_path
+                )
+        return []
+
+    def stats_str(self) -> str:
+        return (
+            f"Replayed {self.updates} BGP updates: {self.announcements} new or changed "
+            f"announcements, {self.unchanged} unchanged announcements, "
+            f"{self.withdrawals} withdrawals, {self.peer_resets} peer resets"
+        )
+
+    def _update(
+        self,
+        time: float,
+        peer: Peer,
+        body,
+        start: int,
+        end: int,
+        asn_size: int,
+        add_path: bool,
+    ) -> List[RouteEntry]:
+        adj_rib_in = self.adj_ribs_in.setdefault(peer, {})
+
+        (withdrawn_length,) = struct.unpack_from(">H", body, start)
+        pos = start + 2
+        withdrawn = _parse_nlri(body, pos, pos + withdrawn_length, socket.AF_INET, add_path)
+        pos += withdrawn_length
+        (attributes_length,) = struct.unpack_from(">H", body, pos)
+        pos += 2
+        attributes_end = pos + attributes_length
+        announced = _parse_nlri(body, attributes_end, end, socket.AF_INET, add_path)
+
+        other_attributes: Dict[int, Tuple[int, int]] = {}
+        aspath, origin, communities = _parse_attributes(
+            body, pos, attributes_end, asn_size, other_attributes
+        )
+        if ATTR_MP_REACH_NLRI in other_attributes:
+            announced += _parse_mp_reach(body, *other_attributes[ATTR_MP_REACH_NLRI], add_path)
+        if ATTR_MP_UNREACH_NLRI in other_attributes:
+            withdrawn += _parse_mp_unreach(body, *other_attributes[ATTR_MP_UNREACH_NLRI], add_path)
+
+        for nlri in withdrawn:
+            adj_rib_in.pop(nlri, None)
+            self.withdrawals += 1
+
+        routes = []
+        route_attributes = (aspath, communities)
+        for nlri in announced:
+            if adj_rib_in.get(nlri) == route_attributes:
+                self.unchanged += 1
+                continue
+            adj_rib_in[nlri] = route_attributes
+            self.announcements += 1
+            routes.append(
+                RouteEntry(
+                    origin=origin,
+                    aspath=aspath,
+                    prefix=nlri[0],
+                    peer_ip=peer[0],
+                    peer_as=peer[1],
+                    communities=communities,
+                    timestamp=time,
+                )
+            )
+        return routes
+
+
+def replay_updates(mrt_file, replayer: UpdateReplayer) -> Iterator[List[RouteEntry]]:
+    """
+    Replay the MRT update dump at path mrt_file with replayer, which may
+    be compressed, or stdin. Yields the new or changed routes per MRT record.
+    """
+    for timestamp, mrt_type, subtype, body in iter_mrt_file_records(mrt_file):
+        yield replayer.routes_from_record(timestamp, mrt_type, subtype, body)
+
+
+def _parse_bgp4mp_header(body, pos: int, asn_size: int) -> Tuple[Peer, int]:
+    """
+    Parse the BGP4MP header at pos, returning the peer, and the
+    position after the header.
+    """
+    asn_format = ">H" if asn_size == 2 else ">I"
+    (peer_as,) = struct.unpack_from(asn_format, body, pos)
+    pos += asn_size * 2 + 2  # Peer AS, local AS and interface index
+    (afi,) = struct.unpack_from(">H", body, pos)
+    pos += 2
+    family = AFI_FAMILIES[afi]
+    address_length = 4 if family == socket.AF_INET else 16
+    peer_ip = socket.inet_ntop(family, _read_bytes(body, pos, address_length))
+    pos += address_length * 2  # Peer and local IP
+    return (peer_ip, peer_as), pos
+
+
+def _parse_nlri(body, start: int, end: int, family: int, add_path: bool) -> List[NLRI]:
+    nlris = []
+    pos = start
+    while pos < end:
+        path_id = 0
+        if add_path:
+            (path_id,) = struct.unpack_from(">I", body, pos)
+            pos += 4
+        prefix_length = body[pos]
+        prefix_bytes = (prefix_length + 7) // 8
+        prefix = _format_prefix(family, _read_bytes(body, pos + 1, prefix_bytes), prefix_length)
+        nlris.append((prefix, path_id))
+        pos += 1 + prefix_bytes
+    return nlris
+
+
+def _parse_mp_reach(body, start: int, end: int, add_path: bool) -> List[NLRI]:
+    afi, safi, next_hop_length = struct.unpack_from(">HBB", body, start)
+    if safi != SAFI_UNICAST or afi not in AFI_FAMILIES:
+        return []
+    pos = start + 4 + next_hop_length + 1  # Next hop and reserved byte
+    return _parse_nlri(body, pos, end, AFI_FAMILIES[afi], add_path)
+
+
+def _parse_mp_unreach(body, start: int, end: int, add_path: bool) -> List[NLRI]:
+    afi, safi = struct.unpack_from(">HB", body, start)
+    if safi != SAFI_UNICAST or afi not in AFI_FAMILIES:
+        return []
+    return _parse_nlri(body, start + 3, end, AFI_FAMILIES[afi], add_path)
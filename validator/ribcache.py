@@ -0,0 +1,250 @@
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+from .status import RIBEntry, RouteEntry, intern_communities
+
+CACHE_MAGIC = b"MANRSRIB"
+CACHE_VERSION = 1
+CACHE_PREFIX = "rib-"
+CACHE_SUFFIX = ".cache"
+# Magic, version, route count
+CACHE_HEADER = struct.Struct("<8sIQ")
+# Length of each section that follows the header
+SECTION_LENGTH = struct.Struct("<Q")
+# Origin of an AS path without a single origin AS
+NO_ORIGIN = -1
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class RIBCacheWriter:
+    """
+    Collects parsed RIB entries, and writes them to a columnar RIB cache.
+    Prefixes, AS paths, peers and community sets are interned into tables,
+    so that each route is stored as four integer indexes into these tables.
+
+    The cache consists of the header, followed by these sections, each
+    preceded by its length: the prefix table, the AS path table, the
+    origin of each AS path, the community set table, the peer IP table,
+    the peer AS of each peer, and the columns with the prefix, AS path,
+    peer, and community set index of each route.
+    Tables of strings are stored as their count, followed by the strings
+    joined with newlines. Integer arrays are stored little-endian.
+    """
+
+    def __init__(self):
+        self.route_count = 0
+        self._prefixes: Dict[str, int] = {}
+        self._aspaths: Dict[str, int] = {}
+        self._aspath_origins = array("q")
+        self._communities: Dict[str, int] = {}
+        self._peers: Dict[Tuple[str, int], int] = {}
+        self._prefix_column = array("I")
+        self._aspath_column = array("I")
+        self._peer_column = array("I")
+        self._communities_column = array("I")
+
+    def add(self, rib_entry: RIBEntry) -> None:
+        prefix_index = self._prefixes.setdefault(rib_entry.prefix, len(self._prefixes))
+        for route in rib_entry.routes:
+            aspath_index = self._aspaths.get(route.aspath)
+            if aspath_index is None:
+                aspath_index = self._aspaths[route.aspath] = len(self._aspaths)
+                self._aspath_origins.append(NO_ORIGIN if route.origin is None else route.origin)
+            communities = " ".join(sorted(route.communities))
+            peer = (route.peer_ip, route.peer_as)
+
+            self._prefix_column.append(prefix_index)
+            self._aspath_column.append(aspath_index)
+            self._peer_column.append(self._peers.setdefault(peer, len(self._peers)))
+            self._communities_column.append(
+                self._communities.setdefault(communities, len(self._communities))
+            )
+            self.route_count += 1
+
+    def write(self, path: Path) -> None:
+        """
+        Write the cache atomically, so that concurrent runs never
+        see a partially written cache.
+        """
+        sections = [
+            _pack_strings(self._prefixes),
+            _pack_strings(self._aspaths),
+            _pack_array(self._aspath_origins),
+            _pack_strings(self._communities),
+            _pack_strings(peer_ip for peer_ip, _ in self._peers),
+            _pack_array(array("I", (peer_as for _, peer_as in self._peers))),
+            _pack_array(self._prefix_column),
+            _pack_array(self._aspath_column),
+            _pack_array(self._peer_column),
+            _pack_array(self._communities_column),
+        ]
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-" + CACHE_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, self.route_count))
+                for section in sections:
+                    f.write(SECTION_LENGTH.pack(len(section)))
+                    f.write(section)
+            os.replace(temp_name, path)
+        except BaseException:  # pragma: no cover
+            os.unlink(temp_name)
+            raise
+
+
+def rib_cache_path(mrt_file, cache_dir: str) -> Path:
+    """
+    Determine the RIB cache path for an MRT file, based on a hash of its contents.
+    """
+    digest = hashlib.sha256()
+    with open(mrt_file, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return Path(cache_dir) / f"{CACHE_PREFIX}{digest.hexdigest()}{CACHE_SUFFIX}"
+
+
+def load_rib_cache(path: Path) -> Iterator[RIBEntry]:
+    """
+    Load the RIB cache in path. The cache is read and checked completely
+    before the first RIB entry is returned, which raises ValueError
+    if the cache is not valid. Routes with the same AS path or community
+    set share the same string or set objects.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < CACHE_HEADER.size:
+        raise ValueError("cache is truncated")
+    magic, version, route_count = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        raise ValueError("unknown cache format")
+
+    sections = _split_sections(data, CACHE_HEADER.size, 10)
+    prefixes = _unpack_strings(sections[0])
+    aspaths = _unpack_strings(sections[1])
+    aspath_origins = _unpack_array("q", sections[2], len(aspaths))
+    communities: List[FrozenSet[str]] = [
+        intern_communities(communities_str.split(" ") if communities_str else [])
+        for communities_str in _unpack_strings(sections[3])
+    ]
+    peer_ips = _unpack_strings(sections[4])
+    peers = list(zip(peer_ips, _unpack_array("I", sections[5], len(peer_ips))))
+    prefix_column = _unpack_array("I", sections[6], route_count, len(prefixes))
+    aspath_column = _unpack_array("I", sections[7], route_count, len(aspaths))
+    peer_column = _unpack_array("I", sections[8], route_count, len(peers))
+    communities_column = _unpack_array("I", sections[9], route_count, len(communities))
+    origins = [None if origin == NO_ORIGIN else origin for origin in aspath_origins]
+    return _iter_rib_entries(
+        prefixes,
+        aspaths,
+        origins,
+        communities,
+        peers,
+        prefix_column,
+        aspath_column,
+        peer_column,
+        communities_column,
+    )
+
+
+def _iter_rib_entries(
+    prefixes: List[str],
+    aspaths: List[str],
+    origins: List[Optional[int]],
+    communities: List[FrozenSet[str]],
+    peers: List[Tuple[str, int]],
+    prefix_column: array,
+    aspath_column: array,
+    peer_column: array,
+    communities_column: array,
+) -> Iterator[RIBEntry]:
+    rib_entry: Optional[RIBEntry] = None
+    previous_prefix_index = -1
+    for prefix_index, aspath_index, peer_index, communities_index in zip(
+        prefix_column, aspath_column, peer_column, communities_column
+    ):
+        if prefix_index != previous_prefix_index:
+            if rib_entry is not None:
+                yield rib_entry
+            rib_entry = RIBEntry(prefix=prefixes[prefix_index], routes=[])
+            previous_prefix_index = prefix_index
+        peer_ip, peer_as = peers[peer_index]
+        assert rib_entry is not None
+        rib_entry.routes.append(
+            RouteEntry(
+                origin=origins[aspath_index],
+                aspath=aspaths[aspath_index],
+                prefix=rib_entry.prefix,
+                peer_ip=peer_ip,
+                peer_as=peer_as,
+                communities=communities[communities_index],
+            )
+        )
+    if rib_entry is not None:
+        yield rib_entry
+
+
+def _pack_strings(strings) -> bytes:
+    strings = list(strings)
+    return struct.pack("<Q", len(strings)) + "\n".join(strings).encode("utf-8")
+
+
+def _unpack_strings(section: bytes) -> List[str]:
+    if len(section) < 8:
+        raise ValueError("cache is truncated")
+    (count,) = struct.unpack_from("<Q", section)
+    if not count:
+        return []
+    strings = section[8:].decode("utf-8").split("\n")
+    if len(strings) != count:
+        raise ValueError("cache is truncated")
+    return strings
+
+
+def _pack_array(values: array) -> bytes:
+    if sys.byteorder == "big":  # pragma: no cover
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack_array(
+    typecode: str, section: bytes, count: int, index_limit: Optional[int] = None
+) -> array:
+    """
+    Unpack an integer array of count items. If index_limit is set, all values
+    must be valid indexes in a table of that size.
+    """
+    values = array(typecode)
+    if len(section) != count * values.itemsize:
+        raise ValueError("cache is truncated")
+    values.frombytes(section)
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    if index_limit is not None and values and max(values) >= index_limit:
+        raise ValueError("cache contains invalid indexes")
+    return values
+
+
+def _split_sections(data: bytes, offset: int, count: int) -> List[bytes]:
+    sections = []
+    for _ in range(count):
+        if offset + SECTION_LENGTH.size > len(data):
+            raise ValueError("cache is truncated")
+        (length,) = SECTION_LENGTH.unpack_from(data, offset)
+        offset += SECTION_LENGTH.size
+        end = offset + length
+        if end > len(data):
+            raise ValueError("cache is truncated")
+        sections.append(data[offset:end])
+        offset = end
+    if offset != len(data):
+        raise ValueError("cache has unexpected trailing data")
+    return sections
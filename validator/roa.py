@@ -1,29 +1,184 @@
+import hashlib
 import json
-from typing import IO, Tuple
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Callable, Dict, Optional, Tuple
 
 import radix
 
+from .jsonstream import iter_json_array
+from .roaindex import ROAIndex, ROAStore
 
-def parse_roas(roa_file: IO[bytes]) -> Tuple[radix.Radix, int]:
+SNAPSHOT_MAGIC = b"MANRSROA"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_PREFIX = "roas-"
+SNAPSHOT_SUFFIX = ".snapshot"
+# Magic, version, ROA count, followed by the dumped ROAIndex
+SNAPSHOT_HEADER = struct.Struct("<8sIQ")
+# Digests of ROA files in a cache directory, by path, size and modification time
+DIGESTS_FILE = "roa-digests.json"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_roas(
+    roa_file: IO[bytes], cache_dir: Optional[str] = None, compact: bool = False
+) -> Tuple[ROAStore, int]:
     """
     Parse the ROAs in roa_file, which should be a file handle on a ROA JSON.
     Returns a tuple of a radix tree that contains all ROAs, and the number
-    of ROAs processed.
+    of ROAs processed. If compact is set, a ROAIndex is returned instead
+    of a radix tree, which uses far less memory.
+    The file is parsed incrementally, so that the complete JSON data
+    never needs to be kept in memory. This is slower than json.load,
+    but avoids a peak in memory use several times the size of the file.
+
+    If compact and cache_dir are set, a snapshot of the sorted arrays of the
+    ROAIndex is stored in that directory, keyed by the hash of the JSON data.
+    Later calls for the same JSON data read these arrays as they are, instead
+    of parsing the JSON. Radix trees are always built from the JSON, as
+    building one from a snapshot is not faster than parsing the JSON.
     """
+    snapshot_path = None
+    if compact and cache_dir:
+        digest = roa_digest(roa_file, cache_dir)
+        snapshot_path = Path(cache_dir) / f"{SNAPSHOT_PREFIX}{digest}{SNAPSHOT_SUFFIX}"
+        if snapshot_path.exists():
+            try:
+                return _load_snapshot(snapshot_path)
+            except ValueError as exc:
+                print(f"Ignoring unusable ROA snapshot {snapshot_path}: {exc}")
+
     roa_count = 0
-    tree = radix.Radix()
-    data = json.load(roa_file)
-
-    for roa in data["roas"]:
-        node = tree.add(roa["prefix"])
-        if "roas" not in node.data:
-            node.data["roas"] = list()
-        node.data["roas"].append(
-            {
-                "asn": int(str(roa["asn"]).replace("AS", "")),
-                "max_length": roa["maxLength"],
-            }
-        )
+    tree = ROAIndex() if compact else radix.Radix()
+
+    for roa in iter_json_array(roa_file, ["roas"]):
+        asn = int(str(roa["asn"]).replace("AS", ""))
+        _add_roa(tree, roa["prefix"], asn, roa["maxLength"])
         roa_count += 1
 
+    if isinstance(tree, ROAIndex):
+        tree.freeze()
+        if snapshot_path:
+            _write_snapshot(snapshot_path, tree, roa_count)
     return tree, roa_count
+
+
+def clear_roa_cache(cache_dir: str) -> int:
+    """
+    Remove all ROA snapshots, and the remembered ROA file digests, from
+    cache_dir. Returns the number of snapshots removed.
+    """
+    removed = 0
+    for path in Path(cache_dir).glob(f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}"):
+        path.unlink()
+        removed += 1
+    digests_path = Path(cache_dir) / DIGESTS_FILE
+    if digests_path.exists():
+        digests_path.unlink()
+    return removed
+
+
+def roa_digest(roa_file: IO[bytes], cache_dir: Optional[str] = None) -> str:
+    """
+    Determine the hash of the JSON data in roa_file. Rewinds roa_file afterwards.
+    If cache_dir is set, digests are remembered in that directory by the path,
+    size and modification time of roa_file, and the file is only hashed again
+    when one of these changed.
+    """
+    if cache_dir:
+        path = os.path.abspath(roa_file.name)
+        stat = os.fstat(roa_file.fileno())
+        digests = _read_digests(cache_dir)
+        known = digests.get(path)
+        if (
+            isinstance(known, dict)
+            and known.get("size") == stat.st_size
+            and known.get("mtime_ns") == stat.st_mtime_ns
+            and isinstance(known.get("digest"), str)
+        ):
+            return known["digest"]
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: roa_file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    roa_file.seek(0)
+
+    if cache_dir:
+        digests[path] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "digest": digest.hexdigest(),
+        }
+        _write_atomically(
+            Path(cache_dir) / DIGESTS_FILE, lambda f: f.write(json.dumps(digests).encode("utf-8"))
+        )
+    return digest.hexdigest()
+
+
+def _add_roa(tree: ROAStore, prefix: str, asn: int, max_length: int) -> None:
+    if isinstance(tree, ROAIndex):
+        tree.add(prefix, asn, max_length)
+        return
+    node = tree.add(prefix)
+    if "roas" not in node.data:
+        node.data["roas"] = list()
+    node.data["roas"].append(
+        {
+            "asn": asn,
+            "max_length": max_length,
+        }
+    )
+
+
+def _read_digests(cache_dir: str) -> Dict[str, Any]:
+    try:
+        with open(Path(cache_dir) / DIGESTS_FILE, "rb") as f:
+            digests = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return digests if isinstance(digests, dict) else {}
+
+
+def _write_snapshot(path: Path, index: ROAIndex, roa_count: int) -> None:
+    def write(f: BinaryIO) -> None:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, roa_count))
+        index.dump(f)
+
+    _write_atomically(path, write)
+
+
+def _write_atomically(path: Path, write: Callable[[BinaryIO], Any]) -> None:
+    """
+    Write a file in the cache directory atomically, so that concurrent runs
+    never see a partially written file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-" + SNAPSHOT_PREFIX)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(temp_name, path)
+    except BaseException:  # pragma: no cover
+        os.unlink(temp_name)
+        raise
+
+
+def _load_snapshot(path: Path) -> Tuple[ROAIndex, int]:
+    """
+    Load the ROAIndex in the snapshot in path.
+    Raises ValueError if the snapshot is not valid.
+    """
+    with open(path, "rb") as f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            raise ValueError("snapshot is truncated")
+        magic, version, roa_count = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("unknown snapshot format")
+        index = ROAIndex.load(f)
+    if len(index) != roa_count:
+        raise ValueError("snapshot does not contain all ROAs")
+    return index, roa_count
@@ -0,0 +1,279 @@
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import BinaryIO, Dict, List, NamedTuple, Tuple, Union
+
+import radix
+
+ADDRESS_BITS = {4: 32, 6: 128}
+ADDRESS_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+# Number of tables in a dumped index
+TABLE_COUNT = struct.Struct("<Q")
+# Address family, prefix length, bucket bits, padding, number of ROAs
+TABLE_HEADER = struct.Struct("<BBBxQ")
+# Size of each key in dumped tables of keys over 64 bits
+LONG_KEY_SIZE = 16
+
+
+class ROANode(NamedTuple):
+    """
+    Covering prefix returned by ROAIndex.search_covering. Mirrors the
+    prefix and data attributes of a radix node, as used in validate().
+    """
+
+    prefix: str
+    data: Dict[str, List[Dict[str, int]]]
+
+
+class _Table:
+    """
+    All ROAs for a single address family and prefix length, in parallel
+    packed arrays. Keys are the network bits of the prefix, i.e. the
+    address shifted right by the number of host bits.
+
+    After sorting, bucket_starts maps the top bucket_bits of each key to
+    the range of indexes with that top, narrowing down each binary search,
+    and allowing most misses to be detected without searching.
+    """
+
+    def __init__(self, prefix_length: int):
+        self.prefix_length = prefix_length
+        self.keys = _key_array(prefix_length)
+        self.max_lengths = array("B")
+        self.asns = array("I")
+        self.bucket_bits = 0
+        self.bucket_starts = array("I")
+
+    def find(self, key: int) -> Tuple[int, int]:
+        """
+        Find the index range of entries matching key.
+        """
+        bucket = key >> (self.prefix_length - self.bucket_bits)
+        low = self.bucket_starts[bucket]
+        high = self.bucket_starts[bucket + 1]
+        if low == high:
+            return low, low
+        start = bisect_left(self.keys, key, low, high)
+        end = start
+        while end < high and self.keys[end] == key:
+            end += 1
+        return start, end
+
+    def sort(self) -> None:
+        """
+        Sort all arrays by key. The sort is stable, so multiple ROAs
+        for the same prefix keep their insertion order.
+        """
+        unsorted_keys = self.keys
+        order = sorted(range(len(unsorted_keys)), key=unsorted_keys.__getitem__)
+        self.keys = _key_array(self.prefix_length)
+        self.keys.extend(unsorted_keys[i] for i in order)
+        self.max_lengths = array("B", (self.max_lengths[i] for i in order))
+        self.asns = array("I", (self.asns[i] for i in order))
+
+        # Roughly one bucket per four entries
+        self.bucket_bits = min(self.prefix_length, max(len(self.keys).bit_length() - 2, 0))
+        shift = self.prefix_length - self.bucket_bits
+        counts = array("I", bytes(4 * ((1 << self.bucket_bits) + 1)))
+        for key in self.keys:
+            counts[(key >> shift) + 1] += 1
+        for bucket in range(1, len(counts)):
+            counts[bucket] += counts[bucket - 1]
+        self.bucket_starts = counts
+
+
+class ROAIndex:
+    """
+    Compact store for ROAs, as an alternative to a radix tree.
+
+    ROAs are kept in packed integer arrays per address family and prefix
+    length, sorted by prefix, so that covering prefixes can be found with
+    one binary search per prefix length in use. This costs roughly ten
+    bytes per ROA, instead of a radix node with a dictionary per ROA.
+    """
+
+    def __init__(self):
+        self._tables: Dict[Tuple[int, int], _Table] = {}
+        # Prefix lengths in use per address family, longest first
+        self._lengths: Dict[int, List[int]] = {4: [], 6: []}
+        self._frozen = True
+
+    def add(self, prefix: str, asn: int, max_length: int) -> None:
+        """
+        Add a ROA for prefix, e.g. "192.0.2.0/24".
+        """
+        family, address, prefix_length = _parse_prefix(prefix)
+        self._add(family, address, prefix_length, asn, max_length)
+
+    def add_packed(
+        self, family: int, packed: bytes, prefix_length: int, asn: int, max_length: int
+    ) -> None:
+        """
+        Add a ROA for a prefix in packed form, for an address family of 4 or 6.
+        """
+        address = int.from_bytes(packed[: ADDRESS_BITS[family] // 8], "big")
+        self._add(family, address, prefix_length, asn, max_length)
+
+    def freeze(self) -> None:
+        """
+        Sort the ROAs added so far, to prepare for searching.
+        Called automatically on the first search after adding ROAs.
+        """
+        if self._frozen:
+            return
+        for table in self._tables.values():
+            table.sort()
+        self._update_lengths()
+        self._frozen = True
+
+    def dump(self, f: BinaryIO) -> None:
+        """
+        Write the sorted arrays of all tables to f, to be loaded again with
+        load(). Integer arrays are stored little-endian.
+        """
+        self.freeze()
+        f.write(TABLE_COUNT.pack(len(self._tables)))
+        for (family, prefix_length), table in sorted(self._tables.items()):
+            f.write(TABLE_HEADER.pack(family, prefix_length, table.bucket_bits, len(table.keys)))
+            if isinstance(table.keys, array):
+                _write_array(f, table.keys)
+            else:
+                f.write(b"".join(key.to_bytes(LONG_KEY_SIZE, "big") for key in table.keys))
+            _write_array(f, table.max_lengths)
+            _write_array(f, table.asns)
+            _write_array(f, table.bucket_starts)
+
+    @classmethod
+    def load(cls, f: BinaryIO) -> "ROAIndex":
+        """
+        Load an index written by dump() from f. The arrays are read as they are,
+        without sorting or any processing per ROA. Raises ValueError if the
+        data is not valid.
+        """
+        index = cls()
+        (table_count,) = TABLE_COUNT.unpack(_read_exactly(f, TABLE_COUNT.size))
+        for _ in range(table_count):
+            family, prefix_length, bucket_bits, count = TABLE_HEADER.unpack(
+                _read_exactly(f, TABLE_HEADER.size)
+            )
+            if family not in ADDRESS_BITS or prefix_length > ADDRESS_BITS[family]:
+                raise ValueError(f"invalid table for prefix length {prefix_length}")
+            if bucket_bits > prefix_length or (family, prefix_length) in index._tables:
+                raise ValueError(f"invalid table for prefix length {prefix_length}")
+            table = _Table(prefix_length)
+            if isinstance(table.keys, array):
+                _read_array(f, table.keys, count)
+            else:
+                data = _read_exactly(f, count * LONG_KEY_SIZE)
+                table.keys.extend(
+                    int.from_bytes(data[offset : offset + LONG_KEY_SIZE], "big")  # noqa: E203
+                    for offset in range(0, len(data), LONG_KEY_SIZE)
+                )
+            _read_array(f, table.max_lengths, count)
+            _read_array(f, table.asns, count)
+            table.bucket_bits = bucket_bits
+            _read_array(f, table.bucket_starts, (1 << bucket_bits) + 1)
+            if table.bucket_starts[0] != 0 or table.bucket_starts[-1] != count:
+                raise ValueError(f"invalid buckets for prefix length {prefix_length}")
+            index._tables[(family, prefix_length)] = table
+        if f.read(1):
+            raise ValueError("unexpected trailing data")
+        index._update_lengths()
+        return index
+
+    def search_covering(self, prefix: str) -> List[ROANode]:
+        """
+        Find all ROA prefixes that cover prefix, including an exact match,
+        ordered from most to least specific, like radix.Radix.search_covering.
+        """
+        self.freeze()
+        family, address, prefix_length = _parse_prefix(prefix)
+        bits = ADDRESS_BITS[family]
+        nodes = []
+        for length in self._lengths[family]:
+            if length > prefix_length:
+                continue
+            table = self._tables[(family, length)]
+            key = address >> (bits - length)
+            start, end = table.find(key)
+            if start != end:
+                roas = [
+                    {"asn": table.asns[index], "max_length": table.max_lengths[index]}
+                    for index in range(start, end)
+                ]
+                network = (key << (bits - length)).to_bytes(bits // 8, "big")
+                address_str = socket.inet_ntop(ADDRESS_FAMILIES[family], network)
+                nodes.append(ROANode(prefix=f"{address_str}/{length}", data={"roas": roas}))
+        return nodes
+
+    def __len__(self) -> int:
+        return sum(len(table.keys) for table in self._tables.values())
+
+    def _update_lengths(self) -> None:
+        for family in self._lengths:
+            self._lengths[family] = sorted(
+                (length for table_family, length in self._tables if table_family == family),
+                reverse=True,
+            )
+
+    def _add(self, family: int, address: int, prefix_length: int, asn: int, max_length: int):
+        table = self._tables.get((family, prefix_length))
+        if table is None:
+            table = self._tables[(family, prefix_length)] = _Table(prefix_length)
+        table.keys.append(address >> (ADDRESS_BITS[family] - prefix_length))
+        table.max_lengths.append(max_length)
+        table.asns.append(asn)
+        self._frozen = False
+
+
+# Either store type can be used for validation
+ROAStore = Union[radix.Radix, ROAIndex]
+
+
+def _key_array(prefix_length: int):
+    """
+    Create the smallest container for keys of prefix_length bits.
+    Keys over 64 bits, only possible for very long IPv6 prefixes,
+    fall back to a list of integers.
+    """
+    if prefix_length <= 32:
+        return array("I")
+    if prefix_length <= 64:
+        return array("Q")
+    return []
+
+
+def _write_array(f: BinaryIO, values: array) -> None:
+    if sys.byteorder == "big":  # pragma: no cover
+        values = array(values.typecode, values)
+        values.byteswap()
+    values.tofile(f)
+
+
+def _read_array(f: BinaryIO, values: array, count: int) -> None:
+    """
+    Read count little-endian items from f into the empty array values.
+    """
+    values.frombytes(_read_exactly(f, count * values.itemsize))
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+
+
+def _read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("data is truncated")
+    return data
+
+
+def _parse_prefix(prefix: str) -> Tuple[int, int, int]:
+    """
+    Parse a prefix string into a tuple of address family,
+    address as integer, and prefix length.
+    """
+    address_str, prefix_length = prefix.split("/")
+    family = 6 if ":" in address_str else 4
+    address = int.from_bytes(socket.inet_pton(ADDRESS_FAMILIES[family], address_str), "big")
+    return family, address, int(prefix_length)
@@ -2,73 +2,518 @@
 # flake8: noqa: E402
 import argparse
 import asyncio
+import contextlib
+import datetime
+import shutil
 import sys
+import tempfile
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Set
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+
+import aiohttp
 
 root = str(Path(__file__).resolve().parents[1])
 sys.path.append(root)
 
 from validator import alicelg, birdseye
-from validator.mrt import parse_mrt
-from validator.roa import parse_roas
+from validator.concurrency import (
+    DEFAULT_CONCURRENCY_CEILING,
+    DEFAULT_CONCURRENCY_FLOOR,
+    DEFAULT_REQUEST_TIMEOUT,
+    AdaptiveLimiter,
+    PeerTimings,
+    RequestDeadlines,
+)
+from validator.config import SourceConfig, load_sources
+from validator.crawlstate import CrawlState, crawl_context
+from validator.dedup import RouteDeduplicator
+from validator.httpcache import HTTPCache
+from validator.mrt import expand_mrt_files, parse_mrt_files_rib_entries, parse_mrt_updates
+from validator.parallel import ProcessPoolValidator, ValidateFunction
+from validator.replay import UpdateReplayer
+from validator.roa import clear_roa_cache, parse_roas, roa_digest
+from validator.roaindex import ROAStore
 from validator.status import RPKIStatus
-from validator.validate import validate
+from validator.utils import DEFAULT_MAX_BUFFERED_RESPONSES, aiter_chunks, create_client
+from validator.validate import (
+    DEFAULT_VALIDATION_CACHE_SIZE,
+    RIB_ENTRY_CHUNK_SIZE,
+    VALIDATION_CHUNK_SIZE,
+    ValidationCache,
+    ValidationResult,
+    validate_many,
+    validate_rib_entries,
+)
+
+
+class LoadedROAs(NamedTuple):
+    tree: ROAStore
+    roa_count: int
+    # Only determined when needed for an incremental Alice LG crawl
+    digest: Optional[str]
+
+
+@dataclass
+class RunOptions:
+    """
+    Options of a run that apply to every source, as opposed to the options
+    of a single source in SourceConfig. See main() for their descriptions.
+    """
+
+    roa_cache_dir: Optional[str] = None
+    roa_cache_clear: bool = False
+    compact_roas: bool = False
+    validation_cache_size: int = DEFAULT_VALIDATION_CACHE_SIZE
+    workers: int = 1
+    native_mrt_parser: bool = False
+    mrt_cache_dir: Optional[str] = None
+    lg_concurrency_floor: int = DEFAULT_CONCURRENCY_FLOOR
+    lg_concurrency_ceiling: int = DEFAULT_CONCURRENCY_CEILING
+    lg_requests_per_second: Optional[float] = None
+    stream_json: bool = False
+    max_buffered_responses: int = DEFAULT_MAX_BUFFERED_RESPONSES
+    lg_cache_dir: Optional[str] = None
+    lg_timeout: float = DEFAULT_REQUEST_TIMEOUT
+    dedup: bool = False
+
+
+def load_roas(
+    roa_file: str,
+    roa_cache_dir: Optional[str] = None,
+    roa_cache_clear: bool = False,
+    compact_roas: bool = False,
+    digest: bool = False,
+) -> LoadedROAs:
+    """
+    Load the ROAs from roa_file, optionally through a snapshot in roa_cache_dir.
+    If digest is set, the digest of the ROA file is determined as well.
+    """
+    if roa_cache_dir and roa_cache_clear:
+        removed = clear_roa_cache(roa_cache_dir)
+        print(f"Removed {removed} ROA snapshots from {roa_cache_dir}")
+
+    with open(roa_file, "rb") as f:
+        roa_file_digest = roa_digest(f, roa_cache_dir) if digest else None
+        roa_tree, roa_count = parse_roas(f, roa_cache_dir, compact_roas)
+    return LoadedROAs(roa_tree, roa_count, roa_file_digest)
 
 
 async def run(
     roa_file: str,
     verbose: bool,
     communities_expected_invalid: Set[str],
-    mrt_file: Optional[str],
+    mrt_file: Optional[Union[str, Sequence[str]]],
     path_bgpdump: Optional[str],
     alice_url: Optional[str],
     alice_rs_group: Optional[str],
     birdseye_url: Optional[str],
     ssl_verify: bool = True,
-):
-    invalid_count = 0
-    route_count = 0
+    mrt_updates: Optional[Union[str, Sequence[str]]] = None,
+    alice_crawl_state: Optional[str] = None,
+    options: Optional[RunOptions] = None,
+    roas: Optional[LoadedROAs] = None,
+    client: Optional[aiohttp.ClientSession] = None,
+    pool: Optional[ProcessPoolValidator] = None,
+    output: Optional[IO[str]] = None,
+) -> Tuple[int, int]:
+    """
+    Validate the routes from a single source, and print the results to output,
+    or stdout by default. Returns the number of routes and of unexpected
+    RPKI invalid routes. Other options are taken from options, or the
+    defaults of RunOptions if not given. If roas is given, these ROAs are
+    used instead of loading roa_file. If client is given, it is used for all
+    looking glass requests, otherwise a client is created for this source.
+    Likewise, if pool is given, routes are validated in that pool, instead
+    of a pool of worker processes for this source.
+    With options.dedup, identical routes from different sources are validated
+    once, and reported with all their sources at the end of the run.
+    """
+    if options is None:
+        options = RunOptions()
+    async with contextlib.AsyncExitStack() as stack:
+        invalid_count = 0
+        route_count = 0
+        mrt_files = expand_mrt_files(mrt_file) if mrt_file else []
+        # Per MRT file, only used when processing multiple files
+        mrt_route_counts: Dict[str, int] = {}
+        mrt_invalid_counts = {path: 0 for path in mrt_files}
+        replayer = None
+        limiter = None
+        lg_cache = HTTPCache(options.lg_cache_dir) if options.lg_cache_dir else None
+        crawl_state = None
+        # Per peer timing of looking glass requests, only reported in verbose mode
+        timings = PeerTimings() if verbose else None
+        deadlines = None
 
-    with open(roa_file, "rb") as f:
-        roa_tree, roa_count = parse_roas(f)
-
-    if mrt_file:
-        routes_generator = parse_mrt(mrt_file, path_bgpdump)
-    elif alice_url:
-        if not communities_expected_invalid:
-            communities_expected_invalid = await alicelg.query_rpki_invalid_community(
-                alice_url, ssl_verify
+        if roas is None:
+            roas = load_roas(
+                roa_file,
+                options.roa_cache_dir,
+                options.roa_cache_clear,
+                options.compact_roas,
+                digest=bool(alice_url and alice_crawl_state),
+            )
+        roa_tree, roa_count, roa_file_digest = roas
+
+        # MRT files are validated per RIB entry, i.e. all routes for a prefix,
+        # other sources per route
+        validate_function: ValidateFunction = validate_many
+        routes_generator: AsyncIterator[Any]
+        if mrt_files:
+            routes_generator = parse_mrt_files_rib_entries(
+                mrt_files,
+                path_bgpdump,
+                options.native_mrt_parser,
+                mrt_route_counts,
+                options.mrt_cache_dir,
+            )
+            validate_function = validate_rib_entries
+        elif mrt_updates:
+            replayer = UpdateReplayer()
+            routes_generator = parse_mrt_updates(expand_mrt_files(mrt_updates), replayer)
+        elif alice_url:
+            if client is None:
+                client = await stack.enter_async_context(
+                    create_client(options.lg_concurrency_ceiling)
+                )
+            if not communities_expected_invalid:
+                communities_expected_invalid = await alicelg.query_rpki_invalid_community(
+                    alice_url, ssl_verify, client
+                )
+            limiter = AdaptiveLimiter(
+                alicelg.DEFAULT_CONCURRENCY,
+                options.lg_concurrency_floor,
+                options.lg_concurrency_ceiling,
+                options.lg_requests_per_second,
+            )
+            deadlines = RequestDeadlines(options.lg_timeout)
+            if roa_file_digest and alice_crawl_state:
+                context = crawl_context(roa_file_digest, communities_expected_invalid, verbose)
+                crawl_state = CrawlState(alice_crawl_state, context)
+            routes_generator = alicelg.get_routes(
+                alice_url,
+                alice_rs_group,
+                ssl_verify,
+                limiter,
+                options.stream_json,
+                options.max_buffered_responses,
+                lg_cache,
+                crawl_state,
+                timings,
+                deadlines,
+                client,
+            )
+            if crawl_state is not None:
+                routes_generator = crawl_state.count_routes(routes_generator)
+        elif birdseye_url:
+            limiter = AdaptiveLimiter(
+                birdseye.DEFAULT_CONCURRENCY,
+                options.lg_concurrency_floor,
+                options.lg_concurrency_ceiling,
+                options.lg_requests_per_second,
+            )
+            deadlines = RequestDeadlines(options.lg_timeout)
+            routes_generator = birdseye.get_routes(
+                birdseye_url,
+                ssl_verify,
+                limiter,
+                options.stream_json,
+                options.max_buffered_responses,
+                lg_cache,
+                timings,
+                deadlines,
+                client,
+            )
+        else:  # pragma: no cover
+            raise Exception("Unable to determine route source")
+
+        deduplicator = None
+        if options.dedup:
+            deduplicator = RouteDeduplicator()
+            routes_generator = deduplicator.filter(routes_generator)
+
+        if communities_expected_invalid:
+            print(
+                f'Using BGP communities {", ".join(communities_expected_invalid)} '
+                f"as expected RPKI invalid",
+                file=output,
             )
-        routes_generator = alicelg.get_routes(alice_url, alice_rs_group, ssl_verify)
-    elif birdseye_url:
-        routes_generator = birdseye.get_routes(birdseye_url, ssl_verify)
-    else:  # pragma: no cover
-        raise Exception("Unable to determine route source")
 
-    if communities_expected_invalid:
+        chunk_size = RIB_ENTRY_CHUNK_SIZE if mrt_files else VALIDATION_CHUNK_SIZE
+        chunks = aiter_chunks(routes_generator, chunk_size)
+        cache = None
+        # Statistics of a shared pool are reported by its owner
+        report_pool = False
+        if pool is None and options.workers > 1:
+            pool = ProcessPoolValidator(
+                options.workers,
+                roa_tree,
+                communities_expected_invalid,
+                verbose,
+                options.validation_cache_size,
+            )
+            stack.callback(pool.close)
+            report_pool = True
+        if pool is not None:
+            chunk_results = pool.validate_chunks(
+                chunks, validate_function, communities_expected_invalid, verbose
+            )
+        else:
+            if options.validation_cache_size > 0:
+                cache = ValidationCache(options.validation_cache_size)
+            chunk_results = _validate_chunks(
+                chunks, validate_function, roa_tree, communities_expected_invalid, verbose, cache
+            )
+
+        async for results in chunk_results:
+            route_count += len(results)
+            if deduplicator is not None:
+                deduplicator.add_results(results)
+            for result in results:
+                if result:
+                    if deduplicator is None:
+                        print(validator_result_str(result), file=output)
+                    if result["status"] == RPKIStatus.invalid:
+                        invalid_count += 1
+                        source = cast(Dict[str, Any], result["route"])["source"]
+                        if source in mrt_invalid_counts:
+                            mrt_invalid_counts[source] += 1
+                    if crawl_state is not None:
+                        crawl_state.add_result(result)
+        if crawl_state is not None:
+            if deduplicator is not None:
+                # Skipped duplicates are recorded as results of their own neighbors
+                for result, sources in deduplicator.reported_results():
+                    for source in sources[1:]:
+                        route = dict(cast(Dict[str, Any], result["route"]), source=source)
+                        crawl_state.add_result(dict(result, route=route))
+            # Results of neighbors that did not change since the previous crawl
+            route_count += crawl_state.reused_route_count()
+            for result in crawl_state.reused_results():
+                if deduplicator is not None:
+                    if not deduplicator.add_reported(result):
+                        continue
+                else:
+                    print(validator_result_str(result), file=output)
+                if result["status"] == RPKIStatus.invalid:
+                    invalid_count += 1
+            # Neighbors with missing or incomplete routes are fetched again next time
+            for url in deadlines.timed_out if deadlines is not None else []:
+                source = alicelg.neighbor_source(url)
+                if source is not None:
+                    crawl_state.discard(source)
+            crawl_state.save()
+        if deduplicator is not None:
+            for result, sources in deduplicator.reported_results():
+                print(validator_result_str(result, sources), file=output)
+        if verbose and pool is not None:
+            if report_pool:
+                print(pool.stats_str(), file=output)
+        elif verbose and cache is not None:
+            print(cache.stats_str(), file=output)
+        if replayer is not None:
+            print(replayer.stats_str(), file=output)
+        if limiter is not None:
+            print(limiter.stats_str(), file=output)
+            if timings is not None:
+                print(timings.stats_str(), file=output)
+        if deadlines is not None:
+            print(deadlines.stats_str(), file=output)
+        if deduplicator is not None:
+            print(deduplicator.stats_str(), file=output)
+        if lg_cache is not None and limiter is not None:
+            print(lg_cache.stats_str(), file=output)
+        if crawl_state is not None:
+            print(crawl_state.stats_str(), file=output)
+        if len(mrt_files) > 1:
+            for path in mrt_files:
+                print(
+                    f"Processed {mrt_route_counts.get(path, 0)} route entries from {path}, "
+                    f"found {mrt_invalid_counts[path]} unexpected RPKI invalid entries",
+                    file=output,
+                )
         print(
-            f'Using BGP communities {", ".join(communities_expected_invalid)} '
-            f"as expected RPKI invalid"
+            f"Processed {route_count} route entries, {roa_count} ROAs, "
+            f"found {invalid_count} unexpected RPKI invalid entries",
+            file=output,
         )
+    return route_count, invalid_count
+
 
-    async for route_entry in routes_generator:
-        route_count += 1
-        result = validate(route_entry, roa_tree, communities_expected_invalid, verbose=verbose)
-        if result:
-            print(validator_result_str(result))
-            if result["status"] == RPKIStatus.invalid:
-                invalid_count += 1
+async def run_config(
+    config_file: str,
+    roa_file: str,
+    verbose: bool,
+    communities_expected_invalid: Set[str],
+    path_bgpdump: Optional[str] = None,
+    ssl_verify: bool = True,
+    options: Optional[RunOptions] = None,
+) -> Tuple[int, int]:
+    """
+    Validate the routes from all sources in config_file concurrently.
+    The ROAs are loaded once, and all looking glass requests share one client,
+    with at most lg_concurrency_ceiling connections per looking glass host.
+    With multiple workers, all sources share one pool of worker processes.
+    Results are printed per source, in the order of the config file, followed
+    by the totals of all sources. A failing source is reported, without
+    affecting other sources. Options are used for every source, like in run().
+    Returns the total number of routes and of unexpected RPKI invalid routes.
+    """
+    if options is None:
+        options = RunOptions()
+    sources = load_sources(config_file)
+    roas = load_roas(
+        roa_file,
+        options.roa_cache_dir,
+        options.roa_cache_clear,
+        options.compact_roas,
+        digest=any(source.alice_url and source.alice_crawl_state for source in sources),
+    )
+    route_count = 0
+    invalid_count = 0
+    failed = 0
+    pool = None
+    if options.workers > 1:
+        pool = ProcessPoolValidator(
+            options.workers,
+            roas.tree,
+            communities_expected_invalid,
+            verbose,
+            options.validation_cache_size,
+        )
+    async with contextlib.AsyncExitStack() as stack:
+        client = await stack.enter_async_context(create_client(options.lg_concurrency_ceiling))
+        if pool is not None:
+            stack.callback(pool.close)
+        # The output of each source is kept in a temporary file until it is
+        # reported, as it can be large in verbose mode
+        outputs = [
+            stack.enter_context(tempfile.TemporaryFile(mode="w+", encoding="utf-8"))
+            for _ in sources
+        ]
+        tasks = [
+            asyncio.ensure_future(
+                _run_source(
+                    source,
+                    roa_file,
+                    verbose,
+                    communities_expected_invalid,
+                    path_bgpdump,
+                    ssl_verify,
+                    options,
+                    roas,
+                    client,
+                    pool,
+                    output,
+                )
+            )
+            for source, output in zip(sources, outputs)
+        ]
+        # Every source is reported once all sources before it are done
+        for source, task, output in zip(sources, tasks, outputs):
+            counts, exc = await task
+            print(f"Results for source {source.name}:")
+            sys.stdout.flush()
+            output.seek(0)
+            shutil.copyfileobj(output, sys.stdout)
+            output.close()
+            if exc is not None:
+                print(f"Failed to validate routes from source {source.name}: {exc!r}")
+                failed += 1
+            else:
+                route_count += counts[0]
+                invalid_count += counts[1]
+            print()
+    if verbose and pool is not None:
+        print(pool.stats_str())
     print(
-        f"Processed {route_count} route entries, {roa_count} ROAs, "
-        f"found {invalid_count} unexpected RPKI invalid entries"
+        f"Processed {route_count} route entries from {len(sources) - failed} sources, "
+        f"{roas.roa_count} ROAs, found {invalid_count} unexpected RPKI invalid entries"
     )
+    if failed:
+        print(f"Failed to validate routes from {failed} sources")
+    return route_count, invalid_count
+
+
+async def _run_source(
+    source: SourceConfig,
+    roa_file: str,
+    verbose: bool,
+    communities_expected_invalid: Set[str],
+    path_bgpdump: Optional[str],
+    ssl_verify: bool,
+    options: RunOptions,
+    roas: LoadedROAs,
+    client: aiohttp.ClientSession,
+    pool: Optional[ProcessPoolValidator],
+    output: IO[str],
+) -> Tuple[Tuple[int, int], Optional[Exception]]:
+    """
+    Validate the routes from a single source of a config file, writing its
+    output to output. Returns the route and invalid counts of this source,
+    and the exception that made it fail, if any.
+    """
+    try:
+        counts = await run(
+            roa_file,
+            verbose,
+            source.communities_expected_invalid or set(communities_expected_invalid),
+            source.mrt_file,
+            path_bgpdump,
+            source.alice_url,
+            source.alice_rs_group,
+            source.birdseye_url,
+            ssl_verify,
+            source.mrt_updates,
+            source.alice_crawl_state,
+            options,
+            roas,
+            client,
+            pool,
+            output,
+        )
+    except Exception as exc:
+        return (0, 0), exc
+    return counts, None
+
+
+async def _validate_chunks(
+    chunks: AsyncIterator[Sequence[Any]],
+    validate_function: ValidateFunction,
+    roa_tree: ROAStore,
+    communities_expected_invalid: Set[str],
+    verbose: bool,
+    cache: Optional[ValidationCache],
+) -> AsyncIterator[List[Optional[ValidationResult]]]:
+    """
+    Validate chunks of routes or RIB entries in this process with validate_function,
+    yielding the results per chunk.
+    """
+    async for chunk in chunks:
+        yield validate_function(
+            chunk, roa_tree, communities_expected_invalid, verbose=verbose, cache=cache
+        )
 
 
-def validator_result_str(result) -> str:
+def validator_result_str(result, sources: Optional[List[str]] = None) -> str:
     """
     Translate a single validation result dictionary to a user-friendly
     string with validation status and details of the route and ROAs.
+    If sources is given, these are listed instead of the source of the route.
     """
     communities_str = (
         " ".join(sorted(result["route"]["communities"]))
@@ -82,8 +527,13 @@ def validator_result_str(result) -> str:
         f"AS path: {result['route']['aspath']}\n"
         f"Communities: {communities_str}\n"
     )
-    if result["route"].get("source"):
-        output += f"Source: {result['route']['source']}\n"
+    if sources is None:
+        sources = [result["route"]["source"]] if result["route"].get("source") else []
+    for source in sources:
+        output += f"Source: {source}\n"
+    if result["route"].get("timestamp") is not None:
+        time = datetime.datetime.fromtimestamp(result["route"]["timestamp"], datetime.timezone.utc)
+        output += f"Time: {time.isoformat()}\n"
     if result["roas"]:
         output += "ROAs found:\n"
         for roa in result["roas"]:
@@ -122,13 +572,45 @@ def main():  # pragma: no cover
     source_group.add_argument(
         "-m",
         "--mrt-file",
-        help="Read routes from an MRT file, by providing the path to this file",
+        nargs="+",
+        help="Read routes from one or more MRT files, by providing the paths or glob patterns "
+        "of these files. Multiple files are parsed concurrently.",
+    )
+    source_group.add_argument(
+        "-u",
+        "--mrt-updates",
+        nargs="+",
+        help="Replay BGP4MP update messages from one or more MRT update dumps, by providing the "
+        "paths or glob patterns of these files, in chronological order. Only routes that are new "
+        "or changed in the Adj-RIB-In of a peer are validated, and reported with their time.",
+    )
+    source_group.add_argument(
+        "--config",
+        help="Read routes from all sources in a JSON config file, which are validated "
+        "concurrently, with a single load of the ROAs and a shared looking glass client. "
+        'The file has a list of sources, e.g. {"sources": [{"name": "ix-1", "alice_url": '
+        '"https://lg.example.net/api/v1/"}, {"mrt_file": ["ix-2/*.mrt"]}]}. Sources have '
+        "exactly one of alice_url, birdseye_url, mrt_file or mrt_updates, and optionally "
+        "alice_rs_group, communities_expected_invalid and alice_crawl_state. Results are "
+        "reported per source, followed by the totals of all sources.",
     )
     parser.add_argument(
         "-p",
         "--path-bgpdump",
         help="Path to the bgpdump binary from libbgpdump (default: 'bgpdump', expected in $PATH).",
     )
+    parser.add_argument(
+        "--mrt-parser",
+        choices=["bgpdump", "native"],
+        default="bgpdump",
+        help="Parser for MRT files: 'bgpdump' runs bgpdump, 'native' uses the built-in parser, "
+        "which does not require bgpdump and supports table dump v1/v2 (default: bgpdump).",
+    )
+    parser.add_argument(
+        "--mrt-cache-dir",
+        help="Directory to store parsed MRT files in a compact columnar format. Later runs with "
+        "the same MRT file load this cache, which is much faster than parsing the MRT file.",
+    )
     source_group.add_argument(
         "-a",
         "--alice-url",
@@ -147,21 +629,149 @@ def main():  # pragma: no cover
         help="Read routes from a Bird's eye Looking Glass API, by specifying the base URL e.g. "
         "'https://lg.example.net/<route-server-name>/api/'",
     )
+    parser.add_argument(
+        "--lg-concurrency-floor",
+        type=int,
+        default=DEFAULT_CONCURRENCY_FLOOR,
+        help="Minimum number of concurrent requests to a looking glass. The number of concurrent "
+        "requests adapts to the latency and errors of the looking glass, between the floor and "
+        f"ceiling (default: {DEFAULT_CONCURRENCY_FLOOR}).",
+    )
+    parser.add_argument(
+        "--lg-concurrency-ceiling",
+        type=int,
+        default=DEFAULT_CONCURRENCY_CEILING,
+        help="Maximum number of concurrent requests to a looking glass "
+        f"(default: {DEFAULT_CONCURRENCY_CEILING}).",
+    )
+    parser.add_argument(
+        "--lg-requests-per-second",
+        type=float,
+        help="Maximum number of requests started per second per looking glass host "
+        "(default: no limit).",
+    )
+    parser.add_argument(
+        "--lg-timeout",
+        type=float,
+        default=DEFAULT_REQUEST_TIMEOUT,
+        help="Maximum time for a single looking glass request, in seconds. Shorter deadlines "
+        "are derived from the latency of earlier requests, and slow requests are duplicated. "
+        "Peers whose requests miss their deadline are reported, and left out of the results "
+        f"(default: {DEFAULT_REQUEST_TIMEOUT}).",
+    )
+    parser.add_argument(
+        "--stream-json",
+        action="store_true",
+        help="Decode the routes of looking glass responses while they are received, instead of "
+        "after receiving the complete response. This bounds memory use for peers with many "
+        "routes, and starts validation earlier.",
+    )
+    parser.add_argument(
+        "--max-buffered-responses",
+        type=int,
+        default=DEFAULT_MAX_BUFFERED_RESPONSES,
+        help="Maximum number of looking glass responses (or decoded parts of responses, with "
+        "--stream-json) waiting to be validated. Downloads pause when validation falls behind, "
+        f"which bounds memory use (default: {DEFAULT_MAX_BUFFERED_RESPONSES}).",
+    )
+    parser.add_argument(
+        "--lg-cache-dir",
+        help="Directory to cache looking glass responses in. Later runs make conditional "
+        "requests, and use the cached response if it has not changed. Responses that Alice LG "
+        "reports as still valid are used without any request.",
+    )
+    parser.add_argument(
+        "--alice-crawl-state",
+        help="Path to a file with the state of the previous Alice LG crawl, which is updated "
+        "after every run. Only neighbors whose route counts or BGP session changed since the "
+        "previous crawl are fetched and validated, the results of other neighbors are reused. "
+        "All results are validated again if the ROAs or expected invalid communities change.",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Validate identical routes from different sources once, e.g. the routes of a "
+        "neighbor on mirrored Alice LG route servers. Routes are identical if they have the same "
+        "peer, prefix and AS path. Reported routes list all their sources, and are printed at "
+        "the end of the run.",
+    )
     parser.add_argument(
         "-s",
         "--disable-ssl-verify",
         action="store_true",
         help="Disable SSL verification for HTTPS",
     )
+    parser.add_argument(
+        "--roa-cache-dir",
+        help="Directory to store binary snapshots of parsed ROA JSON files, with --compact-roas. "
+        "Later runs with the same ROA JSON file load the snapshot, which is much faster than "
+        "parsing the JSON.",
+    )
+    parser.add_argument(
+        "--clear-roa-cache",
+        action="store_true",
+        help="Remove all existing snapshots from --roa-cache-dir before running.",
+    )
+    parser.add_argument(
+        "--compact-roas",
+        action="store_true",
+        help="Store ROAs in compact sorted arrays instead of a radix tree, which uses an order "
+        "of magnitude less memory for large ROA files.",
+    )
+    parser.add_argument(
+        "--validation-cache-size",
+        type=int,
+        default=DEFAULT_VALIDATION_CACHE_SIZE,
+        help="Number of (prefix, origin) validation outcomes to cache, as the same prefix and "
+        f"origin is often seen from many peers (default: {DEFAULT_VALIDATION_CACHE_SIZE}). "
+        "Set to 0 to disable caching.",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for validation (default: 1). Workers share the ROA "
+        "data through fork, which works best in combination with --compact-roas. "
+        "Output order is the same as with a single process.",
+    )
     args = parser.parse_args()
 
     communities_expected_invalid = set()
     if args.communities_expected_invalid:
         communities_expected_invalid = set(args.communities_expected_invalid.split(","))
 
+    options = RunOptions(
+        roa_cache_dir=args.roa_cache_dir,
+        roa_cache_clear=args.clear_roa_cache,
+        compact_roas=args.compact_roas,
+        validation_cache_size=args.validation_cache_size,
+        workers=args.workers,
+        native_mrt_parser=args.mrt_parser == "native",
+        mrt_cache_dir=args.mrt_cache_dir,
+        lg_concurrency_floor=args.lg_concurrency_floor,
+        lg_concurrency_ceiling=args.lg_concurrency_ceiling,
+        lg_requests_per_second=args.lg_requests_per_second,
+        stream_json=args.stream_json,
+        max_buffered_responses=args.max_buffered_responses,
+        lg_cache_dir=args.lg_cache_dir,
+        lg_timeout=args.lg_timeout,
+        dedup=args.dedup,
+    )
+
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(
-        run(
+    if args.config:
+        coroutine = run_config(
+            args.config,
+            args.roa_file,
+            args.verbose,
+            communities_expected_invalid,
+            args.path_bgpdump,
+            not args.disable_ssl_verify,
+            options,
+        )
+    else:
+        coroutine = run(
             args.roa_file,
             args.verbose,
             communities_expected_invalid,
@@ -171,8 +781,11 @@ def main():  # pragma: no cover
             args.alice_rs_group,
             args.birdseye_url,
             not args.disable_ssl_verify,
+            args.mrt_updates,
+            args.alice_crawl_state,
+            options,
         )
-    )
+    loop.run_until_complete(coroutine)
     loop.close()
 
 
@@ -1,6 +1,15 @@
+import dataclasses
 import enum
 from dataclasses import dataclass
-from typing import Optional, Set
+from typing import Dict, FrozenSet, Iterable, List, Optional, Type, TypeVar, cast
+
+T = TypeVar("T")
+
+# Maximum number of distinct community sets shared between routes. The table
+# is cleared when full, so that memory use stays bounded for diverse routes.
+COMMUNITIES_TABLE_SIZE = 100000
+
+_communities_table: Dict[FrozenSet[str], FrozenSet[str]] = {}
 
 
 class RPKIStatus(enum.Enum):
@@ -10,12 +19,65 @@ class RPKIStatus(enum.Enum):
     not_found = "NOT_FOUND"
 
 
+def slotted(cls: Type[T]) -> Type[T]:
+    """
+    Recreate a dataclass with __slots__ for its fields, like dataclass(slots=True)
+    in Python 3.10 and later. Instances then have no __dict__, which saves
+    memory for classes with many instances.
+    """
+    field_names = tuple(field.name for field in dataclasses.fields(cls))
+    namespace = dict(cls.__dict__)
+    namespace["__slots__"] = field_names
+    # Class attributes with default values would conflict with the slots,
+    # the defaults are kept by the generated __init__.
+    for name in field_names:
+        namespace.pop(name, None)
+    namespace.pop("__dict__", None)
+    namespace.pop("__weakref__", None)
+    return cast(Type[T], type(cls.__name__, cls.__bases__, namespace))
+
+
+@slotted
 @dataclass
 class RouteEntry:
+    """
+    A single route. Routes are created in large numbers, so use
+    intern_communities() and sys.intern() for the communities and AS path,
+    so that these are shared between routes where possible.
+    """
+
     origin: Optional[int]
     aspath: str
     prefix: str
     peer_ip: str
     peer_as: int
-    communities: Set[str]
+    communities: FrozenSet[str]
     source: Optional[str] = None
+    # Seconds since the epoch at which the route was announced, if known
+    timestamp: Optional[float] = None
+
+
+@slotted
+@dataclass
+class RIBEntry:
+    """
+    All routes for a single prefix, as found in one or more
+    consecutive records of an MRT RIB dump.
+    """
+
+    prefix: str
+    routes: List[RouteEntry]
+
+
+def intern_communities(communities: Iterable[str]) -> FrozenSet[str]:
+    """
+    Return the communities as a frozenset, which is shared with other routes
+    that have the same communities, as long as the table has room.
+    """
+    key = frozenset(communities)
+    shared = _communities_table.get(key)
+    if shared is None:
+        if len(_communities_table) >= COMMUNITIES_TABLE_SIZE:
+            _communities_table.clear()
+        shared = _communities_table[key] = key
+    return shared
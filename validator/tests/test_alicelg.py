@@ -1,7 +1,8 @@
 import pytest
 from aioresponses import aioresponses
 
-from ..alicelg import get_routes, query_rpki_invalid_community
+from ..alicelg import get_routes, neighbor_source, query_rpki_invalid_community
+from ..crawlstate import CrawlState
 from ..status import RouteEntry
 
 PAYLOAD_CONFIG = {
@@ -20,14 +21,28 @@ PAYLOAD_ROUTESERVERS = {
 
 PAYLOAD_NEIGHBORS = {
     "neighbors": [
-        {"id": "peer1", "state": "up", "address": "192.0.2.1", "asn": 64501},
+        {
+            "id": "peer1",
+            "state": "up",
+            "address": "192.0.2.1",
+            "asn": 64501,
+            "routes_received": 1,
+            "uptime": 3600,
+        },
         {"id": "peer-ignored", "state": "down"},
     ],
 }
 
 PAYLOAD_NEIGHBOURS = {
     "neighbours": [
-        {"id": "peer1", "state": "up", "address": "192.0.2.1", "asn": 64501},
+        {
+            "id": "peer1",
+            "state": "up",
+            "address": "192.0.2.1",
+            "asn": 64501,
+            "routes_received": 1,
+            "uptime": 3600,
+        },
         {"id": "peer-ignored", "state": "down"},
     ],
 }
@@ -46,11 +61,23 @@ PAYLOAD_ROUTES = {
 }
 
 
+def routes_page(page, total_pages, prefix):
+    return {
+        "imported": [
+            {
+                "network": prefix,
+                "bgp": {"as_path": [64501]},
+            }
+        ],
+        "pagination": {"page": page, "page_size": 1, "total_pages": total_pages},
+    }
+
+
 def prepare_query_rpki_invalid_community(http_mock, payload=PAYLOAD_CONFIG):
     http_mock.get("http://example.net/api/v1/config", status=200, payload=payload)
 
 
-def prepare_get_routes(http_mock):
+def prepare_get_neighbors(http_mock):
     http_mock.get(
         "http://example.net/api/v1/routeservers", status=200, payload=PAYLOAD_ROUTESERVERS
     )
@@ -64,13 +91,17 @@ def prepare_get_routes(http_mock):
         status=200,
         payload=PAYLOAD_NEIGHBOURS,
     )
+
+
+def prepare_get_routes(http_mock):
+    prepare_get_neighbors(http_mock)
     http_mock.get(
-        "http://example.net/api/v1/routeservers/server1/neighbors/peer1/routes",
+        "http://example.net/api/v1/routeservers/server1/neighbors/peer1/routes/received",
         status=200,
         payload=PAYLOAD_ROUTES,
     )
     http_mock.get(
-        "http://example.net/api/v1/routeservers/server2/neighbors/peer1/routes",
+        "http://example.net/api/v1/routeservers/server2/neighbors/peer1/routes/received",
         status=200,
         payload=PAYLOAD_ROUTES,
     )
@@ -101,11 +132,17 @@ async def test_query_rpki_invalid_community():
 
 
 @pytest.mark.asyncio
-async def test_get_routes():
+@pytest.mark.parametrize("stream_json", [False, True])
+async def test_get_routes(stream_json):
     with aioresponses() as http_mock:
         prepare_get_routes(http_mock)
-        response = [r async for r in get_routes("http://example.net/api/v1", "group1")]
-    assert response == [
+        response = [
+            r
+            async for r in get_routes(
+                "http://example.net/api/v1", "group1", stream_json=stream_json
+            )
+        ]
+    assert sorted(response, key=lambda route: route.source) == [
         RouteEntry(
             origin=64502,
             aspath="64501 64502",
@@ -125,3 +162,61 @@ async def test_get_routes():
             source="Alice LG route server server2 peer peer1",
         ),
     ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream_json", [False, True])
+async def test_get_routes_paginated(stream_json):
+    url = "http://example.net/api/v1/routeservers/server1/neighbors/peer1/routes/received"
+    with aioresponses() as http_mock:
+        http_mock.get(
+            "http://example.net/api/v1/routeservers",
+            status=200,
+            payload={"routeservers": [{"id": "server1", "group": "group1"}]},
+        )
+        http_mock.get(
+            "http://example.net/api/v1/routeservers/server1/neighbors",
+            status=200,
+            payload=PAYLOAD_NEIGHBORS,
+        )
+        http_mock.get(url, status=200, payload=routes_page(0, 3, "192.0.2.0/24"))
+        http_mock.get(url + "?page=1", status=200, payload=routes_page(1, 3, "198.51.100.0/24"))
+        http_mock.get(url + "?page=2", status=200, payload=routes_page(2, 3, "203.0.113.0/24"))
+        response = [
+            r async for r in get_routes("http://example.net/api/v1", stream_json=stream_json)
+        ]
+
+    assert ["192.0.2.0/24", "198.51.100.0/24", "203.0.113.0/24"] == sorted(
+        route.prefix for route in response
+    )
+    assert {"Alice LG route server server1 peer peer1"} == {route.source for route in response}
+    assert {64501} == {route.origin for route in response}
+
+
+@pytest.mark.asyncio
+async def test_get_routes_crawl_state(tmp_path):
+    path = str(tmp_path / "state.json")
+    crawl_state = CrawlState(path, "context")
+    with aioresponses() as http_mock:
+        prepare_get_routes(http_mock)
+        routes = get_routes("http://example.net/api/v1", "group1", crawl_state=crawl_state)
+        response = [r async for r in crawl_state.count_routes(routes)]
+    assert 2 == len(response)
+    assert 2 == crawl_state.fetched
+    crawl_state.save()
+
+    # Unchanged neighbors are not fetched again
+    crawl_state = CrawlState(path, "context")
+    with aioresponses() as http_mock:
+        prepare_get_neighbors(http_mock)
+        routes = get_routes("http://example.net/api/v1", "group1", crawl_state=crawl_state)
+        assert [] == [r async for r in routes]
+    assert 2 == len(crawl_state.reused)
+    assert 2 == crawl_state.reused_route_count()
+
+
+def test_neighbor_source():
+    url = "http://example.net/api/v1/routeservers/server1/neighbors/peer1/routes/received"
+    assert "Alice LG route server server1 peer peer1" == neighbor_source(url)
+    assert "Alice LG route server server1 peer peer1" == neighbor_source(url + "?page=2")
+    assert neighbor_source("http://example.net/api/v1/routeservers/server1/neighbors") is None
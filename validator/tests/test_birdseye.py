@@ -2,6 +2,7 @@ import pytest
 from aioresponses import aioresponses
 
 from ..birdseye import get_routes
+from ..concurrency import PeerTimings, RequestDeadlines
 from ..status import RouteEntry
 
 PAYLOAD_PROTOCOLS = {
@@ -39,10 +40,18 @@ def prepare_get_routes(http_mock):
 
 
 @pytest.mark.asyncio
-async def test_get_routes():
+@pytest.mark.parametrize("stream_json", [False, True])
+async def test_get_routes(stream_json):
+    timings = PeerTimings()
     with aioresponses() as http_mock:
         prepare_get_routes(http_mock)
-        response = [r async for r in get_routes("http://example.net/api/", True)]
+        response = [
+            r
+            async for r in get_routes(
+                "http://example.net/api/", True, stream_json=stream_json, timings=timings
+            )
+        ]
+    assert "Bird's Eye peer peer1: 1 routes in 1 requests" in timings.stats_str()
     print(response)
     assert response == [
         RouteEntry(
@@ -55,3 +64,58 @@ async def test_get_routes():
             source="Bird's Eye peer peer1",
         ),
     ]
+
+
+@pytest.mark.asyncio
+async def test_get_routes_largest_first():
+    protocols = {
+        f"peer{size}": {
+            "state": "up",
+            "neighbor_address": "192.0.2.1",
+            "neighbor_as": 64501,
+            "routes": {"imported": size},
+        }
+        for size in [1, 100, 10]
+    }
+    with aioresponses() as http_mock:
+        http_mock.get(
+            "http://example.net/api/protocols/bgp/", status=200, payload={"protocols": protocols}
+        )
+        for name in protocols:
+            http_mock.get(
+                f"http://example.net/api/routes/protocol/{name}", status=200, payload={"routes": []}
+            )
+        response = [r async for r in get_routes("http://example.net/api/", True)]
+        urls = [str(url) for _, url in http_mock.requests]
+    assert [] == response
+    assert [
+        "http://example.net/api/protocols/bgp/",
+        "http://example.net/api/routes/protocol/peer100",
+        "http://example.net/api/routes/protocol/peer10",
+        "http://example.net/api/routes/protocol/peer1",
+    ] == urls
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream_json", [False, True])
+async def test_get_routes_timeout(stream_json):
+    protocols = dict(
+        PAYLOAD_PROTOCOLS["protocols"],
+        peer2={"state": "up", "neighbor_address": "192.0.2.2", "neighbor_as": 64502},
+    )
+    deadlines = RequestDeadlines()
+    with aioresponses() as http_mock:
+        http_mock.get(
+            "http://example.net/api/protocols/bgp/", status=200, payload={"protocols": protocols}
+        )
+        prepare_get_routes(http_mock)
+        http_mock.get("http://example.net/api/routes/protocol/peer2", timeout=True)
+        response = [
+            r
+            async for r in get_routes(
+                "http://example.net/api/", True, stream_json=stream_json, deadlines=deadlines
+            )
+        ]
+    # The routes of peers that timed out are left out
+    assert ["Bird's Eye peer peer1"] == [route.source for route in response]
+    assert ["http://example.net/api/routes/protocol/peer2"] == deadlines.timed_out
@@ -0,0 +1,259 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp_retry import RetryClient
+from aioresponses import CallbackResult, aioresponses
+
+from ..concurrency import (
+    LATENCY_SIZE_UNIT,
+    AdaptiveLimiter,
+    PeerTimings,
+    RequestDeadlines,
+    RequestTimeout,
+    schedule_by_size,
+)
+from ..utils import aio_get_json, aio_stream_json
+
+
+def test_adaptive_limiter_aimd():
+    limiter = AdaptiveLimiter(4, floor=2, ceiling=6)
+    # Additive increase: about one for every limit successful requests
+    for _ in range(5):
+        limiter._record(0.1, False, 0)
+    assert 5 == int(limiter.limit)
+    for _ in range(20):
+        limiter._record(0.1, False, 0)
+    assert 6 == limiter.limit
+    assert 6 == limiter.peak
+
+    # Multiplicative decrease, once for requests started in the same epoch
+    limiter._record(0.1, True, 0)
+    limiter._record(0.1, True, 0)
+    assert 3 == limiter.limit
+    # A latency far above the smoothed latency is congestion as well
+    limiter._record(10, False, 1)
+    assert 2 == limiter.limit
+    # Large responses are compared relative to their size
+    limiter._record(10, False, 2, size=100 * LATENCY_SIZE_UNIT)
+    assert 2 == limiter.decreases
+    limiter._record(10, False, 2, size=LATENCY_SIZE_UNIT)
+    assert 3 == limiter.decreases
+    # Small latencies are not congestion, even if relatively slow
+    limiter = AdaptiveLimiter(4)
+    limiter._record(0.01, False, 0)
+    limiter._record(0.1, False, 0)
+    assert 0 == limiter.decreases
+    assert limiter.limit > 4
+
+    with pytest.raises(ValueError, match="Invalid concurrency range 4-2"):
+        AdaptiveLimiter(4, floor=4, ceiling=2)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_request():
+    limiter = AdaptiveLimiter(2, floor=1, ceiling=2)
+    max_in_flight = 0
+
+    async def request():
+        nonlocal max_in_flight
+        async with limiter.request("http://example.net/"):
+            max_in_flight = max(max_in_flight, limiter.in_flight)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*[request() for _ in range(5)])
+    assert 2 == max_in_flight
+    assert 0 == limiter.in_flight
+    assert 5 == limiter.requests
+
+    with pytest.raises(ValueError):
+        async with limiter.request("http://example.net/"):
+            raise ValueError()
+    assert 1 == limiter.errors
+    assert 1 == limiter.limit
+    assert "Looking glass concurrency: 1 at the end of the run (peak 2, range 1-2)" in (
+        limiter.stats_str()
+    )
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_rate(monkeypatch):
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    limiter = AdaptiveLimiter(4, requests_per_second=2)
+    monkeypatch.setattr("asyncio.sleep", sleep)
+    for url in ["http://example.net/a", "http://example.net/b", "http://example.com/"]:
+        async with limiter.request(url):
+            pass
+    # Only the second request to the same host waits
+    assert 1 == len(sleeps)
+    assert 0.4 < sleeps[0] <= 0.5
+
+
+@pytest.mark.asyncio
+async def test_aio_get_json_limiter(monkeypatch):
+    limiter = AdaptiveLimiter(4)
+    sizes = []
+    record = limiter._record
+
+    def record_size(latency, error, epoch, size=0):
+        sizes.append(size)
+        record(latency, error, epoch, size)
+
+    monkeypatch.setattr(limiter, "_record", record_size)
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/ok", status=200, payload={"key": "value"})
+        http_mock.get("http://example.net/overloaded", status=503, payload={}, repeat=True)
+        async with RetryClient(raise_for_status=False) as client:
+            result = await aio_get_json(client, "http://example.net/ok", ["key"], limiter=limiter)
+            assert ("value", None) == result
+            await aio_get_json(client, "http://example.net/overloaded", limiter=limiter)
+    assert 2 == limiter.requests
+    assert 1 == limiter.errors
+    assert 1 == limiter.decreases
+    assert [len('{"key": "value"}'), len("{}")] == sizes
+
+
+@pytest.mark.asyncio
+async def test_aio_get_json_hedged_limiter():
+    limiter = AdaptiveLimiter(2, floor=1, ceiling=2)
+    deadlines = RequestDeadlines(timeout=5)
+    for _ in range(20):
+        deadlines.record(0.01)
+    deadlines.requests = 100
+    in_flight = []
+
+    async def respond(url, **kwargs):
+        in_flight.append(limiter.in_flight)
+        if len(in_flight) == 1:
+            await asyncio.sleep(10)
+        return CallbackResult(status=200, payload={"key": "value"})
+
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/slow", callback=respond, repeat=True)
+        async with RetryClient(raise_for_status=False) as client:
+            result = await aio_get_json(
+                client, "http://example.net/slow", ["key"], limiter=limiter, deadlines=deadlines
+            )
+    assert ("value", None) == result
+    # The hedged request took a slot of its own
+    assert [1, 2] == in_flight
+    assert 1 == deadlines.hedge_wins
+    assert 0 == limiter.in_flight
+
+
+@pytest.mark.asyncio
+async def test_aio_stream_json_latency(monkeypatch):
+    monkeypatch.setattr("validator.utils.READ_CHUNK_SIZE", 16)
+    limiter = AdaptiveLimiter(4)
+    deadlines = RequestDeadlines()
+    latencies = []
+    record = limiter._record
+
+    def record_latency(latency, error, epoch, size=0):
+        latencies.append(latency)
+        record(latency, error, epoch, size)
+
+    monkeypatch.setattr(limiter, "_record", record_latency)
+    payload = {"routes": [{"network": f"192.0.2.{i}/32"} for i in range(5)]}
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/routes", status=200, payload=payload)
+        async with RetryClient(raise_for_status=False) as client:
+            async for _ in aio_stream_json(
+                client,
+                "http://example.net/routes",
+                ["routes"],
+                limiter=limiter,
+                deadlines=deadlines,
+            ):
+                # A slow consumer
+                await asyncio.sleep(0.05)
+    # Time spent waiting for the consumer is not latency
+    assert latencies[0] < 0.05
+    assert deadlines._latencies[-1] < 0.05
+
+
+def test_schedule_by_size():
+    sizes = [10, None, 500, 20, 1000, 30, 5, 40]
+    order = schedule_by_size(sizes)
+    # Largest first, with every fourth position for the smallest remaining peer
+    assert [1000, 500, 40, None, 30, 20, 10, 5] == [sizes[index] for index in order]
+    assert [] == schedule_by_size([])
+
+
+def test_peer_timings():
+    timings = PeerTimings()
+    # As if the crawl started ten seconds ago
+    timings.start -= 10
+    timings.record("peer2", time.monotonic(), 1)
+    timings.record("peer1", timings.start, 10)
+    timings.record("peer1", timings.start + 1, 5, requests=0)
+    lines = timings.stats_str().splitlines()
+    assert "Peer timings, slowest first, in seconds since the start of the crawl:" == lines[0]
+    assert lines[1].startswith("    peer1: 15 routes in 1 requests, 0.00-10.0")
+    assert lines[2].startswith("    peer2: 1 routes in 1 requests, 10.0")
+
+
+@pytest.mark.asyncio
+async def test_request_deadlines():
+    deadlines = RequestDeadlines(timeout=0.2)
+    assert 0.2 == deadlines.deadline()
+    assert deadlines.hedge_delay() is None
+    for _ in range(20):
+        deadlines.record(0.01)
+    # Never above the timeout
+    assert 0.2 == deadlines.deadline()
+    assert RequestDeadlines(timeout=600).deadline() == 600
+    # No hedging budget yet
+    assert deadlines.hedge_delay() is None
+    deadlines.requests = 100
+
+    attempts = []
+
+    def attempt(*delays, error=None):
+        async def request():
+            index = len(attempts)
+            attempts.append(index)
+            await asyncio.sleep(delays[index])
+            if error and index == 0:
+                raise error
+            return delays[index]
+
+        attempts.clear()
+        return request
+
+    # A stuck request is hedged, and the hedged request is used
+    assert 0 == await deadlines.run("http://example.net/a", attempt(10, 0))
+    assert 1 == deadlines.hedges
+    assert 1 == deadlines.hedge_wins
+    # The first attempt fails after the hedge started, the hedge succeeds
+    assert 0.05 == await deadlines.run("http://example.net/b", attempt(0.03, 0.05, error=OSError))
+    # A request that fails before it is hedged fails
+    with pytest.raises(OSError):
+        await deadlines.run("http://example.net/c", attempt(0, error=OSError))
+    # Timeouts of the client are missed deadlines
+    with pytest.raises(RequestTimeout):
+        await deadlines.run("http://example.net/d", attempt(0, error=asyncio.TimeoutError))
+    # Stuck requests miss the deadline
+    with pytest.raises(RequestTimeout, match="http://example.net/e timed out after 0.2s"):
+        await deadlines.run("http://example.net/e", attempt(10, 10))
+    assert ["http://example.net/d", "http://example.net/e"] == deadlines.timed_out
+    # Requests completing before the hedge delay are recorded as well
+    latency_count = len(deadlines._latencies)
+    for _ in range(50):
+        assert 0 == await deadlines.run("http://example.net/f", attempt(0))
+    assert latency_count + 50 == len(deadlines._latencies)
+
+    # The hedged request is made by hedge, if given
+    async def hedge():
+        return "hedge"
+
+    assert "hedge" == await deadlines.run("http://example.net/g", attempt(10), hedge)
+    assert deadlines.stats_str().endswith(
+        "2 timed out\n"
+        "    Timed out, routes missing or incomplete: http://example.net/d\n"
+        "    Timed out, routes missing or incomplete: http://example.net/e"
+    )
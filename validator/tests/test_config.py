@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from ..config import SourceConfig, load_sources
+
+
+def _write_config(tmp_path, config):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_load_sources(tmp_path):
+    path = _write_config(
+        tmp_path,
+        {
+            "sources": [
+                {
+                    "name": "ix-1",
+                    "alice_url": "https://lg.example.net/api/v1/",
+                    "alice_rs_group": "group1",
+                    "communities_expected_invalid": ["64500:1", "64500:2"],
+                    "alice_crawl_state": "state/ix-1.json",
+                },
+                {"birdseye_url": "https://lg.example.org/rs1/api/"},
+                {"mrt_file": ["dumps/a.mrt", "/data/b-*.mrt"]},
+                {"name": "ix-4", "mrt_updates": "updates.*.mrt"},
+            ]
+        },
+    )
+    assert load_sources(path) == [
+        SourceConfig(
+            name="ix-1",
+            alice_url="https://lg.example.net/api/v1/",
+            alice_rs_group="group1",
+            communities_expected_invalid={"64500:1", "64500:2"},
+            alice_crawl_state=str(tmp_path / "state/ix-1.json"),
+        ),
+        SourceConfig(
+            name="https://lg.example.org/rs1/api/", birdseye_url="https://lg.example.org/rs1/api/"
+        ),
+        SourceConfig(
+            name="dumps/a.mrt",
+            mrt_file=[str(tmp_path / "dumps/a.mrt"), "/data/b-*.mrt"],
+        ),
+        SourceConfig(name="ix-4", mrt_updates=[str(tmp_path / "updates.*.mrt")]),
+    ]
+
+
+@pytest.mark.parametrize(
+    "config,message",
+    [
+        ([], "should have a list of sources"),
+        ({"sources": []}, "has no sources"),
+        ({"sources": ["https://lg.example.net/"]}, "Invalid source"),
+        ({"sources": [{"url": "https://lg.example.net/"}]}, "Unknown options.*: url"),
+        ({"sources": [{"name": "ix-1"}]}, "exactly one of"),
+        (
+            {"sources": [{"alice_url": "https://lg.example.net/", "mrt_file": "a.mrt"}]},
+            "exactly one of",
+        ),
+        (
+            {"sources": [{"name": "ix-1", "mrt_file": "a.mrt"}, {"name": "ix-1", "mrt_file": "b"}]},
+            "duplicate source names: ix-1",
+        ),
+    ],
+)
+def test_load_sources_invalid(tmp_path, config, message):
+    path = _write_config(tmp_path, config)
+    with pytest.raises(ValueError, match=message):
+        load_sources(path)
@@ -0,0 +1,75 @@
+import pytest
+
+from ..crawlstate import CrawlState, crawl_context
+from ..status import RouteEntry, RPKIStatus
+
+SOURCE = "Alice LG route server rs1 peer peer1"
+NEIGHBOR = {"id": "peer1", "routes_received": 2, "routes_filtered": 0, "uptime": 3600}
+RESULT = {
+    "status": RPKIStatus.invalid,
+    "route": {
+        "origin": 64502,
+        "aspath": "64501 64502",
+        "prefix": "192.0.2.0/24",
+        "peer_ip": "192.0.2.1",
+        "peer_as": 64501,
+        "communities": {"64501:2", "64501:1"},
+        "source": SOURCE,
+        "timestamp": None,
+    },
+    "roas": [{"prefix": "192.0.2.0/24", "asn": 0, "max_length": 24}],
+}
+
+
+async def _routes():
+    for prefix in ["192.0.2.0/24", "198.51.100.0/24"]:
+        yield RouteEntry(64502, "64501 64502", prefix, "192.0.2.1", 64501, set(), SOURCE)
+    # Routes from other sources are not counted
+    yield RouteEntry(64502, "64501 64502", prefix, "192.0.2.1", 64501, set(), "other")
+
+
+def _run(path, context, neighbor=NEIGHBOR):
+    crawl_state = CrawlState(path, context)
+    reused = crawl_state.check_neighbor(SOURCE, neighbor)
+    crawl_state.save()
+    return crawl_state, reused
+
+
+@pytest.mark.asyncio
+async def test_crawl_state(tmp_path):
+    path = str(tmp_path / "state.json")
+    context = crawl_context("digest", {"64501:1"}, False)
+    crawl_state = CrawlState(path, context)
+    assert not crawl_state.check_neighbor(SOURCE, NEIGHBOR)
+    assert 3 == len([route async for route in crawl_state.count_routes(_routes())])
+    crawl_state.add_result(RESULT)
+    crawl_state.add_result(dict(RESULT, route=dict(RESULT["route"], source="other")))
+    crawl_state.save()
+
+    # The uptime may increase, and the neighbor may be listed differently
+    crawl_state, reused = _run(path, context, dict(NEIGHBOR, uptime=7200, state="up"))
+    assert reused
+    assert 2 == crawl_state.reused_route_count()
+    assert [RESULT] == list(crawl_state.reused_results())
+    assert "Alice LG crawl state: 1 neighbors unchanged, 0 neighbors fetched" == (
+        crawl_state.stats_str()
+    )
+
+    # A session reset, or changed route counts
+    assert not _run(path, context, dict(NEIGHBOR, uptime=60))[1]
+    assert _run(path, context, dict(NEIGHBOR, uptime=120))[1]
+    assert not _run(path, context, dict(NEIGHBOR, uptime=180, routes_received=3))[1]
+    # A changed context, e.g. other ROAs
+    assert not _run(path, crawl_context("other", {"64501:1"}, False))[1]
+    # Neighbors that do not report route counts are always fetched
+    assert not _run(path, context, {"id": "peer1"})[1]
+    assert not _run(path, context, {"id": "peer1"})[1]
+
+
+def test_crawl_state_unusable(tmp_path, capsys):
+    path = tmp_path / "state.json"
+    path.write_text("{")
+    crawl_state, reused = _run(str(path), "context")
+    assert not reused
+    assert "Ignoring unusable crawl state" in capsys.readouterr().out
+    assert crawl_context("digest", set(), False) != crawl_context("digest", set(), True)
@@ -0,0 +1,93 @@
+import pytest
+
+from ..dedup import DigestSet, RouteDeduplicator, route_digest
+from ..status import RIBEntry, RouteEntry, RPKIStatus
+
+
+def _route(prefix, source, aspath="64501 64502", peer_ip="192.0.2.1"):
+    return RouteEntry(64502, aspath, prefix, peer_ip, 64501, set(), source)
+
+
+def _result(route):
+    return {"status": RPKIStatus.invalid, "route": {"source": route.source}, "roas": []}
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+def test_route_digest():
+    digest = route_digest(_route("192.0.2.0/24", "rs1"))
+    assert 0 < digest < 2**64
+    # Only the peer, prefix and AS path identify a route
+    assert digest == route_digest(_route("192.0.2.0/24", "rs2"))
+    assert digest != route_digest(_route("192.0.2.0/24", "rs1", aspath="64501 64503"))
+    assert digest != route_digest(_route("192.0.2.0/24", "rs1", peer_ip="192.0.2.2"))
+    assert digest != route_digest(_route("198.51.100.0/24", "rs1"))
+
+
+def test_digest_set():
+    digests = DigestSet(capacity=4)
+    # Colliding slots, and enough digests to grow the table a few times
+    values = [4, 8, 12, 1, 2**64 - 1] + list(range(100, 200))
+    assert all(digests.add(value) for value in values)
+    assert not any(digests.add(value) for value in values)
+    assert len(values) == len(digests)
+    assert 256 == len(digests._table)
+
+
+@pytest.mark.asyncio
+async def test_route_deduplicator():
+    deduplicator = RouteDeduplicator()
+    routes = [
+        _route("192.0.2.0/24", "rs1"),
+        _route("198.51.100.0/24", "rs1"),
+        _route("203.0.113.0/24", "rs1"),
+        # Duplicate of a route that is still being validated
+        _route("192.0.2.0/24", "rs2"),
+    ]
+    unique = [route async for route in deduplicator.filter(_aiter(routes))]
+    assert unique == routes[:3]
+
+    # Only the first and last route are reported
+    deduplicator.add_results([_result(routes[0]), None, _result(routes[2])])
+    # Duplicates of routes with known results
+    later_routes = [
+        _route("192.0.2.0/24", "rs3"),
+        _route("198.51.100.0/24", "rs2"),
+        _route("203.0.113.0/24", "rs2"),
+    ]
+    assert [route async for route in deduplicator.filter(_aiter(later_routes))] == []
+
+    reported = list(deduplicator.reported_results())
+    assert reported == [
+        (_result(routes[0]), ["rs1", "rs2", "rs3"]),
+        (_result(routes[2]), ["rs1", "rs2"]),
+    ]
+    assert deduplicator.unique == 3
+    assert deduplicator.duplicates == 4
+    assert (
+        deduplicator.stats_str()
+        == "Route deduplication: 3 unique routes validated, 4 duplicate routes skipped"
+    )
+
+
+@pytest.mark.asyncio
+async def test_route_deduplicator_rib_entries():
+    deduplicator = RouteDeduplicator()
+    entries = [
+        RIBEntry("192.0.2.0/24", [_route("192.0.2.0/24", "a.mrt")]),
+        RIBEntry(
+            "192.0.2.0/24",
+            [_route("192.0.2.0/24", "b.mrt"), _route("192.0.2.0/24", "b.mrt", peer_ip="192.0.2.2")],
+        ),
+        RIBEntry("198.51.100.0/24", [_route("198.51.100.0/24", "a.mrt")]),
+        RIBEntry("198.51.100.0/24", [_route("198.51.100.0/24", "b.mrt")]),
+    ]
+    unique = [entry async for entry in deduplicator.filter(_aiter(entries))]
+    assert unique == [
+        entries[0],
+        RIBEntry("192.0.2.0/24", [entries[1].routes[1]]),
+        entries[2],
+    ]
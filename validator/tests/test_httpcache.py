@@ -0,0 +1,162 @@
+import pytest
+from aiohttp_retry import RetryClient
+from aioresponses import aioresponses
+from yarl import URL
+
+from ..httpcache import HTTPCache, alice_cache_expiry
+from ..utils import aio_get_json, aio_get_routes, aio_stream_json
+
+URL_ROUTES = "http://example.net/api/routes"
+PAYLOAD = {"routes": [{"network": "192.0.2.0/24"}, {"network": "198.51.100.0/24"}]}
+
+
+def test_http_cache(tmp_path):
+    cache = HTTPCache(str(tmp_path / "cache"))
+    assert cache.fresh_body(URL_ROUTES) is None
+    assert {} == cache.conditional_headers(URL_ROUTES)
+    assert cache.not_modified_body(URL_ROUTES) is None
+
+    headers = {"ETag": '"abc"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    cache.store(URL_ROUTES, headers, b"{}", {})
+    assert {
+        "If-None-Match": '"abc"',
+        "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+    } == cache.conditional_headers(URL_ROUTES)
+    # No Alice LG expiry, so never fresh
+    assert cache.fresh_body(URL_ROUTES) is None
+    assert b"{}" == cache.not_modified_body(URL_ROUTES)
+
+    cache.store(URL_ROUTES, {}, b"{}", {"api": {"ttl": "2999-01-01T00:00:00.123456789Z"}})
+    assert {} == cache.conditional_headers(URL_ROUTES)
+    assert b"{}" == cache.fresh_body(URL_ROUTES)
+    assert [] == list((tmp_path / "cache").glob(".tmp-*"))
+
+    # Interrupted writes are not stored
+    writer = cache.writer(URL_ROUTES, {})
+    writer.write(b"{")
+    writer.discard()
+    assert b"{}" == cache.fresh_body(URL_ROUTES)
+    assert [] == list((tmp_path / "cache").glob(".tmp-*"))
+
+    # Entries with a body that does not match the metadata are ignored
+    next((tmp_path / "cache").glob("*.body")).write_bytes(b"[]]")
+    assert cache.fresh_body(URL_ROUTES) is None
+    for meta in [b"invalid", b"[]"]:
+        next((tmp_path / "cache").glob("*.meta")).write_bytes(meta)
+        assert {} == cache.conditional_headers(URL_ROUTES)
+
+    assert 2 == cache.fresh_hits
+    assert 1 == cache.not_modified_hits
+    assert 3 == cache.misses
+    assert "Looking glass cache: 3 hits (2 fresh, 1 not modified), 3 misses" in cache.stats_str()
+
+
+def test_alice_cache_expiry():
+    assert alice_cache_expiry([]) is None
+    assert alice_cache_expiry({"api": {"ttl": "invalid"}}) is None
+    assert 1600000000 == alice_cache_expiry({"api": {"ttl": "2020-09-13T12:26:40Z"}})
+    assert 1600000000 == alice_cache_expiry({"api": {"ttl": "2020-09-13T12:26:40"}})
+    cache_status = {"cached_at": "2020-09-13T12:25:40.5+00:00", "orig_ttl": 60}
+    assert 1600000000.5 == alice_cache_expiry({"api": {"cache_status": cache_status}})
+
+
+@pytest.mark.parametrize(
+    "ttl,expected",
+    [
+        ("2020-09-13T12:26:40.5Z", 1600000000.5),
+        ("2020-09-13T12:26:40.25+00:00", 1600000000.25),
+        ("2020-09-13T12:26:40.1234Z", 1600000000.1234),
+        ("2020-09-13T12:26:40.12345+02:00", 1599992800.12345),
+        ("2020-09-13T12:26:40.1234567Z", 1600000000.123456),
+        ("2020-09-13T12:26:40.123456789Z", 1600000000.123456),
+    ],
+)
+def test_alice_cache_expiry_fractions(ttl, expected):
+    assert expected == pytest.approx(alice_cache_expiry({"api": {"ttl": ttl}}), abs=1e-6)
+    assert alice_cache_expiry({"api": {"cache_status": {"orig_ttl": 60}}}) is None
+
+
+@pytest.mark.asyncio
+async def test_aio_get_json_cache(tmp_path):
+    cache = HTTPCache(str(tmp_path))
+    async with RetryClient(raise_for_status=False) as client:
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=200, payload=PAYLOAD, headers={"ETag": '"v1"'})
+            http_mock.get(URL_ROUTES, status=304)
+            first, _ = await aio_get_json(client, URL_ROUTES, ["routes"], cache=cache)
+            second, _ = await aio_get_json(client, URL_ROUTES, ["routes"], cache=cache)
+            request = http_mock.requests[("GET", URL(URL_ROUTES))][1]
+        assert PAYLOAD["routes"] == first == second
+        assert '"v1"' == request.kwargs["headers"]["If-None-Match"]
+        assert 1 == cache.not_modified_hits
+
+        # If the cache entry disappeared, the request is repeated unconditionally
+        for path in tmp_path.glob("*.body"):
+            path.unlink()
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=304)
+            http_mock.get(URL_ROUTES, status=200, payload=PAYLOAD)
+            third, _ = await aio_get_json(client, URL_ROUTES, ["routes"], cache=cache)
+        assert PAYLOAD["routes"] == third
+
+
+@pytest.mark.asyncio
+async def test_aio_get_routes_cache(tmp_path, monkeypatch):
+    # Decoded in a worker process, and stored from a thread
+    monkeypatch.setattr("validator.utils.OFFLOAD_MIN_JSON_SIZE", 0)
+    cache = HTTPCache(str(tmp_path))
+    route = {"network": "192.0.2.0/24", "bgp": {"as_path": [64500]}}
+    payload = {"routes": [route], "api": {"ttl": "2999-01-01T00:00:00Z"}}
+    async with RetryClient(raise_for_status=False) as client:
+        for _ in range(2):
+            other = {}
+            with aioresponses() as http_mock:
+                http_mock.get(URL_ROUTES, status=200, payload=payload)
+                routes, _ = await aio_get_routes(
+                    client, URL_ROUTES, ["routes"], other=other, cache=cache
+                )
+            assert ["192.0.2.0/24"] == routes.prefixes
+            assert {"api": payload["api"]} == other
+    # Still valid according to Alice LG, so no request is made the second time
+    assert 1 == cache.fresh_hits
+    assert 1 == cache.misses
+
+
+@pytest.mark.asyncio
+async def test_aio_stream_json_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr("validator.utils.READ_CHUNK_SIZE", 16)
+    cache = HTTPCache(str(tmp_path))
+    payload = dict(PAYLOAD, api={"ttl": "2999-01-01T00:00:00Z"})
+
+    async def stream(other=None):
+        batches = aio_stream_json(client, URL_ROUTES, ["routes"], other=other, cache=cache)
+        return [item async for items in batches for item in items]
+
+    async with RetryClient(raise_for_status=False) as client:
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=200, payload=payload)
+            assert PAYLOAD["routes"] == await stream()
+        # Still valid according to Alice LG, so no request is made at all
+        other = {}
+        assert PAYLOAD["routes"] == await stream(other)
+        assert {"api": payload["api"]} == other
+        assert 1 == cache.fresh_hits
+
+        cache.store(URL_ROUTES, {"ETag": '"v1"'}, b'{"routes": [1]}', {})
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=304)
+            assert [1] == await stream()
+        for path in tmp_path.glob("*.body"):
+            path.unlink()
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=304)
+            http_mock.get(URL_ROUTES, status=200, payload=PAYLOAD)
+            assert PAYLOAD["routes"] == await stream()
+
+        # Incomplete responses are not cached
+        cache.store(URL_ROUTES, {"ETag": '"v2"'}, b'{"routes": [1]}', {})
+        with aioresponses() as http_mock:
+            http_mock.get(URL_ROUTES, status=200, body='{"routes": [1, 2')
+            with pytest.raises(ValueError):
+                await stream()
+        assert {"If-None-Match": '"v2"'} == cache.conditional_headers(URL_ROUTES)
@@ -1,12 +1,13 @@
 # flake8: noqa: W293
+import json
 import textwrap
 from pathlib import Path
 
 import pytest
 from aioresponses import aioresponses
 
-from ..run import run
-from . import test_alicelg, test_birdseye
+from ..run import RunOptions, run, run_config
+from . import test_alicelg, test_birdseye, test_replay
 
 ROA_FILE = Path(__file__).parent / "roa_test.json"
 
@@ -54,6 +55,108 @@ async def test_integration_mrt(capsys):
     assert "RPKI valid: prefix 185.186.11.0/24 from origin AS26695" in output.out
 
 
+@pytest.mark.asyncio
+async def test_integration_mrt_native(capsys):
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+
+    await run(
+        roa_file=ROA_FILE,
+        verbose=False,
+        communities_expected_invalid=set(),
+        path_bgpdump=None,
+        mrt_file=mrt_file,
+        alice_url=None,
+        alice_rs_group=None,
+        birdseye_url=None,
+        options=RunOptions(native_mrt_parser=True),
+    )
+    output = capsys.readouterr()
+    expected = textwrap.dedent(
+        """
+        RPKI invalid: prefix 185.186.79.0/24 from origin AS136258
+        Received from peer: 193.239.116.255 AS34307
+        AS path: 9009 136258
+        Communities: 213279:34307:492 213279:9009:492 34307:52115 9009:50045 9009:55160 9009:888 9009:999
+        ROAs found:
+            Prefix 185.186.79.0/24, ASN 64496, max length 28
+            Prefix 185.186.79.0/24, ASN 64497, max length 24
+
+        Processed 23 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
+    ).strip()
+    assert expected == output.out.strip()
+
+
+@pytest.mark.asyncio
+async def test_integration_mrt_multiple_files(capsys):
+    mrt_files = [
+        str(Path(__file__).parent / "185.186.nlix.mrt"),
+        str(Path(__file__).parent / "namex-*.mrt"),
+    ]
+
+    await run(
+        roa_file=ROA_FILE,
+        verbose=False,
+        communities_expected_invalid=set(),
+        path_bgpdump=None,
+        mrt_file=mrt_files,
+        alice_url=None,
+        alice_rs_group=None,
+        birdseye_url=None,
+        options=RunOptions(native_mrt_parser=True),
+    )
+    output = capsys.readouterr()
+    assert f"Source: {mrt_files[0]}\n" in output.out
+    assert output.out.strip().endswith(
+        textwrap.dedent(
+            f"""
+            Processed 23 route entries from {mrt_files[0]}, found 1 unexpected RPKI invalid entries
+            Processed 432 route entries from {Path(__file__).parent / "namex-bgpd-rib-inet6.mrt"}, found 0 unexpected RPKI invalid entries
+            Processed 455 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
+        ).strip()
+    )
+
+
+@pytest.mark.asyncio
+async def test_integration_mrt_updates(capsys, tmp_path):
+    announce = test_replay.bgp4mp(
+        4,
+        test_replay.update(
+            attributes=test_replay.path_attributes([64500, 136258], asn_format="I"),
+            announced=test_replay.nlri("185.186.79.0/24"),
+        ),
+    )
+    updates_file = tmp_path / "updates.mrt"
+    updates_file.write_bytes(announce + announce)
+
+    await run(
+        roa_file=ROA_FILE,
+        verbose=False,
+        communities_expected_invalid=set(),
+        path_bgpdump=None,
+        mrt_file=None,
+        alice_url=None,
+        alice_rs_group=None,
+        birdseye_url=None,
+        mrt_updates=[str(updates_file)],
+    )
+    output = capsys.readouterr()
+    expected = textwrap.dedent(
+        """
+        RPKI invalid: prefix 185.186.79.0/24 from origin AS136258
+        Received from peer: 192.0.2.1 AS64500
+        AS path: 64500 136258
+        Communities: <none>
+        Time: 2020-09-13T12:26:40+00:00
+        ROAs found:
+            Prefix 185.186.79.0/24, ASN 64496, max length 28
+            Prefix 185.186.79.0/24, ASN 64497, max length 24
+
+        Replayed 2 BGP updates: 1 new or changed announcements, 1 unchanged announcements, 0 withdrawals, 0 peer resets
+        Processed 1 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
+    ).strip()
+    assert expected == output.out.strip()
+
+
 @pytest.mark.asyncio
 async def test_integration_alice(capsys):
     with aioresponses() as http_mock:
@@ -74,6 +177,8 @@ async def test_integration_alice(capsys):
     expected = textwrap.dedent(
         """
         Using BGP communities 64501:10:20 as expected RPKI invalid
+        Looking glass concurrency: 5 at the end of the run (peak 5, range 2-32), 5 requests, 0 errors, 0 decreases
+        Looking glass deadlines: 0 hedged requests (0 faster than the original), 0 timed out
         Processed 2 route entries, 6 ROAs, found 0 unexpected RPKI invalid entries"""
     ).strip()
     assert expected == output.out.strip()
@@ -112,11 +217,50 @@ async def test_integration_alice(capsys):
         ROAs found:
             Prefix 192.0.2.0/24, ASN 0, max length 24
         
+        Looking glass concurrency: 5 at the end of the run (peak 5, range 2-32), 5 requests, 0 errors, 0 decreases
+        Looking glass deadlines: 0 hedged requests (0 faster than the original), 0 timed out
         Processed 2 route entries, 6 ROAs, found 2 unexpected RPKI invalid entries"""
     ).strip()
     assert expected == output.out.strip()
 
 
+@pytest.mark.asyncio
+async def test_integration_alice_dedup(capsys):
+    with aioresponses() as http_mock:
+        test_alicelg.prepare_get_routes(http_mock)
+
+        await run(
+            roa_file=ROA_FILE,
+            verbose=False,
+            communities_expected_invalid={"64501:999"},
+            path_bgpdump=None,
+            mrt_file=None,
+            alice_url="http://example.net/api/v1",
+            alice_rs_group="group1",
+            birdseye_url=None,
+            options=RunOptions(dedup=True),
+        )
+    output = capsys.readouterr()
+    expected = textwrap.dedent(
+        """
+        Using BGP communities 64501:999 as expected RPKI invalid
+        RPKI invalid: prefix 192.0.2.0/24 from origin AS64502
+        Received from peer: 192.0.2.1 AS64501
+        AS path: 64501 64502
+        Communities: 64501:1 64501:10:20 64501:2
+        Source: Alice LG route server server1 peer peer1
+        Source: Alice LG route server server2 peer peer1
+        ROAs found:
+            Prefix 192.0.2.0/24, ASN 0, max length 24
+        
+        Looking glass concurrency: 5 at the end of the run (peak 5, range 2-32), 5 requests, 0 errors, 0 decreases
+        Looking glass deadlines: 0 hedged requests (0 faster than the original), 0 timed out
+        Route deduplication: 1 unique routes validated, 1 duplicate routes skipped
+        Processed 1 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
+    ).strip()
+    assert expected == output.out.strip()
+
+
 @pytest.mark.asyncio
 async def test_integration_birdseye(capsys):
     with aioresponses() as http_mock:
@@ -143,6 +287,248 @@ async def test_integration_birdseye(capsys):
         ROAs found:
             Prefix 192.0.2.0/24, ASN 0, max length 24
         
+        Looking glass concurrency: 10 at the end of the run (peak 10, range 2-32), 2 requests, 0 errors, 0 decreases
+        Looking glass deadlines: 0 hedged requests (0 faster than the original), 0 timed out
         Processed 1 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
     ).strip()
     assert expected == output.out.strip()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workers", [1, 2])
+async def test_integration_config(capsys, tmp_path, workers):
+    config_file = tmp_path / "config.json"
+    sources = [
+        {"name": "ix-1", "alice_url": "http://example.net/api/v1", "alice_rs_group": "group1"},
+        {"birdseye_url": "http://example.net/api/"},
+        {"name": "ix-3", "mrt_file": str(Path(__file__).parent / "namex-*.mrt")},
+        {"name": "ix-4", "birdseye_url": "http://unreachable.example.net/api/"},
+    ]
+    config_file.write_text(json.dumps({"sources": sources}))
+    with aioresponses() as http_mock:
+        test_alicelg.prepare_query_rpki_invalid_community(http_mock)
+        test_alicelg.prepare_get_routes(http_mock)
+        test_birdseye.prepare_get_routes(http_mock)
+
+        counts = await run_config(
+            str(config_file),
+            roa_file=ROA_FILE,
+            verbose=False,
+            communities_expected_invalid=set(),
+            options=RunOptions(native_mrt_parser=True, workers=workers),
+        )
+    # With workers, the sources share a pool, but keep their own expected invalid communities
+    assert counts == (435, 1)
+    output = capsys.readouterr().out
+    expected_birdseye = textwrap.dedent(
+        """
+        Results for source http://example.net/api/:
+        RPKI invalid: prefix 192.0.2.0/24 from origin AS64502
+        Received from peer: 192.0.2.1 AS64501
+        AS path: 64501 64502
+        Communities: 64501:1 64501:10:20 64501:2
+        Source: Bird's Eye peer peer1
+        ROAs found:
+            Prefix 192.0.2.0/24, ASN 0, max length 24
+        
+        Looking glass concurrency: 10 at the end of the run (peak 10, range 2-32), 2 requests, 0 errors, 0 decreases
+        Looking glass deadlines: 0 hedged requests (0 faster than the original), 0 timed out
+        Processed 1 route entries, 6 ROAs, found 1 unexpected RPKI invalid entries"""
+    )
+    assert expected_birdseye in output
+    assert output.index("Results for source ix-1:") < output.index(expected_birdseye)
+    assert "Results for source ix-3:\nProcessed 432 route entries, 6 ROAs" in output
+    assert "Failed to validate routes from source ix-4: " in output
+    assert output.strip().endswith(
+        textwrap.dedent(
+            """
+            Processed 435 route entries from 3 sources, 6 ROAs, found 1 unexpected RPKI invalid entries
+            Failed to validate routes from 1 sources"""
+        ).strip()
+    )
+
+
+@pytest.mark.asyncio
+async def test_integration_config_verbose_workers(capsys, tmp_path):
+    config_file = tmp_path / "config.json"
+    sources = [
+        {"name": "ix-1", "mrt_file": str(Path(__file__).parent / "namex-*.mrt")},
+        {"name": "ix-2", "mrt_file": str(Path(__file__).parent / "namex-*.mrt")},
+    ]
+    config_file.write_text(json.dumps({"sources": sources}))
+    counts = await run_config(
+        str(config_file),
+        roa_file=ROA_FILE,
+        verbose=True,
+        communities_expected_invalid=set(),
+        options=RunOptions(native_mrt_parser=True, workers=2),
+    )
+    assert counts == (864, 0)
+    output = capsys.readouterr().out
+    # Pool statistics are reported once for all sources, before the totals
+    assert 1 == output.count("in 2 worker processes")
+    assert output.index("Results for source ix-2:") < output.index("in 2 worker processes")
+    assert output.strip().endswith(
+        "Processed 864 route entries from 2 sources, 6 ROAs, found 0 unexpected RPKI invalid entries"
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("dedup", [False, True])
+async def test_integration_alice_crawl_state(capsys, tmp_path, dedup):
+    outputs = []
+    for prepare in [test_alicelg.prepare_get_routes, test_alicelg.prepare_get_neighbors]:
+        with aioresponses() as http_mock:
+            prepare(http_mock)
+
+            await run(
+                roa_file=ROA_FILE,
+                verbose=False,
+                communities_expected_invalid={"64501:999"},
+                path_bgpdump=None,
+                mrt_file=None,
+                alice_url="http://example.net/api/v1",
+                alice_rs_group="group1",
+                birdseye_url=None,
+                alice_crawl_state=str(tmp_path / "state.json"),
+                options=RunOptions(dedup=dedup),
+            )
+        outputs.append(capsys.readouterr().out)
+    assert "Alice LG crawl state: 0 neighbors unchanged, 2 neighbors fetched" in outputs[0]
+    assert "Alice LG crawl state: 2 neighbors unchanged, 0 neighbors fetched" in outputs[1]
+    # The results of the previous run are reused
+    for output in outputs:
+        if dedup:
+            assert 1 == output.count("RPKI invalid: prefix 192.0.2.0/24 from origin AS64502")
+            assert "Source: Alice LG route server server2 peer peer1" in output
+            assert "found 1 unexpected RPKI invalid" in output
+        else:
+            assert 2 == output.count("RPKI invalid: prefix 192.0.2.0/24 from origin AS64502")
+            assert "Processed 2 route entries, 6 ROAs, found 2 unexpected RPKI invalid" in output
+
+
+@pytest.mark.asyncio
+async def test_integration_alice_crawl_state_timeout(capsys, tmp_path):
+    outputs = []
+    for timeout in [True, False]:
+        with aioresponses() as http_mock:
+            http_mock.get(
+                "http://example.net/api/v1/routeservers/server2/neighbors/peer1/routes/received",
+                timeout=timeout,
+                payload=test_alicelg.PAYLOAD_ROUTES,
+            )
+            test_alicelg.prepare_get_routes(http_mock)
+
+            await run(
+                roa_file=ROA_FILE,
+                verbose=False,
+                communities_expected_invalid={"64501:999"},
+                path_bgpdump=None,
+                mrt_file=None,
+                alice_url="http://example.net/api/v1",
+                alice_rs_group="group1",
+                birdseye_url=None,
+                alice_crawl_state=str(tmp_path / "state.json"),
+            )
+        outputs.append(capsys.readouterr().out)
+    assert "1 timed out" in outputs[0]
+    assert "found 1 unexpected RPKI invalid" in outputs[0]
+    # The neighbor that timed out is fetched again
+    assert "Alice LG crawl state: 1 neighbors unchanged, 1 neighbors fetched" in outputs[1]
+    assert "found 2 unexpected RPKI invalid" in outputs[1]
+
+
+@pytest.mark.asyncio
+async def test_integration_birdseye_lg_cache(capsys, tmp_path):
+    for not_modified in [False, True]:
+        with aioresponses() as http_mock:
+            if not_modified:
+                http_mock.get("http://example.net/api/protocols/bgp/", status=304)
+                http_mock.get("http://example.net/api/routes/protocol/peer1", status=304)
+            else:
+                test_birdseye.prepare_get_routes(http_mock)
+
+            await run(
+                roa_file=ROA_FILE,
+                verbose=False,
+                communities_expected_invalid=set(),
+                path_bgpdump=None,
+                mrt_file=None,
+                alice_url=None,
+                alice_rs_group=None,
+                birdseye_url="http://example.net/api/",
+                options=RunOptions(lg_cache_dir=str(tmp_path)),
+            )
+    output = capsys.readouterr().out
+    assert "Looking glass cache: 0 hits (0 fresh, 0 not modified), 2 misses" in output
+    assert "Looking glass cache: 2 hits (0 fresh, 2 not modified), 0 misses" in output
+    assert 2 == output.count("AS path: 64501 64502")
+
+
+@pytest.mark.asyncio
+async def test_integration_roa_cache(capsys, tmp_path):
+    for _ in range(2):
+        with aioresponses() as http_mock:
+            test_birdseye.prepare_get_routes(http_mock)
+
+            await run(
+                roa_file=ROA_FILE,
+                verbose=False,
+                communities_expected_invalid=set(),
+                path_bgpdump=None,
+                mrt_file=None,
+                alice_url=None,
+                alice_rs_group=None,
+                birdseye_url="http://example.net/api/",
+                options=RunOptions(
+                    roa_cache_dir=str(tmp_path), roa_cache_clear=True, compact_roas=True
+                ),
+            )
+        output = capsys.readouterr()
+        assert output.out.startswith("Removed ")
+        assert "Processed 1 route entries, 6 ROAs, found 1 unexpected" in output.out
+        assert 1 == len(list(tmp_path.glob("roas-*.snapshot")))
+
+
+@pytest.mark.asyncio
+async def test_integration_birdseye_verbose(capsys):
+    with aioresponses() as http_mock:
+        test_birdseye.prepare_get_routes(http_mock)
+
+        await run(
+            roa_file=ROA_FILE,
+            verbose=True,
+            communities_expected_invalid=set(),
+            path_bgpdump=None,
+            mrt_file=None,
+            alice_url=None,
+            alice_rs_group=None,
+            birdseye_url="http://example.net/api/",
+        )
+    output = capsys.readouterr()
+    assert "RPKI invalid: prefix 192.0.2.0/24 from origin AS64502" in output.out
+    assert "Validation cache: 0 hits, 1 misses (0.0% hit rate), 1 entries" in output.out
+    assert "    Bird's Eye peer peer1: 1 routes in 1 requests, " in output.out
+
+
+@pytest.mark.asyncio
+async def test_integration_workers(capsys):
+    outputs = []
+    for workers in [1, 2]:
+        with aioresponses() as http_mock:
+            test_birdseye.prepare_get_routes(http_mock)
+
+            await run(
+                roa_file=ROA_FILE,
+                verbose=True,
+                communities_expected_invalid=set(),
+                path_bgpdump=None,
+                mrt_file=None,
+                alice_url=None,
+                alice_rs_group=None,
+                birdseye_url="http://example.net/api/",
+                options=RunOptions(workers=workers),
+            )
+        outputs.append(capsys.readouterr().out)
+    assert "Validation cache: 0 hits, 1 misses (0.0% hit rate), in 2 worker processes" in outputs[1]
+    assert outputs[0].split("Validation cache")[0] == outputs[1].split("Validation cache")[0]
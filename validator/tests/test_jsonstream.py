@@ -0,0 +1,146 @@
+import io
+import json
+
+import pytest
+
+from ..jsonstream import JSONArrayParser, iter_json_array
+
+DATA = {
+    "metadata": {"counts": [1, 2, 3], "generated": 1600000000},
+    "roas": [
+        {"asn": "AS64496", "prefix": "192.0.2.0/24", "maxLength": 24},
+        {"asn": 64497, "prefix": "2001:db8::/32", "maxLength": 48},
+        [],
+        12345,
+        "string with ] and } and é",
+    ],
+    "trailer": None,
+}
+
+
+def test_parser_single_feed():
+    parser = JSONArrayParser(["roas"])
+    items = parser.feed(json.dumps(DATA))
+    items += parser.close()
+
+    assert DATA["roas"] == items
+    assert parser.found
+    assert {"metadata": DATA["metadata"], "trailer": None} == parser.other
+
+
+def test_parser_char_by_char():
+    parser = JSONArrayParser(["missing", "roas"])
+    items = []
+    for char in json.dumps(DATA, indent=2):
+        items += parser.feed(char)
+    items += parser.close()
+
+    assert DATA["roas"] == items
+
+
+def test_parser_number_at_end_of_chunk():
+    parser = JSONArrayParser(["values"])
+    assert [] == parser.feed('{"values": [12')
+    assert [123] == parser.feed("3, 4")
+    assert [45] == parser.feed("5]")
+    assert [] == parser.feed("}")
+    assert [] == parser.close()
+
+
+@pytest.mark.parametrize(
+    "pieces",
+    [
+        ['{"values": [1.', "5, 2]}"],
+        ['{"values": [0, 1.', "5, 2]}"],
+        ['{"values": [1e', "5, 2]}"],
+        ['{"values": [0, 1e', "5, 2]}"],
+        ['{"values": [0, 1e-', "5, 2]}"],
+        ['{"values": [0, -', "1.5e+5, 2]}"],
+    ],
+)
+def test_parser_number_split(pieces):
+    parser = JSONArrayParser(["values"])
+    items = []
+    for piece in pieces:
+        items += parser.feed(piece)
+    items += parser.close()
+    assert json.loads("".join(pieces))["values"] == items
+
+
+def test_parser_empty_objects():
+    parser = JSONArrayParser(["roas"])
+    assert [] == parser.feed("{}")
+    assert [] == parser.close()
+    assert not parser.found
+
+    parser = JSONArrayParser(["roas"])
+    assert [] == parser.feed('{"other": {}, "roas": [{}')
+    assert [{}, {}] == parser.feed(", {} ]")
+    assert [] == parser.feed("}")
+    assert [] == parser.close()
+    assert {"other": {}} == parser.other
+
+
+def test_parser_incomplete_item():
+    parser = JSONArrayParser(["roas"])
+    assert [] == parser.feed('{"roas": [1')
+    assert [12] == parser.feed("2]}")
+    assert [] == parser.close()
+
+
+def test_parser_errors():
+    parser = JSONArrayParser(["roas"])
+    parser.feed('{"roas": [1, 2')
+    with pytest.raises(ValueError):
+        parser.close()
+
+    parser = JSONArrayParser(["roas"])
+    with pytest.raises(ValueError):
+        parser.feed("[]")
+
+    parser = JSONArrayParser(["roas"])
+    with pytest.raises(ValueError):
+        parser.feed('{"roas": [1; 2]}')
+
+    parser = JSONArrayParser(["roas"])
+    parser.feed('{"roas": [1, tru')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_parser_trailing_data():
+    parser = JSONArrayParser(["roas"])
+    assert [1] == parser.feed('{"roas": [1]} \n')
+    assert [] == parser.close()
+
+    parser = JSONArrayParser(["roas"])
+    parser.feed('{"roas": [1]} ')
+    parser.feed("x")
+    with pytest.raises(ValueError, match="trailing data at JSON position 14"):
+        parser.close()
+
+
+def test_parser_error_position():
+    parser = JSONArrayParser(["roas"])
+    parser.feed('{"roas": [1, 2, ')
+    parser.feed("3, 4 ")
+    with pytest.raises(ValueError, match="Expected ',' at JSON position 21"):
+        parser.feed("; 5]}")
+
+    parser = JSONArrayParser(["roas"])
+    parser.feed('{"roas": [1, 2, ')
+    parser.feed("3, tru")
+    with pytest.raises(ValueError, match="JSON position 19"):
+        parser.close()
+
+
+def test_iter_json_array():
+    data = json.dumps(DATA).encode("utf-8")
+    # Small chunks, to also split multi byte UTF-8 characters
+    items = list(iter_json_array(io.BytesIO(data), ["roas"], chunk_size=3))
+    assert DATA["roas"] == items
+
+    assert [] == list(iter_json_array(io.BytesIO(b'{"roas": []}'), ["roas"]))
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.BytesIO(b'{"other": [1]}'), ["roas"]))
@@ -1,16 +1,27 @@
+import gzip
+import io
 from pathlib import Path
 
 import pytest
 
-from ..mrt import RouteEntry, parse_mrt
+from .. import mrt
+from ..mrt import (
+    RouteEntry,
+    expand_mrt_files,
+    parse_mrt,
+    parse_mrt_rib_entries,
+    parse_mrt_updates,
+)
+from . import test_replay
 
 
 @pytest.mark.asyncio
-async def test_parse_mrt_v2():
+@pytest.mark.parametrize("native", [False, True])
+async def test_parse_mrt_v2(native):
     # This is an MRT file containing all routes under 185.186.0.0/16
     # as seen from an NL-IX route server session with RPKI checks disabled
     mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
-    entries = [entry async for entry in parse_mrt(mrt_file)]
+    entries = [entry async for entry in parse_mrt(mrt_file, native=native)]
 
     assert 23 == len(entries)
     assert (
@@ -54,11 +65,12 @@ async def test_parse_mrt_v2():
 
 
 @pytest.mark.asyncio
-async def test_parse_mrt_v1():
+@pytest.mark.parametrize("native", [False, True])
+async def test_parse_mrt_v1(native):
     # This is an MRT file containing a NAMEX snapshot in table dump v1
     # format, including cases where the AS path attribute contains 23456
     mrt_file = Path(__file__).parent / "namex-bgpd-rib-inet6.mrt"
-    entries = [entry async for entry in parse_mrt(mrt_file)]
+    entries = [entry async for entry in parse_mrt(mrt_file, native=native)]
 
     assert 432 == len(entries)
     # Record 9 contains AS23456 in AS path, but has an AS4 path
@@ -73,3 +85,118 @@ async def test_parse_mrt_v1():
         )
         == entries[9]
     )
+
+
+@pytest.mark.asyncio
+async def test_parse_mrt_bgpdump_failure():
+    # "false" exits with a non-zero status, without any output
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+    with pytest.raises(Exception, match="Failed to parse MRT file with bgpdump"):
+        [entry async for entry in parse_mrt(mrt_file, path_bgpdump="false")]
+
+
+@pytest.mark.asyncio
+async def test_parse_mrt_native_yields_to_event_loop(monkeypatch):
+    monkeypatch.setattr(mrt, "NATIVE_RECORDS_PER_YIELD", 1)
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+    entries = [entry async for entry in parse_mrt(mrt_file, native=True)]
+    assert 23 == len(entries)
+
+
+@pytest.mark.asyncio
+async def test_parse_mrt_rib_entries():
+    # Table dump v1 has one record per route, which are grouped per prefix
+    mrt_file = Path(__file__).parent / "namex-bgpd-rib-inet6.mrt"
+    entries = [entry async for entry in parse_mrt(mrt_file, native=True)]
+    rib_entries = [entry async for entry in parse_mrt_rib_entries(mrt_file, native=True)]
+
+    assert 359 == len(rib_entries)
+    assert entries == [route for rib_entry in rib_entries for route in rib_entry.routes]
+    for rib_entry in rib_entries:
+        assert {rib_entry.prefix} == {route.prefix for route in rib_entry.routes}
+    assert entries[9] == rib_entries[6].routes[0]
+
+
+def test_expand_mrt_files():
+    tests_dir = Path(__file__).parent
+    assert [str(tests_dir / "185.186.nlix.mrt")] == expand_mrt_files(tests_dir / "185.186.nlix.mrt")
+    assert [
+        str(tests_dir / "185.186.nlix.mrt"),
+        str(tests_dir / "namex-bgpd-rib-inet6.mrt"),
+    ] == expand_mrt_files([str(tests_dir / "*.mrt")])
+    with pytest.raises(Exception, match="No MRT files found matching"):
+        expand_mrt_files([str(tests_dir / "*.missing")])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("native", [False, True])
+async def test_parse_mrt_compressed(tmp_path, native):
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+    compressed_file = tmp_path / "185.186.nlix.mrt.gz"
+    compressed_file.write_bytes(gzip.compress(mrt_file.read_bytes()))
+
+    entries = [entry async for entry in parse_mrt(mrt_file, native=native)]
+    assert entries == [entry async for entry in parse_mrt(compressed_file, native=native)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("native", [False, True])
+async def test_parse_mrt_stdin(monkeypatch, native):
+    mrt_file = Path(__file__).parent / "namex-bgpd-rib-inet6.mrt"
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(mrt_file.read_bytes())))
+    monkeypatch.setattr("sys.stdin", stdin)
+
+    entries = [entry async for entry in parse_mrt("-", native=native)]
+    assert 432 == len(entries)
+
+
+@pytest.mark.asyncio
+async def test_parse_mrt_rib_entries_cache(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(mrt, "CACHED_RIB_ENTRIES_PER_YIELD", 1)
+    mrt_file = Path(__file__).parent / "namex-bgpd-rib-inet6.mrt"
+    cache_dir = tmp_path / "cache"
+    rib_entries = [entry async for entry in parse_mrt_rib_entries(mrt_file, native=True)]
+
+    for _ in range(2):
+        cached = [
+            entry
+            async for entry in parse_mrt_rib_entries(mrt_file, native=True, cache_dir=cache_dir)
+        ]
+        assert rib_entries == cached
+        assert 1 == len(list(cache_dir.iterdir()))
+
+    # The cache is used instead of the MRT file
+    cache_path = next(cache_dir.iterdir())
+    mrt_copy = tmp_path / "copy.mrt"
+    mrt_copy.write_bytes(mrt_file.read_bytes())
+    cache_path.write_bytes(b"invalid")
+    cached = [
+        entry async for entry in parse_mrt_rib_entries(mrt_copy, native=True, cache_dir=cache_dir)
+    ]
+    assert rib_entries == cached
+    assert (
+        f"Ignoring unusable MRT cache {cache_path}: cache is truncated" in capsys.readouterr().out
+    )
+    assert rib_entries == [
+        entry async for entry in parse_mrt_rib_entries(mrt_copy, native=True, cache_dir=cache_dir)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_parse_mrt_updates(tmp_path, monkeypatch):
+    monkeypatch.setattr(mrt, "NATIVE_RECORDS_PER_YIELD", 1)
+    announce = test_replay.bgp4mp(
+        1,
+        test_replay.update(
+            attributes=test_replay.path_attributes([64500]),
+            announced=test_replay.nlri("192.0.2.0/24"),
+        ),
+    )
+    withdraw = test_replay.bgp4mp(1, test_replay.update(withdrawn=test_replay.nlri("192.0.2.0/24")))
+    updates_files = [tmp_path / "updates1.mrt", tmp_path / "updates2.mrt"]
+    updates_files[0].write_bytes(announce)
+    updates_files[1].write_bytes(announce + withdraw + announce)
+
+    # State is kept across files, so the second file starts with an unchanged announcement
+    entries = [entry async for entry in parse_mrt_updates(updates_files)]
+    assert 2 == len(entries)
@@ -0,0 +1,196 @@
+import bz2
+import gzip
+import io
+import socket
+import struct
+from pathlib import Path
+
+import pytest
+
+from .. import mrtreader
+from ..mrtreader import (
+    AS_CONFED_SEQUENCE,
+    AS_CONFED_SET,
+    AS_SEQUENCE,
+    AS_SET,
+    MRTReader,
+    _format_as_path,
+    _merge_as4_path,
+    _origin,
+    iter_mrt_records,
+    iter_mrt_stream_records,
+    read_mrt,
+)
+from ..status import RouteEntry
+
+
+def mrt_record(mrt_type, subtype, body):
+    return struct.pack(">IHHI", 1600000000, mrt_type, subtype, len(body)) + body
+
+
+def attribute(attribute_type, value, flags=0x40):
+    if len(value) > 255:
+        return struct.pack(">BBH", flags | 0x10, attribute_type, len(value)) + value
+    return struct.pack(">BBB", flags, attribute_type, len(value)) + value
+
+
+def as_path(segments, asn_format="I"):
+    value = b""
+    for segment_type, asns in segments:
+        value += struct.pack(f">BB{len(asns)}{asn_format}", segment_type, len(asns), *asns)
+    return value
+
+
+def peer_index_table():
+    body = struct.pack(">IH", 0, 0) + struct.pack(">H", 2)
+    # IPv4 peer with 2 byte AS, IPv6 peer with 4 byte AS
+    body += struct.pack(">BI", 0, 1) + socket.inet_pton(socket.AF_INET, "192.0.2.1")
+    body += struct.pack(">H", 64500)
+    body += struct.pack(">BI", 3, 2) + socket.inet_pton(socket.AF_INET6, "2001:db8::1")
+    body += struct.pack(">I", 4200000000)
+    return mrt_record(13, 1, body)
+
+
+def test_table_dump_v2_add_path():
+    attributes = attribute(2, as_path([(AS_SEQUENCE, [64500, 4200000000])]))
+    attributes += attribute(8, struct.pack(">III", 0xFFFFFF01, 0xFFFFFF03, (64500 << 16) + 1))
+    attributes += attribute(32, struct.pack(">III", 4200000000, 1, 2) * 100)
+    body = struct.pack(">IB", 7, 32) + socket.inet_pton(socket.AF_INET6, "2001:db8::")[:4]
+    body += struct.pack(">H", 2)
+    for peer_index, path_id in [(0, 1), (1, 2)]:
+        body += struct.pack(">HII", peer_index, 0, path_id)
+        body += struct.pack(">H", len(attributes)) + attributes
+
+    data = peer_index_table() + mrt_record(13, 10, body) + mrt_record(16, 4, b"ignored")
+    reader = MRTReader()
+    routes = [
+        route
+        for _, mrt_type, subtype, record_body in iter_mrt_records(memoryview(data))
+        for route in reader.routes_from_record(mrt_type, subtype, record_body)
+    ]
+    expected_communities = {"no-export", "local-AS", "64500:1", "4200000000:1:2"}
+    assert [
+        RouteEntry(
+            origin=4200000000,
+            aspath="64500 4200000000",
+            prefix="2001:db8::/32",
+            peer_ip="192.0.2.1",
+            peer_as=64500,
+            communities=expected_communities,
+        ),
+        RouteEntry(
+            origin=4200000000,
+            aspath="64500 4200000000",
+            prefix="2001:db8::/32",
+            peer_ip="2001:db8::1",
+            peer_as=4200000000,
+            communities=expected_communities,
+        ),
+    ] == routes
+
+
+def test_table_dump_v1_as4_path():
+    attributes = attribute(2, as_path([(AS_SEQUENCE, [64500, 23456, 23456])], "H"))
+    attributes += attribute(17, as_path([(AS_SEQUENCE, [4200000000]), (AS_SET, [4200000001])]))
+    body = struct.pack(">HH", 0, 1) + socket.inet_pton(socket.AF_INET, "198.51.100.0")
+    body += struct.pack(">BBI", 24, 1, 0) + socket.inet_pton(socket.AF_INET, "192.0.2.1")
+    body += struct.pack(">HH", 64500, len(attributes)) + attributes
+
+    reader = MRTReader()
+    assert [
+        RouteEntry(
+            origin=None,
+            aspath="64500 4200000000 {4200000001}",
+            prefix="198.51.100.0/24",
+            peer_ip="192.0.2.1",
+            peer_as=64500,
+            communities=set(),
+        )
+    ] == reader.routes_from_record(12, 1, body)
+
+
+def test_merge_as4_path():
+    as4_path = [(AS_SEQUENCE, (4200000000, 4200000001))]
+    assert [
+        (AS_SET, (64500, 64501)),
+        (AS_SEQUENCE, (64502,)),
+        (AS_SEQUENCE, (4200000000, 4200000001)),
+    ] == _merge_as4_path(
+        [(AS_SET, (64500, 64501)), (AS_SEQUENCE, (64502, 23456, 23456))],
+        as4_path,
+    )
+    # AS4_PATH longer than AS_PATH is ignored
+    assert [(AS_SEQUENCE, (23456,))] == _merge_as4_path([(AS_SEQUENCE, (23456,))], as4_path)
+    # Confederation segments are not counted, but kept
+    assert [
+        (AS_CONFED_SEQUENCE, (64512,)),
+        (AS_SEQUENCE, (4200000000, 4200000001)),
+    ] == _merge_as4_path([(AS_CONFED_SEQUENCE, (64512,)), (AS_SEQUENCE, (23456, 23456))], as4_path)
+    assert as4_path == _merge_as4_path([(AS_SEQUENCE, (23456, 23456))], as4_path)
+
+
+def test_format_as_path():
+    assert "" == _format_as_path([])
+    assert _origin([]) is None
+    assert "(64512 64513) [64514,64515] 64500 {64501,64502,64503}" == _format_as_path(
+        [
+            (AS_CONFED_SEQUENCE, (64512, 64513)),
+            (AS_CONFED_SET, (64514, 64515)),
+            (AS_SEQUENCE, (64500,)),
+            (AS_SET, (64501, 64502)),
+            (AS_SET, (64503,)),
+        ]
+    )
+
+
+def test_read_mrt(tmp_path):
+    empty_file = tmp_path / "empty.mrt"
+    empty_file.write_bytes(b"")
+    assert [] == list(read_mrt(empty_file))
+
+    truncated_file = tmp_path / "truncated.mrt"
+    truncated_file.write_bytes(peer_index_table()[:-1])
+    with pytest.raises(ValueError, match="Truncated MRT record at offset 0"):
+        list(read_mrt(truncated_file))
+
+    truncated_file.write_bytes(peer_index_table() + b"\0")
+    with pytest.raises(ValueError, match="Truncated MRT record header"):
+        list(read_mrt(truncated_file))
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, bz2.compress])
+def test_read_mrt_compressed(tmp_path, compress):
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+    compressed_file = tmp_path / "compressed.mrt"
+    compressed_file.write_bytes(compress(mrt_file.read_bytes()))
+    assert list(read_mrt(mrt_file)) == list(read_mrt(compressed_file))
+
+
+@pytest.mark.parametrize("compress", [None, gzip.compress])
+def test_read_mrt_stdin(monkeypatch, compress):
+    mrt_file = Path(__file__).parent / "185.186.nlix.mrt"
+    data = mrt_file.read_bytes()
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(compress(data) if compress else data)))
+    monkeypatch.setattr("sys.stdin", stdin)
+    assert list(read_mrt(mrt_file)) == list(read_mrt("-"))
+    assert not stdin.closed
+
+
+def test_iter_mrt_stream_records(monkeypatch):
+    # Records are split across chunks
+    monkeypatch.setattr(mrtreader, "STREAM_CHUNK_SIZE", 5)
+    data = peer_index_table() + mrt_record(16, 4, b"ignored")
+    records = [
+        (mrt_type, subtype, bytes(body))
+        for _, mrt_type, subtype, body in iter_mrt_stream_records(io.BytesIO(data))
+    ]
+    assert [
+        (mrt_type, subtype, bytes(body))
+        for _, mrt_type, subtype, body in iter_mrt_records(memoryview(data))
+    ] == records
+    assert 2 == len(records)
+
+    with pytest.raises(ValueError, match="Truncated MRT record at offset 0"):
+        list(iter_mrt_stream_records(io.BytesIO(peer_index_table()[:-1])))
+    with pytest.raises(ValueError, match=f"Truncated MRT record header at offset {len(data)}"):
+        list(iter_mrt_stream_records(io.BytesIO(data + b"\0")))
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from ..parallel import ProcessPoolValidator
+from ..roaindex import ROAIndex
+from ..status import RIBEntry, RouteEntry
+from ..validate import validate_many, validate_rib_entries
+
+
+async def chunk_generator(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _collect(stream):
+    return [result async for result in stream]
+
+
+def make_routes(count):
+    return [
+        RouteEntry(
+            origin=64500 + (i % 3),
+            aspath=f"64499 {64500 + (i % 3)}",
+            prefix=f"192.0.{i % 7}.0/24",
+            peer_ip="192.0.2.1",
+            peer_as=64499,
+            communities={"64500:1"} if i % 5 == 0 else set(),
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cache_size", [0, 100])
+async def test_process_pool_validator(cache_size):
+    roa_index = ROAIndex()
+    roa_index.add("192.0.0.0/22", 64500, 24)
+    roa_index.add("192.0.4.0/24", 64501, 24)
+
+    routes = make_routes(50)
+    chunks = [routes[i : i + 7] for i in range(0, len(routes), 7)]  # noqa: E203
+
+    pool = ProcessPoolValidator(2, roa_index, {"64500:1"}, False, cache_size)
+    results = [result async for result in pool.validate_chunks(chunk_generator(chunks))]
+    pool.close()
+
+    assert [
+        validate_many(chunk, roa_index, {"64500:1"}, verbose=False) for chunk in chunks
+    ] == results
+    if cache_size:
+        assert 0 < pool.misses < len(routes)
+        assert pool.hits > 0
+    else:
+        assert 0 == pool.hits == pool.misses
+    assert "in 2 worker processes" in pool.stats_str()
+
+
+@pytest.mark.asyncio
+async def test_process_pool_validator_rib_entries():
+    roa_index = ROAIndex()
+    roa_index.add("192.0.0.0/22", 64500, 24)
+
+    routes = make_routes(50)
+    rib_entries = [
+        RIBEntry(prefix=prefix, routes=[route for route in routes if route.prefix == prefix])
+        for prefix in sorted({route.prefix for route in routes})
+    ]
+    chunks = [rib_entries[:3], rib_entries[3:]]
+
+    pool = ProcessPoolValidator(2, roa_index, {"64500:1"}, True, 100)
+    results = [
+        result
+        async for result in pool.validate_chunks(chunk_generator(chunks), validate_rib_entries)
+    ]
+    pool.close()
+    assert [
+        validate_rib_entries(chunk, roa_index, {"64500:1"}, verbose=True) for chunk in chunks
+    ] == results
+
+
+@pytest.mark.asyncio
+async def test_process_pool_validator_shared():
+    roa_index = ROAIndex()
+    roa_index.add("192.0.0.0/22", 64500, 24)
+
+    routes = make_routes(50)
+    chunks = [routes[i : i + 7] for i in range(0, len(routes), 7)]  # noqa: E203
+
+    # Sources sharing a pool have their own communities and verbosity
+    pool = ProcessPoolValidator(2, roa_index, set(), False, 100)
+    streams = [
+        pool.validate_chunks(chunk_generator(chunks), validate_many, {"64500:1"}, True),
+        pool.validate_chunks(chunk_generator(chunks)),
+    ]
+    results = await asyncio.gather(*[_collect(stream) for stream in streams])
+    pool.close()
+
+    assert [
+        validate_many(chunk, roa_index, {"64500:1"}, verbose=True) for chunk in chunks
+    ] == results[0]
+    assert [validate_many(chunk, roa_index, set(), verbose=False) for chunk in chunks] == results[1]
+
+
+@pytest.mark.asyncio
+async def test_process_pool_validator_failing_chunks():
+    async def failing_chunks():
+        yield make_routes(7)
+        yield make_routes(7)
+        raise ValueError("Failed to read routes")
+
+    pool = ProcessPoolValidator(2, ROAIndex(), set(), False, 0)
+    with pytest.raises(ValueError, match="Failed to read routes"):
+        await _collect(pool.validate_chunks(failing_chunks()))
+    # The pool is still usable for other sources
+    assert [[None] * 7] == await _collect(pool.validate_chunks(chunk_generator([make_routes(7)])))
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_process_pool_validator_separate_pools():
+    roa_index = ROAIndex()
+    roa_index.add("192.0.0.0/22", 64500, 24)
+    routes = make_routes(7)
+
+    pool = ProcessPoolValidator(2, roa_index, set(), False, 0)
+    # Workers are forked right away, and keep their own ROA data
+    assert 2 == len(pool._executor._processes)
+    other_pool = ProcessPoolValidator(2, ROAIndex(), set(), False, 0)
+
+    results = await _collect(pool.validate_chunks(chunk_generator([routes])))
+    other_results = await _collect(other_pool.validate_chunks(chunk_generator([routes])))
+    pool.close()
+    other_pool.close()
+
+    assert [validate_many(routes, roa_index, set(), verbose=False)] == results
+    assert [[None] * 7] == other_results
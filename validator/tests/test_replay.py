@@ -0,0 +1,172 @@
+import socket
+import struct
+
+from ..replay import UpdateReplayer, replay_updates
+from ..status import RouteEntry
+from .test_mrtreader import AS_SEQUENCE, as_path, attribute, mrt_record
+
+PEER_IP = "192.0.2.1"
+TIMESTAMP = 1600000000
+
+
+def nlri(prefix, path_id=None):
+    address, prefix_length = prefix.split("/")
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    prefix_bytes = (int(prefix_length) + 7) // 8
+    value = bytes([int(prefix_length)]) + socket.inet_pton(family, address)[:prefix_bytes]
+    if path_id is not None:
+        value = struct.pack(">I", path_id) + value
+    return value
+
+
+def update(withdrawn=b"", attributes=b"", announced=b""):
+    message = struct.pack(">H", len(withdrawn)) + withdrawn
+    message += struct.pack(">H", len(attributes)) + attributes + announced
+    return b"\xff" * 16 + struct.pack(">HB", 19 + len(message), 2) + message
+
+
+def bgp4mp(subtype, message, peer_as=64500, extended_time=None):
+    asn_format = "I" if subtype in (4, 5, 9) else "H"
+    body = struct.pack(f">{asn_format}{asn_format}HH", peer_as, 64511, 0, 1)
+    body += socket.inet_pton(socket.AF_INET, PEER_IP) + socket.inet_pton(
+        socket.AF_INET, "192.0.2.2"
+    )
+    body += message
+    if extended_time is not None:
+        return mrt_record(17, subtype, struct.pack(">I", extended_time) + body)
+    return mrt_record(16, subtype, body)
+
+
+def path_attributes(asns, communities=(), asn_format="H", mp_reach=b"", mp_unreach=b""):
+    attributes = attribute(2, as_path([(AS_SEQUENCE, asns)], asn_format))
+    if communities:
+        attributes += attribute(8, struct.pack(f">{len(communities)}I", *communities))
+    if mp_reach:
+        attributes += attribute(14, mp_reach, flags=0x80)
+    if mp_unreach:
+        attributes += attribute(15, mp_unreach, flags=0x80)
+    return attributes
+
+
+def mp_reach(prefixes, afi=2, safi=1):
+    next_hop = socket.inet_pton(socket.AF_INET6, "2001:db8::1")
+    value = struct.pack(">HBB", afi, safi, len(next_hop)) + next_hop + b"\0"
+    return value + b"".join(nlri(prefix) for prefix in prefixes)
+
+
+def mp_unreach(prefixes, afi=2, safi=1):
+    return struct.pack(">HB", afi, safi) + b"".join(nlri(prefix) for prefix in prefixes)
+
+
+def replay(tmp_path, records):
+    mrt_file = tmp_path / "updates.mrt"
+    mrt_file.write_bytes(b"".join(records))
+    replayer = UpdateReplayer()
+    routes = [route for routes in replay_updates(mrt_file, replayer) for route in routes]
+    return replayer, [(route.prefix, route.aspath, route.timestamp) for route in routes]
+
+
+def test_replay_updates(tmp_path):
+    announce = bgp4mp(
+        1, update(attributes=path_attributes([64500]), announced=nlri("192.0.2.0/24"))
+    )
+    records = [
+        announce,
+        # Unchanged, and changed communities
+        announce,
+        bgp4mp(
+            1,
+            update(
+                attributes=path_attributes([64500], communities=[(64500 << 16) + 1]),
+                announced=nlri("192.0.2.0/24"),
+            ),
+        ),
+        # IPv6 through MP_REACH_NLRI, and a non-unicast SAFI which is ignored
+        bgp4mp(
+            1,
+            update(
+                attributes=path_attributes([64500, 64501], mp_reach=mp_reach(["2001:db8::/32"]))
+            ),
+        ),
+        bgp4mp(
+            1,
+            update(
+                attributes=path_attributes([64500], mp_reach=mp_reach(["2001:db8::/32"], safi=2))
+            ),
+        ),
+        # Withdrawals, after which the same route is new again
+        bgp4mp(1, update(withdrawn=nlri("192.0.2.0/24"))),
+        bgp4mp(1, update(attributes=path_attributes([], mp_unreach=mp_unreach(["2001:db8::/32"])))),
+        bgp4mp(
+            1,
+            update(
+                attributes=path_attributes([], mp_unreach=mp_unreach(["2001:db8::/32"], safi=2))
+            ),
+        ),
+        announce,
+        # Session goes from established to idle, which clears the Adj-RIB-In
+        bgp4mp(0, struct.pack(">HH", 6, 1)),
+        bgp4mp(0, struct.pack(">HH", 1, 6)),
+        bgp4mp(
+            1,
+            update(attributes=path_attributes([64500]), announced=nlri("192.0.2.0/24")),
+            extended_time=500000,
+        ),
+        # 4 byte ASNs and ADD-PATH
+        bgp4mp(
+            9,
+            update(
+                attributes=path_attributes([4200000000], asn_format="I"),
+                announced=nlri("198.51.100.0/24", 1) + nlri("198.51.100.0/24", 2),
+            ),
+            peer_as=4200000000,
+        ),
+        bgp4mp(5, struct.pack(">HH", 6, 1), peer_as=4200000000),
+        # Keepalive, messages sent by the local side, and a RIB record are ignored
+        bgp4mp(1, b"\xff" * 16 + struct.pack(">HB", 19, 4)),
+        bgp4mp(6, update(attributes=path_attributes([64500]), announced=nlri("203.0.113.0/24"))),
+        mrt_record(13, 1, b""),
+    ]
+
+    replayer, routes = replay(tmp_path, records)
+    assert [
+        ("192.0.2.0/24", "64500", TIMESTAMP),
+        ("192.0.2.0/24", "64500", TIMESTAMP),
+        ("2001:db8::/32", "64500 64501", TIMESTAMP),
+        ("192.0.2.0/24", "64500", TIMESTAMP),
+        ("192.0.2.0/24", "64500", TIMESTAMP + 0.5),
+        ("198.51.100.0/24", "4200000000", TIMESTAMP),
+        ("198.51.100.0/24", "4200000000", TIMESTAMP),
+    ] == routes
+    assert 11 == replayer.updates
+    assert 7 == replayer.announcements
+    assert 1 == replayer.unchanged
+    assert 2 == replayer.withdrawals
+    assert 2 == replayer.peer_resets
+    assert {(PEER_IP, 64500)} == set(replayer.adj_ribs_in)
+    assert "Replayed 11 BGP updates: 7 new or changed announcements" in replayer.stats_str()
+
+
+def test_replay_updates_route_entry():
+    replayer = UpdateReplayer()
+    record = bgp4mp(
+        4,
+        update(
+            attributes=path_attributes(
+                [64500, 4200000000], communities=[0xFFFFFF01], asn_format="I"
+            ),
+            announced=nlri("192.0.2.0/25"),
+        ),
+    )
+    header_size = 12
+    assert [
+        RouteEntry(
+            origin=4200000000,
+            aspath="64500 4200000000",
+            prefix="192.0.2.0/25",
+            peer_ip=PEER_IP,
+            peer_as=64500,
+            communities={"no-export"},
+            timestamp=TIMESTAMP,
+        )
+    ] == replayer.routes_from_record(TIMESTAMP, 16, 4, record[header_size:])
@@ -0,0 +1,85 @@
+import struct
+
+import pytest
+
+from ..ribcache import CACHE_HEADER, RIBCacheWriter, _unpack_strings, load_rib_cache
+from ..status import RIBEntry, RouteEntry
+
+
+def route(prefix, origin, peer_ip="192.0.2.1", communities=None):
+    return RouteEntry(
+        origin=origin,
+        aspath=f"64499 {origin}" if origin else "64499 {64500,64501}",
+        prefix=prefix,
+        peer_ip=peer_ip,
+        peer_as=64499,
+        communities=communities or set(),
+    )
+
+
+RIB_ENTRIES = [
+    RIBEntry(
+        prefix="192.0.2.0/24",
+        routes=[
+            route("192.0.2.0/24", 64500, communities={"64500:1", "64500:2:3", "no-export"}),
+            route("192.0.2.0/24", None, peer_ip="2001:db8::1"),
+        ],
+    ),
+    RIBEntry(
+        prefix="2001:db8::/32",
+        routes=[route("2001:db8::/32", 4200000000, communities={"64500:1", "64500:2:3"})],
+    ),
+    RIBEntry(prefix="192.0.2.0/24", routes=[route("192.0.2.0/24", 64500)]),
+]
+
+
+def write_cache(path, rib_entries):
+    writer = RIBCacheWriter()
+    for rib_entry in rib_entries:
+        writer.add(rib_entry)
+    writer.write(path)
+    return writer
+
+
+def test_rib_cache(tmp_path):
+    path = tmp_path / "cache" / "rib.cache"
+    writer = write_cache(path, RIB_ENTRIES)
+    assert 4 == writer.route_count
+
+    rib_entries = list(load_rib_cache(path))
+    assert RIB_ENTRIES == rib_entries
+    # Interned values are shared between routes
+    assert rib_entries[0].routes[0].aspath is rib_entries[2].routes[0].aspath
+    assert rib_entries[0].routes[1].communities is rib_entries[2].routes[0].communities
+
+    write_cache(path, [])
+    assert [] == list(load_rib_cache(path))
+
+
+def test_rib_cache_invalid(tmp_path):
+    path = tmp_path / "rib.cache"
+    write_cache(path, RIB_ENTRIES)
+    data = path.read_bytes()
+    header_size = CACHE_HEADER.size
+
+    for invalid_data, message in [
+        (data[:10], "cache is truncated"),
+        (b"X" + data[1:], "unknown cache format"),
+        (data[:-1], "cache is truncated"),
+        (data[: header_size + 4], "cache is truncated"),
+        (data + b"\0", "unexpected trailing data"),
+        # Route count in the header does not match the columns
+        (CACHE_HEADER.pack(b"MANRSRIB", 1, 3) + data[header_size:], "truncated"),
+    ]:
+        path.write_bytes(invalid_data)
+        with pytest.raises(ValueError, match=message):
+            load_rib_cache(path)
+
+    # Last index in the communities column points outside the table
+    path.write_bytes(data[:-4] + b"\xff\0\0\0")
+    with pytest.raises(ValueError, match="invalid indexes"):
+        load_rib_cache(path)
+
+    for section in [b"\0", struct.pack("<Q", 3) + b"192.0.2.0/24\n2001:db8::/32"]:
+        with pytest.raises(ValueError, match="cache is truncated"):
+            _unpack_strings(section)
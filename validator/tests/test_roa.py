@@ -1,6 +1,8 @@
+import json
+import os
 from pathlib import Path
 
-from ..roa import parse_roas
+from ..roa import clear_roa_cache, parse_roas, roa_digest
 
 
 def test_parse_roas():
@@ -29,3 +31,86 @@ def test_parse_roas():
 
     node_data_v6_33 = tree.search_best("2001:db8::/33").data["roas"]
     assert [{"asn": 0, "max_length": 64}] == node_data_v6_33
+
+
+def test_parse_roas_snapshot(tmp_path, capsys):
+    roa_file = Path(__file__).parent / "roa_test.json"
+    with open(roa_file, "rb") as f:
+        tree, _ = parse_roas(f, str(tmp_path))
+    # Radix trees are not stored in snapshots
+    assert not list(tmp_path.glob("roas-*.snapshot"))
+
+    with open(roa_file, "rb") as f:
+        index_json, count_json = parse_roas(f, str(tmp_path), compact=True)
+    snapshots = list(tmp_path.glob("roas-*.snapshot"))
+    assert 1 == len(snapshots)
+
+    # Second run should load from the snapshot, with identical results
+    with open(roa_file, "rb") as f:
+        index_snapshot, count_snapshot = parse_roas(f, str(tmp_path), compact=True)
+    assert count_json == count_snapshot == 6
+    for prefix in tree.prefixes():
+        assert index_json.search_covering(prefix) == index_snapshot.search_covering(prefix)
+
+    # A damaged snapshot is ignored and rewritten
+    snapshot_data = snapshots[0].read_bytes()
+    for damaged in [
+        b"MANRSROA",
+        b"MANRSROA" + bytes(12),
+        snapshot_data[:-1],
+        snapshot_data + b"\0",
+        snapshot_data[:12] + bytes([7]) + snapshot_data[13:],
+    ]:
+        snapshots[0].write_bytes(damaged)
+        capsys.readouterr()
+        with open(roa_file, "rb") as f:
+            index, count = parse_roas(f, str(tmp_path), compact=True)
+        assert 6 == count
+        assert "Ignoring unusable ROA snapshot" in capsys.readouterr().out
+        assert snapshot_data == snapshots[0].read_bytes()
+
+    assert 1 == clear_roa_cache(str(tmp_path))
+    assert not list(tmp_path.glob("roas-*.snapshot"))
+    assert not list(tmp_path.glob("*.json"))
+
+
+def test_roa_digest(tmp_path):
+    roa_file = tmp_path / "roas.json"
+    roa_file.write_bytes((Path(__file__).parent / "roa_test.json").read_bytes())
+    cache_dir = tmp_path / "cache"
+    with open(roa_file, "rb") as f:
+        digest = roa_digest(f)
+        assert digest == roa_digest(f, str(cache_dir))
+        assert b"{" == f.read(1)
+
+    # The remembered digest is used while the size and modification time are unchanged
+    digests_path = cache_dir / "roa-digests.json"
+    digests = json.loads(digests_path.read_text())
+    digests[str(roa_file)]["digest"] = "remembered"
+    digests_path.write_text(json.dumps(digests))
+    with open(roa_file, "rb") as f:
+        assert "remembered" == roa_digest(f, str(cache_dir))
+
+    stat = roa_file.stat()
+    os.utime(roa_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    with open(roa_file, "rb") as f:
+        assert digest == roa_digest(f, str(cache_dir))
+
+    digests_path.write_text("[]")
+    with open(roa_file, "rb") as f:
+        assert digest == roa_digest(f, str(cache_dir))
+
+
+def test_parse_roas_compact(tmp_path):
+    roa_file = Path(__file__).parent / "roa_test.json"
+    with open(roa_file, "rb") as f:
+        tree, _ = parse_roas(f)
+    # Once from JSON, once from the snapshot written by the first call
+    for _ in range(2):
+        with open(roa_file, "rb") as f:
+            index, count = parse_roas(f, str(tmp_path), compact=True)
+        assert 6 == count
+        for prefix in tree.prefixes():
+            assert [(n.prefix, n.data) for n in tree.search_covering(prefix)] == [
+                (n.prefix, n.data) for n in index.search_covering(prefix)
+            ]
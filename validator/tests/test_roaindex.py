@@ -0,0 +1,138 @@
+import io
+import socket
+
+import pytest
+import radix
+
+from ..roaindex import TABLE_COUNT, TABLE_HEADER, ROAIndex
+
+ROAS = [
+    ("0.0.0.0/0", 0, 32),
+    ("192.0.2.0/24", 64500, 28),
+    ("192.0.2.0/24", 64501, 24),
+    ("192.0.0.0/16", 64502, 24),
+    ("192.0.2.128/25", 64503, 25),
+    ("198.51.100.0/24", 64504, 24),
+    ("2001:db8::/32", 64505, 48),
+    ("2001:db8:1::/48", 64506, 48),
+    ("2001:db8:1::1/128", 64507, 128),
+    ("2001:db8:1::1/96", 64508, 128),
+]
+
+
+def build_index():
+    index = ROAIndex()
+    for prefix, asn, max_length in ROAS:
+        index.add(prefix, asn, max_length)
+    return index
+
+
+def covering(store, prefix):
+    return [(node.prefix, node.data["roas"]) for node in store.search_covering(prefix)]
+
+
+def test_search_covering():
+    index = build_index()
+    assert len(ROAS) == len(index)
+
+    assert [
+        (
+            "192.0.2.0/24",
+            [{"asn": 64500, "max_length": 28}, {"asn": 64501, "max_length": 24}],
+        ),
+        ("192.0.0.0/16", [{"asn": 64502, "max_length": 24}]),
+        ("0.0.0.0/0", [{"asn": 0, "max_length": 32}]),
+    ] == covering(index, "192.0.2.0/26")
+
+    assert [
+        ("192.0.2.128/25", [{"asn": 64503, "max_length": 25}]),
+        (
+            "192.0.2.0/24",
+            [{"asn": 64500, "max_length": 28}, {"asn": 64501, "max_length": 24}],
+        ),
+        ("192.0.0.0/16", [{"asn": 64502, "max_length": 24}]),
+        ("0.0.0.0/0", [{"asn": 0, "max_length": 32}]),
+    ] == covering(index, "192.0.2.192/26")
+
+    assert [("0.0.0.0/0", [{"asn": 0, "max_length": 32}])] == covering(index, "203.0.113.0/24")
+    assert [] == covering(index, "2001:db9::/32")
+    assert [
+        ("2001:db8:1::1/128", [{"asn": 64507, "max_length": 128}]),
+        ("2001:db8:1::/96", [{"asn": 64508, "max_length": 128}]),
+        ("2001:db8:1::/48", [{"asn": 64506, "max_length": 48}]),
+        ("2001:db8::/32", [{"asn": 64505, "max_length": 48}]),
+    ] == covering(index, "2001:db8:1::1/128")
+
+
+def test_add_packed():
+    index = ROAIndex()
+    index.add_packed(4, socket.inet_pton(socket.AF_INET, "192.0.2.0") + bytes(12), 24, 64500, 24)
+    index.add_packed(6, socket.inet_pton(socket.AF_INET6, "2001:db8::"), 32, 64501, 48)
+    assert [("192.0.2.0/24", [{"asn": 64500, "max_length": 24}])] == covering(index, "192.0.2.0/24")
+    assert [("2001:db8::/32", [{"asn": 64501, "max_length": 48}])] == covering(
+        index, "2001:db8::/48"
+    )
+
+
+def test_matches_radix():
+    index = build_index()
+    tree = radix.Radix()
+    for prefix, asn, max_length in ROAS:
+        node = tree.add(prefix)
+        node.data.setdefault("roas", []).append({"asn": asn, "max_length": max_length})
+
+    for prefix in [
+        "192.0.2.0/24",
+        "192.0.2.0/32",
+        "192.0.3.0/24",
+        "192.0.0.0/8",
+        "198.51.100.77/32",
+        "2001:db8::/32",
+        "2001:db8:1:2::/64",
+        "2001:db8:1::1/128",
+        "::/0",
+    ]:
+        assert covering(tree, prefix) == covering(index, prefix)
+
+
+def test_search_empty_bucket():
+    index = ROAIndex()
+    assert [] == covering(index, "192.0.2.0/24")
+
+    # All in the lowest bucket, so that searches for higher prefixes find an empty bucket
+    for subnet in range(8):
+        index.add(f"10.0.{subnet}.0/24", 64500 + subnet, 24)
+    assert [] == covering(index, "192.0.2.0/24")
+    assert [] == covering(index, "10.0.8.0/24")
+    assert [("10.0.7.0/24", [{"asn": 64507, "max_length": 24}])] == covering(index, "10.0.7.0/25")
+
+
+def test_dump_load():
+    index = build_index()
+    dumped = io.BytesIO()
+    index.dump(dumped)
+    dumped.seek(0)
+    loaded = ROAIndex.load(dumped)
+    assert len(ROAS) == len(loaded)
+    for prefix in ["192.0.2.0/26", "192.0.2.192/26", "2001:db8:1::1/128", "2001:db9::/32"]:
+        assert covering(index, prefix) == covering(loaded, prefix)
+
+    data = dumped.getvalue()
+    tables = data[TABLE_COUNT.size + TABLE_HEADER.size :]  # noqa: E203
+
+    def with_first_table(family, prefix_length, bucket_bits, count):
+        header = TABLE_HEADER.pack(family, prefix_length, bucket_bits, count)
+        return data[: TABLE_COUNT.size] + header + tables
+
+    for damaged, message in [
+        (data[:-1], "truncated"),
+        (data[: TABLE_COUNT.size], "truncated"),
+        (data + b"\0", "trailing data"),
+        (with_first_table(4, 33, 0, 0), "invalid table"),
+        (with_first_table(5, 0, 0, 1), "invalid table"),
+        (with_first_table(4, 0, 1, 1), "invalid table"),
+        # Bucket ranges that do not cover all ROAs
+        (with_first_table(4, 0, 0, 0), "invalid buckets"),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            ROAIndex.load(io.BytesIO(damaged))
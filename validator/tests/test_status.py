@@ -0,0 +1,41 @@
+import dataclasses
+import pickle
+
+import pytest
+
+from .. import status
+from ..status import RIBEntry, RouteEntry, intern_communities
+
+
+def test_route_entry_slots():
+    route = RouteEntry(64502, "64501 64502", "192.0.2.0/24", "192.0.2.1", 64501, frozenset())
+    assert not hasattr(route, "__dict__")
+    assert not hasattr(RIBEntry("192.0.2.0/24", [route]), "__dict__")
+    with pytest.raises(AttributeError):
+        route.unknown = True
+
+    route.source = "rs1"
+    assert dataclasses.asdict(route) == {
+        "origin": 64502,
+        "aspath": "64501 64502",
+        "prefix": "192.0.2.0/24",
+        "peer_ip": "192.0.2.1",
+        "peer_as": 64501,
+        "communities": set(),
+        "source": "rs1",
+        "timestamp": None,
+    }
+    assert pickle.loads(pickle.dumps(route)) == route
+
+
+def test_intern_communities(monkeypatch):
+    monkeypatch.setattr(status, "COMMUNITIES_TABLE_SIZE", 2)
+    monkeypatch.setattr(status, "_communities_table", {})
+    communities = intern_communities(["64501:1", "64501:2"])
+    assert communities == frozenset({"64501:1", "64501:2"})
+    assert intern_communities(iter(["64501:2", "64501:1"])) is communities
+    assert intern_communities([]) is not communities
+    # The table is cleared when full
+    intern_communities(["64501:3"])
+    assert len(status._communities_table) == 1
+    assert intern_communities(["64501:1", "64501:2"]) is not communities
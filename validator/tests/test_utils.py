@@ -1,4 +1,23 @@
-from validator.utils import get_data_from_json
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp_retry import RetryClient
+from aioresponses import aioresponses
+
+from validator import utils
+from validator.concurrency import RequestTimeout
+from validator.utils import (
+    DecodedRoutes,
+    aio_get_json,
+    aio_get_routes,
+    aio_stream_json,
+    aiter_chunks,
+    get_data_from_json,
+    json_loads,
+    merge_async_iterators,
+    route_tasks_to_route_entries,
+)
 
 
 def test_return_specified_key():
@@ -29,3 +48,173 @@ def test_return_none_if_no_provided_keys_exist():
     data = get_data_from_json({"foo": "bar"}, ["baz", "no-key"])
 
     assert data is None
+
+
+@pytest.mark.asyncio
+async def test_aiter_chunks():
+    async def generator(count):
+        for i in range(count):
+            yield i
+
+    assert [[0, 1], [2, 3], [4]] == [chunk async for chunk in aiter_chunks(generator(5), 2)]
+    assert [[0, 1]] == [chunk async for chunk in aiter_chunks(generator(2), 2)]
+    assert [] == [chunk async for chunk in aiter_chunks(generator(0), 2)]
+
+
+async def async_range(start, stop, fail=False):
+    for i in range(start, stop):
+        yield i
+    if fail:
+        raise ValueError("failed")
+
+
+@pytest.mark.asyncio
+async def test_merge_async_iterators():
+    merged = merge_async_iterators([async_range(0, 10), async_range(10, 15)], 2)
+    assert list(range(15)) == sorted([item async for item in merged])
+
+    merged = merge_async_iterators([async_range(0, 100), async_range(0, 3, fail=True)], 2)
+    with pytest.raises(ValueError, match="failed"):
+        [item async for item in merged]
+
+
+@pytest.mark.asyncio
+async def test_route_tasks_to_route_entries_cancel():
+    async def failing():
+        raise ValueError("request failed")
+
+    slow = asyncio.ensure_future(asyncio.sleep(10))
+    with pytest.raises(ValueError, match="request failed"):
+        [entry async for entry in route_tasks_to_route_entries([failing(), slow], "Alice LG")]
+    await asyncio.sleep(0)
+    assert slow.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_aio_stream_json(monkeypatch):
+    monkeypatch.setattr("validator.utils.READ_CHUNK_SIZE", 16)
+    payload = {"routes": [{"network": f"192.0.2.{i}/32"} for i in range(5)], "total": 5}
+    other = {}
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/routes", status=200, payload=payload)
+        async with RetryClient(raise_for_status=False) as client:
+            batches = [
+                items
+                async for items in aio_stream_json(
+                    client, "http://example.net/routes", ["routes"], other=other
+                )
+            ]
+    assert len(batches) > 1
+    assert payload["routes"] == [item for items in batches for item in items]
+    assert {"total": 5} == other
+
+
+@pytest.mark.asyncio
+async def test_merge_async_iterators_next_iterators():
+    async def count(start, stop):
+        for i in range(start, stop):
+            yield i
+
+    def next_iterators(item):
+        # Each item below 3 starts an iterator for a single further item
+        return [count(item + 10, item + 11)] if item < 3 else []
+
+    items = [i async for i in merge_async_iterators([count(0, 4)], 2, next_iterators)]
+    assert [0, 1, 2, 3, 10, 11, 12] == sorted(items)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("offload", [False, True])
+async def test_route_tasks_to_route_entries_offload(monkeypatch, offload):
+    if offload:
+        monkeypatch.setattr("validator.utils.OFFLOAD_MIN_JSON_SIZE", 0)
+    route = {
+        "network": "192.0.2.0/24",
+        "bgp": {"as_path": [64500, 64501], "communities": [[64500, 1]]},
+    }
+    payload = {"routes": [route, dict(route, network="198.51.100.0/24")], "total": 2}
+    metadata = {"peer_ip": "192.0.2.1", "peer_as": 64500, "peer_name": "peer1"}
+    other = {}
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/routes", status=200, payload=payload)
+        async with RetryClient(raise_for_status=False) as client:
+            task = aio_get_routes(
+                client, "http://example.net/routes", ["routes"], metadata, other=other
+            )
+            entries = [entry async for entry in route_tasks_to_route_entries([task], "LG")]
+    assert [
+        ("192.0.2.0/24", 64501, "64500 64501", frozenset({"64500:1"}), "LG peer peer1"),
+        ("198.51.100.0/24", 64501, "64500 64501", frozenset({"64500:1"}), "LG peer peer1"),
+    ] == [
+        (entry.prefix, entry.origin, entry.aspath, entry.communities, entry.source)
+        for entry in entries
+    ]
+    # Shared between routes, also when sent back from a worker process
+    assert entries[0].communities is entries[1].communities
+    assert {"total": 2} == other
+
+
+@pytest.mark.asyncio
+async def test_aio_get_json_content_type():
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/api", status=200, body="<html>", content_type="text/html")
+        http_mock.get("http://example.net/empty", status=200, body=" ")
+        async with RetryClient(raise_for_status=False) as client:
+            with pytest.raises(aiohttp.ContentTypeError):
+                await aio_get_json(client, "http://example.net/api")
+            assert (None, 1) == await aio_get_json(client, "http://example.net/empty", metadata=1)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_json_loads(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(utils, "orjson", None)
+    assert {"routes": [1, "a"]} == json_loads('{"routes": [1, "a"]}')
+    assert {"routes": [1, "é"]} == json_loads('{"routes": [1, "é"]}'.encode("utf-8"))
+
+
+@pytest.mark.asyncio
+async def test_route_tasks_to_route_entries_backpressure():
+    started = []
+
+    async def request(index):
+        started.append(index)
+        route = {"network": f"192.0.2.{index}/32", "bgp": {"as_path": [64500]}}
+        return DecodedRoutes([route]), {"peer_ip": "192.0.2.1", "peer_as": 64500, "index": index}
+
+    def next_tasks(metadata):
+        # The first request is followed up by one more request
+        return [request(10)] if metadata["index"] == 0 else []
+
+    requests = [request(index) for index in range(10)]
+    entries = route_tasks_to_route_entries(requests, "LG", next_tasks, max_buffered=2, workers=1)
+    first = await entries.__anext__()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    # The first response is being processed, and only one more is buffered,
+    # which is the follow up request, as it takes the place of the first
+    assert "192.0.2.0/32" == first.prefix
+    assert [0, 10] == started
+    prefixes = [entry.prefix async for entry in entries]
+    assert 10 == len(prefixes)
+    assert "192.0.2.10/32" == prefixes[0]
+
+    # Requests that were never started are closed
+    started.clear()
+    entries = route_tasks_to_route_entries(
+        [request(index) for index in range(10)], "LG", max_buffered=1, workers=1
+    )
+    await entries.__anext__()
+    await entries.aclose()
+    assert len(started) < 10
+
+
+@pytest.mark.asyncio
+async def test_aio_stream_json_timeout():
+    with aioresponses() as http_mock:
+        http_mock.get("http://example.net/routes", timeout=True)
+        async with RetryClient(raise_for_status=False) as client:
+            # Without deadlines, timeouts of the client are raised as is
+            with pytest.raises(asyncio.TimeoutError) as exc_info:
+                [_ async for _ in aio_stream_json(client, "http://example.net/routes", ["routes"])]
+    assert not isinstance(exc_info.value, RequestTimeout)
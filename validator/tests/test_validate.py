@@ -1,7 +1,8 @@
 import radix
 
-from ..status import RouteEntry, RPKIStatus
-from ..validate import validate
+from ..roaindex import ROAIndex
+from ..status import RIBEntry, RouteEntry, RPKIStatus
+from ..validate import ValidationCache, validate, validate_many, validate_rib_entries
 
 
 def test_validate():
@@ -52,6 +53,7 @@ def test_validate():
             "peer_as": 64511,
             "communities": {"64500:123"},
             "source": None,
+            "timestamp": None,
         },
         "roas": [
             {"prefix": "192.0.2.0/24", "asn": 64500, "max_length": 28},
@@ -170,3 +172,146 @@ def test_validate():
         verbose=True,
     )
     assert RPKIStatus.not_found == result["status"]
+
+
+def test_validate_roa_index():
+    roa_index = ROAIndex()
+    roa_index.add("192.0.2.0/24", 64500, 28)
+    roa_index.add("192.0.2.0/24", 0, 24)
+
+    route = RouteEntry(
+        origin=64500,
+        aspath="64499 64500",
+        prefix="192.0.2.0/28",
+        peer_ip="192.0.2.0",
+        peer_as=64511,
+        communities=set(),
+    )
+    result = validate(route, roa_index, communities_expected_invalid=set(), verbose=True)
+    assert RPKIStatus.valid == result["status"]
+    assert [
+        {"prefix": "192.0.2.0/24", "asn": 64500, "max_length": 28},
+        {"prefix": "192.0.2.0/24", "asn": 0, "max_length": 24},
+    ] == result["roas"]
+
+    route.origin = 64501
+    result = validate(route, roa_index, communities_expected_invalid=set())
+    assert RPKIStatus.invalid == result["status"]
+
+    route.prefix = "2001:db8::/32"
+    result = validate(route, roa_index, communities_expected_invalid=set(), verbose=True)
+    assert RPKIStatus.not_found == result["status"]
+
+
+def test_validate_cache():
+    roa_tree = radix.Radix()
+    rnode = roa_tree.add("192.0.2.0/24")
+    rnode.data["roas"] = [{"asn": 64500, "max_length": 24}]
+    cache = ValidationCache(maxsize=2)
+
+    def route(origin, prefix="192.0.2.0/24", communities=None):
+        return RouteEntry(
+            origin=origin,
+            aspath=f"64499 {origin}",
+            prefix=prefix,
+            peer_ip="192.0.2.0",
+            peer_as=64511,
+            communities=communities or set(),
+        )
+
+    assert not validate(route(64500), roa_tree, set(), cache=cache)
+    assert not validate(route(64500), roa_tree, set(), cache=cache)
+    assert (1, 1) == (cache.hits, cache.misses)
+
+    # Expected invalid communities still apply per route on a cache hit
+    result = validate(route(64501), roa_tree, {"64500:1"}, cache=cache)
+    assert RPKIStatus.invalid == result["status"]
+    result = validate(
+        route(64501, communities={"64500:1"}), roa_tree, {"64500:1"}, verbose=True, cache=cache
+    )
+    assert RPKIStatus.invalid_expected == result["status"]
+    assert [{"prefix": "192.0.2.0/24", "asn": 64500, "max_length": 24}] == result["roas"]
+    assert (2, 2) == (cache.hits, cache.misses)
+
+    # Least recently used entry (64500) is evicted
+    validate(route(64502, prefix="198.51.100.0/24"), roa_tree, set(), cache=cache)
+    assert 2 == len(cache)
+    validate(route(64500), roa_tree, set(), cache=cache)
+    assert (2, 4) == (cache.hits, cache.misses)
+    assert "Validation cache: 2 hits, 4 misses (33.3% hit rate), 2 entries" == cache.stats_str()
+    assert "0 hits, 0 misses (0.0% hit rate)" in ValidationCache().stats_str()
+
+
+def test_validate_many():
+    roa_tree = radix.Radix()
+    rnode = roa_tree.add("192.0.2.0/24")
+    rnode.data["roas"] = [{"asn": 64500, "max_length": 24}]
+
+    def route(origin, prefix="192.0.2.0/24", communities=None):
+        return RouteEntry(
+            origin=origin,
+            aspath=f"64499 {origin}",
+            prefix=prefix,
+            peer_ip="192.0.2.0",
+            peer_as=64511,
+            communities=communities or set(),
+        )
+
+    routes = [
+        route(64500),
+        route(64501),
+        route(64500, prefix="2001:db8::/32"),
+        route(64501, communities={"64500:1"}),
+        route(64500),
+        route(None),
+    ]
+    for cache in [None, ValidationCache()]:
+        results = validate_many(routes, roa_tree, {"64500:1"}, verbose=True, cache=cache)
+        assert [
+            RPKIStatus.valid,
+            RPKIStatus.invalid,
+            RPKIStatus.not_found,
+            RPKIStatus.invalid_expected,
+            RPKIStatus.valid,
+            RPKIStatus.invalid,
+        ] == [result["status"] for result in results]
+        assert [r["route"] for r in results] == [
+            validate(r, roa_tree, {"64500:1"}, verbose=True)["route"] for r in routes
+        ]
+        assert [] == results[2]["roas"]
+
+    results = validate_many(routes, roa_tree, {"64500:1"})
+    assert [None, RPKIStatus.invalid, None, None, None, RPKIStatus.invalid] == [
+        result["status"] if result else None for result in results
+    ]
+
+
+def test_validate_rib_entries():
+    roa_tree = radix.Radix()
+    rnode = roa_tree.add("192.0.2.0/24")
+    rnode.data["roas"] = [{"asn": 64500, "max_length": 24}]
+
+    def route(origin, prefix="192.0.2.0/24", communities=None):
+        return RouteEntry(
+            origin=origin,
+            aspath=f"64499 {origin}",
+            prefix=prefix,
+            peer_ip="192.0.2.0",
+            peer_as=64511,
+            communities=communities or set(),
+        )
+
+    rib_entries = [
+        RIBEntry(
+            prefix="192.0.2.0/24",
+            routes=[route(64500), route(64501), route(64501, communities={"64500:1"})],
+        ),
+        RIBEntry(prefix="2001:db8::/32", routes=[route(64500, prefix="2001:db8::/32")]),
+        RIBEntry(prefix="192.0.2.0/24", routes=[route(None)]),
+    ]
+    routes = [route for rib_entry in rib_entries for route in rib_entry.routes]
+    for verbose in [False, True]:
+        for cache in [None, ValidationCache()]:
+            assert validate_many(
+                routes, roa_tree, {"64500:1"}, verbose=verbose
+            ) == validate_rib_entries(rib_entries, roa_tree, {"64500:1"}, verbose, cache)
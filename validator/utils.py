@@ -1,9 +1,112 @@
 import asyncio
-from typing import Any, Optional, List, Dict
+import codecs
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import json as json_module
+import multiprocessing
+import re
+import sys
+import time
+from http import HTTPStatus
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import aiohttp
+from aiohttp_retry import ExponentialRetry, RetryClient
 
-from validator.status import RouteEntry
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+from validator.concurrency import (
+    AdaptiveLimiter,
+    PeerTimings,
+    RequestDeadlines,
+    RequestOutcome,
+    RequestTimeout,
+)
+from validator.httpcache import HTTPCache
+from validator.jsonstream import READ_CHUNK_SIZE, JSONArrayParser
+from validator.status import RouteEntry, intern_communities
+
+T = TypeVar("T")
+
+# Number of looking glass responses, or decoded parts of streamed responses,
+# being received or waiting to be processed, and number of workers that
+# execute requests
+DEFAULT_MAX_BUFFERED_RESPONSES = 32
+DEFAULT_FETCH_WORKERS = 32
+# Responses with routes of at least this many bytes are decoded, and their
+# routes converted, in a worker process, so that the event loop keeps handling
+# other requests in the meantime. Smaller responses are handled in the event
+# loop, as sending them to a worker process costs more than the work itself.
+OFFLOAD_MIN_JSON_SIZE = 256 * 1024
+# Content types accepted as JSON, like aiohttp's ClientResponse.json()
+JSON_CONTENT_TYPE_RE = re.compile(r"^application/(?:[\w.+-]+?\+)?json")
+
+# Worker processes for decoding responses, started when first needed
+_decode_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+class DecodedRoutes:
+    """
+    Routes of a looking glass response, with their fields in columns.
+    These are sent back from a worker process with far less overhead than
+    the decoded JSON or RouteEntry instances, as AS paths and community
+    sets that are shared between routes are sent once.
+    """
+
+    def __init__(self, imported_routes: List[Dict[str, Any]]):
+        self.origins: List[int] = []
+        self.aspaths: List[str] = []
+        self.prefixes: List[str] = []
+        self.communities: List[FrozenSet[str]] = []
+        for imported_route in imported_routes:
+            origin, aspath, prefix, communities = _route_fields(imported_route)
+            self.origins.append(origin)
+            self.aspaths.append(aspath)
+            self.prefixes.append(prefix)
+            self.communities.append(communities)
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+    def route_entries(self, metadata: Dict[str, Any], source_name: str) -> Iterator[RouteEntry]:
+        """
+        Create RouteEntry instances for the routes, with the peer from the
+        request metadata. Instances are created as they are iterated over.
+        """
+        source = route_source(source_name, metadata)
+        for origin, aspath, prefix, communities in zip(
+            self.origins, self.aspaths, self.prefixes, self.communities
+        ):
+            yield RouteEntry(
+                origin=origin,
+                aspath=aspath,
+                prefix=prefix,
+                peer_ip=metadata["peer_ip"],
+                peer_as=metadata["peer_as"],
+                communities=communities,
+                source=source,
+            )
 
 
 async def aio_get_json(
@@ -12,16 +115,327 @@ async def aio_get_json(
     key: Optional[List[str]] = None,
     metadata: Any = None,
     ssl_verify: bool = True,
+    limiter: Optional[AdaptiveLimiter] = None,
+    cache: Optional[HTTPCache] = None,
+    deadlines: Optional[RequestDeadlines] = None,
 ):
     """
     Do an async HTTP request for JSON data, with the given client and url.
     If key is given, that key from the JSON is returned. Return value
     is a tuple of JSON data and the metadata parameter.
+    If limiter is given, the request waits for the adaptive concurrency
+    limit, and its latency and errors adjust that limit.
+    If cache is given, a still valid cached response is used without
+    a request, and other requests are conditional on the cached response.
+    If deadlines is given, slow requests are hedged, and RequestTimeout
+    is raised if the request misses its deadline.
+    """
+    body, response_headers = await _get_json_body(
+        client, url, ssl_verify, limiter, cache, deadlines
+    )
+    json = json_loads(body) if body.strip() else None
+    if cache and response_headers is not None:
+        cache.store(url, response_headers, body, json)
+    return get_data_from_json(json, key), metadata
+
+
+async def aio_get_routes(
+    client: aiohttp.ClientSession,
+    url: str,
+    key: List[str],
+    metadata: Any = None,
+    ssl_verify: bool = True,
+    limiter: Optional[AdaptiveLimiter] = None,
+    other: Optional[Dict[str, Any]] = None,
+    cache: Optional[HTTPCache] = None,
+    deadlines: Optional[RequestDeadlines] = None,
+) -> Tuple[DecodedRoutes, Any]:
+    """
+    Like aio_get_json, for a JSON object with routes under one of the keys
+    in key. Returns a tuple of the DecodedRoutes and the metadata parameter.
+    Values of the other top level keys are stored in other, if given.
+    Large responses are decoded, and their routes converted, in a worker
+    process, so that the event loop only handles I/O in the meantime.
+    """
+    body, response_headers = await _get_json_body(
+        client, url, ssl_verify, limiter, cache, deadlines
+    )
+    offload = len(body) >= OFFLOAD_MIN_JSON_SIZE
+    if offload:
+        routes, other_values = await asyncio.get_event_loop().run_in_executor(
+            _get_decode_executor(), decode_routes, body, key
+        )
+    else:
+        routes, other_values = decode_routes(body, key)
+    if cache and response_headers is not None:
+        await _offload(offload, cache.store, url, response_headers, body, other_values)
+    if other is not None:
+        other.update(other_values)
+    return routes, metadata
+
+
+def decode_routes(body: bytes, key: List[str]) -> Tuple[DecodedRoutes, Dict[str, Any]]:
+    """
+    Decode a JSON object with routes under one of the keys in key. Returns the
+    routes, and the values of the other top level keys. This does not use the
+    event loop, so it can run in a worker process.
+    """
+    json = json_loads(body)
+    routes = DecodedRoutes(get_data_from_json(json, key) or [])
+    return routes, {name: value for name, value in json.items() if name not in key}
+
+
+async def _get_json_body(
+    client: aiohttp.ClientSession,
+    url: str,
+    ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter],
+    cache: Optional[HTTPCache],
+    deadlines: Optional[RequestDeadlines],
+) -> Tuple[bytes, Optional[Mapping[str, str]]]:
+    """
+    Get the body of a JSON response, which is taken from the cache while it is
+    valid. Returns the body, and the response headers if the response is to be
+    cached.
+    """
+    body = cache.fresh_body(url) if cache else None
+    if body is not None:
+        return body, None
+    async with _request_slot(limiter, url) as outcome:
+        attempt = functools.partial(_get_json_response, client, url, ssl_verify, outcome, cache)
+        if deadlines:
+            hedge = functools.partial(
+                _get_hedged_json_response, client, url, ssl_verify, limiter, cache
+            )
+            response = await deadlines.run(url, attempt, hedge)
+        else:
+            response = await attempt()
+    if response is None:
+        # The cache entry was removed in the meantime
+        return await _get_json_body(client, url, ssl_verify, limiter, None, deadlines)
+    return response
+
+
+async def _get_hedged_json_response(
+    client: aiohttp.ClientSession,
+    url: str,
+    ssl_verify: bool,
+    limiter: Optional[AdaptiveLimiter],
+    cache: Optional[HTTPCache],
+) -> Optional[Tuple[bytes, Optional[Mapping[str, str]]]]:
+    # A hedged request is made in addition to the original, so it counts
+    # towards the concurrency limit on its own
+    async with _request_slot(limiter, url) as outcome:
+        return await _get_json_response(client, url, ssl_verify, outcome, cache)
+
+
+async def _get_json_response(
+    client: aiohttp.ClientSession,
+    url: str,
+    ssl_verify: bool,
+    outcome: RequestOutcome,
+    cache: Optional[HTTPCache],
+) -> Optional[Tuple[bytes, Optional[Mapping[str, str]]]]:
+    """
+    Make a single request for JSON data. Returns the body, and the response
+    headers if the response is to be cached, or None if the response was not
+    modified, but the cache entry is missing.
+    """
+    headers = cache.conditional_headers(url) if cache else None
+    async with client.get(url, ssl=None if ssl_verify else False, headers=headers) as resp:
+        outcome.error = resp.status == 429 or resp.status >= 500
+        if cache and resp.status == HTTPStatus.NOT_MODIFIED:
+            body = cache.not_modified_body(url)
+            return None if body is None else (body, None)
+        # Checked like aiohttp does when decoding JSON, so that overloaded
+        # looking glasses that return HTML are retried by the client
+        if not JSON_CONTENT_TYPE_RE.match(resp.content_type):
+            raise aiohttp.ContentTypeError(
+                resp.request_info,
+                resp.history,
+                status=resp.status,
+                message=f"Attempt to decode JSON with unexpected mimetype: {resp.content_type}",
+                headers=resp.headers,
+            )
+        body = await resp.read()
+        outcome.size = len(body)
+        if cache and resp.status == HTTPStatus.OK:
+            return body, resp.headers
+        return body, None
+
+
+def create_client(connection_limit: int) -> RetryClient:
+    """
+    Create a client for looking glass requests, with at most connection_limit
+    connections per host. Responses with an unexpected content type, which
+    some looking glasses return when overloaded, are retried.
+    """
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=connection_limit)
+    options = ExponentialRetry(
+        attempts=5, start_timeout=2, exceptions=[aiohttp.client_exceptions.ContentTypeError]
+    )
+    timeout = aiohttp.ClientTimeout(total=60000)
+    return RetryClient(
+        retry_options=options, connector=connector, raise_for_status=False, timeout=timeout
+    )
+
+
+@contextlib.asynccontextmanager
+async def client_or_new(
+    client: Optional[aiohttp.ClientSession], create: Callable[[], Any]
+) -> AsyncIterator[aiohttp.ClientSession]:
+    """
+    Use client if given, so that it can be shared between looking glasses,
+    or otherwise a new client from create(), which is closed on exit.
+    """
+    if client is not None:
+        yield client
+        return
+    async with create() as new_client:
+        yield new_client
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    Decode JSON text or UTF-8 encoded JSON, with orjson if it is installed,
+    as it is several times faster than the standard library.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json_module.loads(data)
+
+
+async def aio_stream_json(
+    client: aiohttp.ClientSession,
+    url: str,
+    key: List[str],
+    ssl_verify: bool = True,
+    limiter: Optional[AdaptiveLimiter] = None,
+    other: Optional[Dict[str, Any]] = None,
+    cache: Optional[HTTPCache] = None,
+    deadlines: Optional[RequestDeadlines] = None,
+) -> AsyncIterator[List[Any]]:
+    """
+    Do an async HTTP request for a JSON object with a (large) array under
+    one of the keys in key, decoding the array incrementally while the
+    response is received. Yields lists of the array items decoded from
+    each received chunk, so that only one chunk is buffered at a time.
+    Values of the other top level keys are stored in other, if given,
+    once the response is complete. Cached responses are used like in
+    aio_get_json, and new responses are written to the cache while
+    they are received. If deadlines is given, RequestTimeout is raised
+    when no data is received for the duration of the deadline, after the
+    items received so far were yielded. This is not a deadline for the
+    complete response, as reading pauses while the items are waiting to be
+    processed. For the same reason, the time the items are waiting is not
+    counted in the recorded latency. Streamed requests are not hedged, as
+    their items may have been processed already.
+    """
+    parser = JSONArrayParser(key)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    body = cache.fresh_body(url) if cache else None
+    if body is None:
+        headers = cache.conditional_headers(url) if cache else None
+        request_options: Dict[str, Any] = {}
+        if deadlines:
+            deadline = deadlines.deadline()
+            request_options["timeout"] = aiohttp.ClientTimeout(sock_read=deadline)
+        loop = asyncio.get_event_loop()
+        async with _request_slot(limiter, url) as outcome:
+            start = loop.time()
+            try:
+                async with client.get(
+                    url, ssl=None if ssl_verify else False, headers=headers, **request_options
+                ) as resp:
+                    outcome.error = resp.status == 429 or resp.status >= 500
+                    if cache and resp.status == HTTPStatus.NOT_MODIFIED:
+                        body = cache.not_modified_body(url)
+                    else:
+                        writer = None
+                        if cache and resp.status == HTTPStatus.OK:
+                            writer = cache.writer(url, resp.headers)
+                        try:
+                            async for chunk in resp.content.iter_chunked(READ_CHUNK_SIZE):
+                                outcome.size += len(chunk)
+                                if writer:
+                                    writer.write(chunk)
+                                items = parser.feed(decoder.decode(chunk))
+                                if items:
+                                    # Waiting for the consumer is not latency
+                                    paused = loop.time()
+                                    yield items
+                                    outcome.paused += loop.time() - paused
+                            _close_parser(parser, decoder)
+                        except BaseException:
+                            if writer:
+                                writer.discard()
+                            raise
+                        if writer:
+                            writer.commit(parser.other)
+            except asyncio.TimeoutError as exc:
+                if not deadlines:
+                    raise
+                deadlines.timed_out.append(url)
+                raise RequestTimeout(url, deadline) from exc
+            if deadlines:
+                deadlines.record(loop.time() - start - outcome.paused)
+        if cache and body is None and resp.status == HTTPStatus.NOT_MODIFIED:
+            # The cache entry was removed in the meantime
+            async for items in aio_stream_json(
+                client, url, key, ssl_verify, limiter, other, deadlines=deadlines
+            ):
+                yield items
+            return
+
+    if body is not None:
+        for start in range(0, len(body), READ_CHUNK_SIZE):
+            end = start + READ_CHUNK_SIZE
+            items = parser.feed(decoder.decode(body[start:end]))
+            if items:
+                yield items
+        _close_parser(parser, decoder)
+    if other is not None:
+        other.update(parser.other)
+
+
+def _close_parser(parser: JSONArrayParser, decoder: codecs.IncrementalDecoder) -> None:
+    # Raises ValueError for incomplete data. As the array is closed
+    # before the end of the object, all its items were yielded already.
+    decoder.decode(b"", final=True)
+    parser.close()
+
+
+async def _offload(offload: bool, function: Callable[..., T], *args: Any) -> T:
     """
-    async with client.get(url, ssl=None if ssl_verify else False) as resp:
-        json = await resp.json()
+    Call function in the default executor of the event loop if offload is set,
+    or directly otherwise, which avoids the overhead for small amounts of work.
+    This is only useful for functions that mostly wait for I/O, like writing
+    files, as other functions hold the GIL.
+    """
+    if not offload:
+        return function(*args)
+    return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+
+def _get_decode_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _decode_executor
+    if _decode_executor is None:
+        # Spawned rather than forked, as the event loop and other threads are running
+        _decode_executor = concurrent.futures.ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _decode_executor
+
+
+def _request_slot(limiter: Optional[AdaptiveLimiter], url: str):
+    if limiter is None:
+        return _unlimited()
+    return limiter.request(url)
+
 
-        return get_data_from_json(json, key), metadata
+@contextlib.asynccontextmanager
+async def _unlimited() -> AsyncIterator[RequestOutcome]:
+    yield RequestOutcome()
 
 
 def get_data_from_json(json: Dict[str, Any], key: Optional[List[str]] = None):
@@ -33,35 +447,262 @@ def get_data_from_json(json: Dict[str, Any], key: Optional[List[str]] = None):
     return None
 
 
-async def route_tasks_to_route_entries(tasks, source_name: str):
+async def route_tasks_to_route_entries(
+    tasks,
+    source_name: str,
+    next_tasks: Optional[Callable[[Any], Iterable[Awaitable[Any]]]] = None,
+    max_buffered: int = DEFAULT_MAX_BUFFERED_RESPONSES,
+    workers: int = DEFAULT_FETCH_WORKERS,
+    timings: Optional[PeerTimings] = None,
+):
     """
-    Given a set of futures, which request route entries from an Alice or Bird's Eye LG,
-    execute the features, parse their output, and yield RouteEntry instances.
+    Given a set of awaitables, which request route entries from an Alice or Bird's Eye LG,
+    execute them, parse their output, and yield RouteEntry instances.
 
     Alice and Bird's Eye route query outputs are almost identical, allowing this
     same code to be used for handling either.
+
+    The requests are executed by a fixed number of workers. A worker only
+    starts a request when fewer than max_buffered responses are being
+    received or waiting to be processed. When the consumer is slower than
+    the downloads, the workers pause, so at most max_buffered responses are
+    held in memory. Requests should be coroutines, so that they only start
+    when a worker picks them up. Requests are started in the given order.
+
+    If next_tasks is given, it is called with the metadata of each completed
+    request, and may return further requests, e.g. for the next pages of a
+    paginated response. These take the place of the completed request in the
+    order, i.e. they are started before the requests that followed it.
+
+    If timings is given, the time and number of routes of each request
+    are recorded per peer. Requests that raise RequestTimeout are left
+    out, as these are reported by RequestDeadlines. Any other exception
+    is raised.
     """
-    for result in asyncio.as_completed(tasks):
-        imported_routes, metadata = await result
-        for imported_route in imported_routes:
-            communities = imported_route["bgp"].get("communities", []) + imported_route["bgp"].get(
-                "large_communities", []
-            )
-            communities_set = {
-                ":".join([str(segment) for segment in community]) for community in communities
-            }
-            source = source_name.strip()
-            if "route_server" in metadata:
-                source += " route server " + metadata["route_server"]
-            if "peer_name" in metadata:
-                source += " peer " + metadata["peer_name"]
-            route_entry = RouteEntry(
-                origin=int(imported_route["bgp"]["as_path"][-1]),
-                aspath=" ".join([str(asn) for asn in imported_route["bgp"]["as_path"]]),
-                prefix=imported_route["network"],
+    # Requests are ordered by priority, and then by when they were queued
+    requests: "asyncio.PriorityQueue[Tuple[int, int, Awaitable[Any]]]" = asyncio.PriorityQueue()
+    sequence = itertools.count()
+    for priority, task in enumerate(tasks):
+        requests.put_nowait((priority, next(sequence), task))
+    responses: "asyncio.Queue[Tuple[bool, Any]]" = asyncio.Queue()
+    buffer_slots = asyncio.Semaphore(max_buffered)
+    remaining = requests.qsize()
+
+    async def fetch() -> None:
+        nonlocal remaining
+        while True:
+            priority, _, request = await requests.get()
+            await buffer_slots.acquire()
+            start = time.monotonic()
+            try:
+                response = await request
+            except RequestTimeout:
+                responses.put_nowait((False, None))
+                continue
+            except Exception as exc:
+                responses.put_nowait((True, exc))
+                continue
+            if timings is not None:
+                source = route_source(source_name, response[1])
+                timings.record(source, start, len(response[0]))
+            if next_tasks:
+                for next_task in next_tasks(response[1]):
+                    remaining += 1
+                    requests.put_nowait((priority, next(sequence), next_task))
+            responses.put_nowait((False, response))
+
+    fetchers = [asyncio.ensure_future(fetch()) for _ in range(min(workers, remaining))]
+    try:
+        while remaining:
+            error, value = await responses.get()
+            remaining -= 1
+            if error:
+                raise value
+            if value is None:
+                buffer_slots.release()
+                continue
+            routes, metadata = value
+            for route_entry in routes.route_entries(metadata, source_name):
+                yield route_entry
+            buffer_slots.release()
+    finally:
+        for fetcher in fetchers:
+            fetcher.cancel()
+        await asyncio.gather(*fetchers, return_exceptions=True)
+        # Close requests that never started, to avoid warnings on unawaited coroutines
+        while not requests.empty():
+            _, _, request = requests.get_nowait()
+            if asyncio.iscoroutine(request):
+                request.close()
+
+
+async def route_streams_to_route_entries(
+    streams: Sequence[AsyncIterator[Any]],
+    source_name: str,
+    next_streams: Optional[Callable[[Any], Iterable[AsyncIterator[Any]]]] = None,
+    max_buffered: int = DEFAULT_MAX_BUFFERED_RESPONSES,
+    timings: Optional[PeerTimings] = None,
+):
+    """
+    Like route_tasks_to_route_entries, but for streamed requests, which are
+    async iterators that yield parts of the routes of a peer while they are
+    received, as tuples of routes and request metadata. Streams are consumed
+    concurrently, and pause while max_buffered parts are waiting to be
+    processed. Streams are started in the given order, so that they wait for
+    a request slot in that order. next_streams is called with the metadata of
+    each part, like next_tasks, and timings is recorded for each part.
+    A stream that raises RequestTimeout ends, and the routes received
+    until then are kept.
+    """
+
+    def prepare(stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        stream = _until_timeout(stream)
+        return _timed_stream(stream, source_name, timings) if timings is not None else stream
+
+    def next_iterators(batch: Tuple[Any, Any]) -> Iterable[AsyncIterator[Any]]:
+        return [prepare(stream) for stream in next_streams(batch[1])] if next_streams else []
+
+    batches = merge_async_iterators(
+        [prepare(stream) for stream in streams], max_buffered, next_iterators
+    )
+    # Streamed parts are small, so these are converted in the event loop
+    async for imported_routes, metadata in batches:
+        for route_entry in routes_to_route_entries(imported_routes, metadata, source_name):
+            yield route_entry
+
+
+async def _until_timeout(stream: AsyncIterator[T]) -> AsyncIterator[T]:
+    try:
+        async for item in stream:
+            yield item
+    except RequestTimeout:
+        # Reported by RequestDeadlines
+        return
+
+
+async def _timed_stream(
+    stream: AsyncIterator[Tuple[List[Any], Dict[str, Any]]], source_name: str, timings: PeerTimings
+) -> AsyncIterator[Tuple[List[Any], Dict[str, Any]]]:
+    start = time.monotonic()
+    requests = 1
+    async for routes, metadata in stream:
+        timings.record(route_source(source_name, metadata), start, len(routes), requests)
+        # Further parts are of the same request
+        requests = 0
+        yield routes, metadata
+
+
+def routes_to_route_entries(
+    imported_routes: List[Dict[str, Any]], metadata: Dict[str, Any], source_name: str
+) -> List[RouteEntry]:
+    """
+    Parse the routes from one Alice or Bird's Eye LG response into RouteEntry
+    instances. Metadata contains the peer the routes were received from.
+    """
+    source = route_source(source_name, metadata)
+    route_entries = []
+    for imported_route in imported_routes:
+        origin, aspath, prefix, communities = _route_fields(imported_route)
+        route_entries.append(
+            RouteEntry(
+                origin=origin,
+                aspath=aspath,
+                prefix=prefix,
                 peer_ip=metadata["peer_ip"],
                 peer_as=metadata["peer_as"],
-                communities=communities_set,
+                communities=communities,
                 source=source,
             )
-            yield route_entry
+        )
+    return route_entries
+
+
+def _route_fields(imported_route: Dict[str, Any]) -> Tuple[int, str, str, FrozenSet[str]]:
+    """
+    Determine the origin, AS path, prefix and communities of a route
+    in an Alice or Bird's Eye LG response.
+    """
+    bgp = imported_route["bgp"]
+    communities = bgp.get("communities", []) + bgp.get("large_communities", [])
+    return (
+        int(bgp["as_path"][-1]),
+        sys.intern(" ".join([str(asn) for asn in bgp["as_path"]])),
+        imported_route["network"],
+        intern_communities(
+            ":".join([str(segment) for segment in community]) for community in communities
+        ),
+    )
+
+
+def route_source(source_name: str, metadata: Dict[str, Any]) -> str:
+    """
+    Determine the source of the routes in a response, with the route server
+    and peer from the request metadata.
+    """
+    source = source_name.strip()
+    if "route_server" in metadata:
+        source += " route server " + metadata["route_server"]
+    if "peer_name" in metadata:
+        source += " peer " + metadata["peer_name"]
+    # Shared by all routes of a peer, across responses
+    return sys.intern(source)
+
+
+async def aiter_chunks(iterator: AsyncIterator[T], size: int) -> AsyncIterator[List[T]]:
+    """
+    Buffer the items from an async iterator into lists of up to size items.
+    """
+    chunk: List[T] = []
+    async for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def merge_async_iterators(
+    iterators: Sequence[AsyncIterator[T]],
+    maxsize: int,
+    next_iterators: Optional[Callable[[T], Iterable[AsyncIterator[T]]]] = None,
+) -> AsyncIterator[T]:
+    """
+    Consume several async iterators concurrently, yielding their items in
+    the order they are produced. At most maxsize items are buffered, which
+    makes fast producers wait for the consumer. If any iterator raises an
+    exception, the others are cancelled and the exception is raised.
+
+    If next_iterators is given, it is called with each item, and may return
+    further iterators, which are consumed concurrently as well.
+    """
+    queue: "asyncio.Queue[Tuple[bool, Any]]" = asyncio.Queue(maxsize)
+
+    async def produce(iterator: AsyncIterator[T]) -> None:
+        try:
+            async for item in iterator:
+                await queue.put((False, item))
+        except Exception as exc:
+            await queue.put((True, exc))
+        else:
+            await queue.put((True, None))
+
+    tasks = [asyncio.ensure_future(produce(iterator)) for iterator in iterators]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            done, value = await queue.get()
+            if not done:
+                if next_iterators:
+                    for iterator in next_iterators(value):
+                        tasks.append(asyncio.ensure_future(produce(iterator)))
+                        remaining += 1
+                yield value
+                continue
+            if value is not None:
+                raise value
+            remaining -= 1
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
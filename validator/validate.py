@@ -1,59 +1,223 @@
 import dataclasses
-from typing import Dict, List, Optional, Set, Union
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 
-import radix
+from .roaindex import ROAStore
+from .status import RIBEntry, RouteEntry, RPKIStatus
 
-from .status import RouteEntry, RPKIStatus
+DEFAULT_VALIDATION_CACHE_SIZE = 100000
+# Number of routes buffered for each validate_many() call
+VALIDATION_CHUNK_SIZE = 1000
+# Number of RIB entries buffered for each validate_rib_entries() call.
+# Each RIB entry typically has many routes.
+RIB_ENTRY_CHUNK_SIZE = 100
+
+ValidationResult = Dict[
+    str,
+    Union[RPKIStatus, Dict[str, Union[str, int]], List[Dict[str, Union[str, int]]]],
+]
+
+
+class ValidationCache:
+    """
+    Bounded LRU cache of validation outcomes, keyed by (prefix, origin).
+    The same prefix and origin are typically seen from many peers and
+    route servers, and always have the same RPKI status. Cached values
+    are the RPKI status before applying expected invalid communities,
+    and the covering ROA nodes.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_VALIDATION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], Tuple[RPKIStatus, List[Any]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, key: Tuple[str, Optional[int]]) -> Optional[Tuple[RPKIStatus, List[Any]]]:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Tuple[str, Optional[int]], value: Tuple[RPKIStatus, List[Any]]) -> None:
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats_str(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups * 100 if lookups else 0
+        return (
+            f"Validation cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.1f}% hit rate), {len(self)} entries"
+        )
 
 
 def validate(
     route: RouteEntry,
-    roa_tree: radix.Radix,
+    roa_tree: ROAStore,
     communities_expected_invalid: Set[str],
     verbose=False,
-) -> Optional[
-    Dict[
-        str,
-        Union[RPKIStatus, Dict[str, Union[str, int]], List[Dict[str, Union[str, int]]]],
-    ]
-]:
-    """
-    Validate a provided RouteEntry, using the roa's in a radix tree.
+    cache: Optional[ValidationCache] = None,
+) -> Optional[ValidationResult]:
+    """
+    Validate a provided RouteEntry, using the roa's in a radix tree or ROAIndex.
     If the route is invalid, or verbose is set, returns a dictionary
     with the details of the status, route, and all relevant ROAs.
     Returns None otherwise.
+    If a ValidationCache is provided, it is used for the ROA lookup
+    and origin validation, but communities are checked for every route.
     """
-    status = RPKIStatus.invalid
+    return _validate_prefix(
+        route.prefix, [route], roa_tree, communities_expected_invalid, verbose, cache
+    )[0]
 
-    rnodes = roa_tree.search_covering(route.prefix)
-    if not rnodes:
-        status = RPKIStatus.not_found
 
+def validate_many(
+    routes: Sequence[RouteEntry],
+    roa_tree: ROAStore,
+    communities_expected_invalid: Set[str],
+    verbose=False,
+    cache: Optional[ValidationCache] = None,
+) -> List[Optional[ValidationResult]]:
+    """
+    Validate a batch of RouteEntry's, with the same logic as validate().
+    Routes are grouped by prefix, so that the covering ROAs are looked up
+    only once per unique prefix, and the origin validation once per
+    unique origin of that prefix.
+    Returns a list with a result or None for each route, in the same order.
+    """
+    routes_by_prefix: Dict[str, List[int]] = {}
+    for index, route in enumerate(routes):
+        routes_by_prefix.setdefault(route.prefix, []).append(index)
+
+    results: List[Optional[ValidationResult]] = [None] * len(routes)
+    for prefix, indexes in routes_by_prefix.items():
+        prefix_results = _validate_prefix(
+            prefix,
+            [routes[index] for index in indexes],
+            roa_tree,
+            communities_expected_invalid,
+            verbose,
+            cache,
+        )
+        for index, result in zip(indexes, prefix_results):
+            results[index] = result
+    return results
+
+
+def validate_rib_entries(
+    rib_entries: Sequence[RIBEntry],
+    roa_tree: ROAStore,
+    communities_expected_invalid: Set[str],
+    verbose=False,
+    cache: Optional[ValidationCache] = None,
+) -> List[Optional[ValidationResult]]:
+    """
+    Validate a batch of RIBEntry's, with the same logic as validate().
+    As all routes in a RIB entry have the same prefix, the covering ROAs
+    are looked up once per RIB entry, without grouping routes first.
+    Returns a list with a result or None for each route, in the order
+    of the routes within the RIB entries.
+    """
+    results: List[Optional[ValidationResult]] = []
+    for rib_entry in rib_entries:
+        results += _validate_prefix(
+            rib_entry.prefix,
+            rib_entry.routes,
+            roa_tree,
+            communities_expected_invalid,
+            verbose,
+            cache,
+        )
+    return results
+
+
+def _validate_prefix(
+    prefix: str,
+    routes: Sequence[RouteEntry],
+    roa_tree: ROAStore,
+    communities_expected_invalid: Set[str],
+    verbose: bool,
+    cache: Optional[ValidationCache],
+) -> List[Optional[ValidationResult]]:
+    """
+    Validate routes which all have the same prefix. The covering ROAs
+    are looked up at most once, and the status determined once per origin.
+    """
+    prefix_length = int(prefix.split("/")[1])
+    rnodes: Optional[List[Any]] = None
+    origin_statuses: Dict[Optional[int], RPKIStatus] = {}
+    roa_dicts: Optional[List[Dict[str, Union[str, int]]]] = None
+    results: List[Optional[ValidationResult]] = []
+
+    for route in routes:
+        status = origin_statuses.get(route.origin)
+        if status is None:
+            key = (prefix, route.origin)
+            cached = cache.get(key) if cache is not None else None
+            if cached is None:
+                if rnodes is None:
+                    rnodes = roa_tree.search_covering(prefix)
+                status = _origin_status(rnodes, prefix_length, route.origin)
+                if cache is not None:
+                    cache.put(key, (status, rnodes))
+            else:
+                status, rnodes = cached
+            origin_statuses[route.origin] = status
+
+        if status == RPKIStatus.invalid and route.communities.intersection(
+            communities_expected_invalid
+        ):
+            status = RPKIStatus.invalid_expected
+
+        if status == RPKIStatus.invalid or verbose:
+            if roa_dicts is None:
+                roa_dicts = _roa_dicts(rnodes or [])
+            results.append(
+                {
+                    "status": status,
+                    "route": dataclasses.asdict(route),
+                    "roas": roa_dicts,
+                }
+            )
+        else:
+            results.append(None)
+    return results
+
+
+def _roa_dicts(rnodes: List[Any]) -> List[Dict[str, Union[str, int]]]:
+    roa_dicts: List[Dict[str, Union[str, int]]] = []
     for rnode in rnodes:
         for roa in rnode.data["roas"]:
-            prefix_length = int(route.prefix.split("/")[1])
-            if route.origin and route.origin == roa["asn"] and prefix_length <= roa["max_length"]:
-                status = RPKIStatus.valid
+            roa_dicts.append(
+                {
+                    "prefix": rnode.prefix,
+                    "asn": roa["asn"],
+                    "max_length": roa["max_length"],
+                }
+            )
+    return roa_dicts
 
-    if status == RPKIStatus.invalid and route.communities.intersection(
-        communities_expected_invalid
-    ):
-        status = RPKIStatus.invalid_expected
 
-    if status == RPKIStatus.invalid or verbose:
-        roa_dicts = []
+def _origin_status(rnodes: List[Any], prefix_length: int, origin: Optional[int]) -> RPKIStatus:
+    """
+    Determine the RPKI status of an origin for a prefix of prefix_length,
+    given the covering ROA nodes, without considering any communities.
+    """
+    if not rnodes:
+        return RPKIStatus.not_found
+    if origin:
         for rnode in rnodes:
             for roa in rnode.data["roas"]:
-                roa_dicts.append(
-                    {
-                        "prefix": rnode.prefix,
-                        "asn": roa["asn"],
-                        "max_length": roa["max_length"],
-                    }
-                )
-        return {
-            "status": status,
-            "route": dataclasses.asdict(route),
-            "roas": roa_dicts,
-        }
-    return None
+                if origin == roa["asn"] and prefix_length <= roa["max_length"]:
+                    return RPKIStatus.valid
+    return RPKIStatus.invalid